@@ -0,0 +1,2 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
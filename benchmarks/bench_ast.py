@@ -0,0 +1,84 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Benchmark of the memory used by syntax trees of a large set of archetypes,
+as held by the runtime once the archetypes have been included.
+'''
+import gc
+import time
+import logging
+import tracemalloc
+
+import rsl.ast
+import rsl.parse
+
+
+TEMPLATE = '''
+.function gen_class_%(index)d
+  .param inst_ref o_obj
+  .select many attrs related by o_obj->O_ATTR[R102] where (selected.Name != "")
+  .for each attr in attrs
+    .if (attr.Descrip == "")
+      ${attr.Name} : ${attr.Root_Nam};
+    .elif (attr.Prefix == "pre")
+      ${attr.Prefix}${attr.Name} : integer;
+    .else
+      -- ${attr.Descrip}
+    .end if
+  .end for
+  .assign attr_count = cardinality attrs
+  .assign attr_name = "class_%(index)d" + "_" + o_obj.Name
+  .invoke res = format_name(attr_name, attr_count * 2 + 1)
+class ${o_obj.Name:u} is
+  -- ${res.value}
+end class;
+.end function
+'''
+
+
+def generate_archetype(index, num_functions):
+    return ''.join([TEMPLATE % dict(index=index * num_functions + i)
+                    for i in range(num_functions)])
+
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(child for child in node.children
+                     if isinstance(child, rsl.ast.Node))
+
+    return count
+
+
+def main(scale=1):
+    num_files = 20 * scale
+    num_functions = 50
+    texts = [(generate_archetype(index, num_functions), 'arc%d.arc' % index)
+             for index in range(num_files)]
+
+    # build the parse tables once, they are not part of the measurement
+    rsl.parse.parse_text('.exit 0\n')
+    gc.collect()
+
+    tracemalloc.start()
+    t = time.time()
+    roots = [rsl.parse.parse_text(text, filename)
+             for text, filename in texts]
+    elapsed = time.time() - t
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_nodes = sum(count_nodes(root) for root in roots)
+    print('%d files, %d nodes' % (num_files, num_nodes))
+    print('%-10s %8.1f MiB' % ('memory', size / 1024.0 / 1024.0))
+    print('%-10s %8.1f B/node' % ('per node', float(size) / num_nodes))
+    print('%-10s %8.3f s' % ('parse', elapsed))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
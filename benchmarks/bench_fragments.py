@@ -0,0 +1,84 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Benchmark of deeply nested fragment invocations, where each function splices
+the body of the function it invokes into its own body. Compares the chunked
+output buffer used by the runtime with a StringIO based buffer, measuring
+time and (on python 3) peak memory usage.
+'''
+import io
+import time
+import logging
+
+import xtuml
+import rsl
+import rsl.runtime
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_archetype(depth, width):
+    lines = ['.function level0',
+             '.assign i = 0',
+             '.while (i < %d)' % width,
+             'A line of generated text number ${i}, at the bottom of the tree',
+             '.assign i = i + 1',
+             '.end while',
+             '.end function']
+    
+    for level in range(1, depth):
+        lines.append('.function level%d' % level)
+        lines.append('.invoke child = level%d()' % (level - 1))
+        lines.append('/* level %d begin */' % level)
+        lines.append('${child.body}')
+        lines.append('/* level %d end */' % level)
+        lines.append('.end function')
+    
+    lines.append('.invoke root = level%d()' % (depth - 1))
+    lines.append('${root.body}')
+    lines.append('.clear')
+    return '\n'.join(lines) + '\n'
+
+
+class StringIOBuffer(io.StringIO):
+    
+    def write(self, s):
+        io.StringIO.write(self, u'%s' % s)
+        
+
+def run(ast, buffer_class):
+    original = rsl.runtime.OutputBuffer
+    rsl.runtime.OutputBuffer = buffer_class
+    try:
+        rt = rsl.Runtime(xtuml.MetaModel())
+        if tracemalloc:
+            tracemalloc.start()
+            
+        t = time.time()
+        rsl.evaluate(rt, ast, [])
+        t = time.time() - t
+        
+        peak = 0
+        if tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            
+        return t, peak
+    finally:
+        rsl.runtime.OutputBuffer = original
+
+
+def main(scale=1):
+    ast = rsl.parse_text(make_archetype(80, 20000 * scale))
+    for name, buffer_class in [('stringio', StringIOBuffer),
+                               ('chunks', rsl.runtime.OutputBuffer)]:
+        t, peak = run(ast, buffer_class)
+        print('%-10s %8.3f s %10.1f MiB peak' % (name, t, peak / 1024.0 ** 2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,179 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+End-to-end benchmark of a model-to-text translation. A synthetic xtUML
+population of configurable size is generated, and translated by an archetype
+that exercises selects, navigations, fragment invocations, string formatting
+and emit. The time spent in each phase, i.e. model load, parse, evaluate,
+emit and persist, is reported together with peak memory usage.
+'''
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+import xtuml
+import rsl
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+SCHEMA = '''
+CREATE TABLE S_SYS (Sys_ID UNIQUE_ID, Name STRING);
+CREATE TABLE O_OBJ (Obj_ID UNIQUE_ID, Sys_ID UNIQUE_ID, Name STRING,
+                    Key_Lett STRING, Descrip STRING);
+CREATE TABLE O_ATTR (Attr_ID UNIQUE_ID, Obj_ID UNIQUE_ID, Name STRING,
+                     Type STRING, Descrip STRING);
+CREATE ROP REF_ID R1 FROM MC O_OBJ (Sys_ID) TO 1 S_SYS (Sys_ID);
+CREATE ROP REF_ID R102 FROM MC O_ATTR (Obj_ID) TO 1 O_OBJ (Obj_ID);
+'''
+
+
+ARCHETYPE = '''
+.function type_name
+  .param string ty
+  .assign attr_result = "const char*"
+  .if (ty == "integer")
+    .assign attr_result = "int"
+  .elif (ty == "real")
+    .assign attr_result = "double"
+  .end if
+.end function
+.//
+.function gen_attribute
+  .param inst_ref o_attr
+  .invoke t = type_name(o_attr.Type)
+    ${t.result} ${o_attr.Name}; /* $r{o_attr.Descrip} */
+.end function
+.//
+.function gen_class
+  .param inst_ref o_obj
+  .select many o_attr_set related by o_obj->O_ATTR[R102]
+typedef struct ${o_obj.Key_Lett}_s {
+  .for each o_attr in o_attr_set
+    .invoke attr = gen_attribute(o_attr)
+${attr.body}\\
+  .end for
+} $u{o_obj.Name}_t; /* $cr{o_obj.Name} */
+.end function
+.//
+.select any s_sys from instances of S_SYS
+.select many o_obj_set related by s_sys->O_OBJ[R1]
+.for each o_obj in o_obj_set
+  .select any same from instances of O_OBJ where (selected.Obj_ID == o_obj.Obj_ID)
+  .select one s_sys related by same->S_SYS[R1]
+  .invoke cls = gen_class(same)
+/* generated by ${s_sys.Name} */
+${cls.body}
+  .emit to file "${outdir}/${o_obj.Key_Lett}.h"
+.end for
+'''
+
+
+TYPES = ['integer', 'real', 'string']
+
+
+def generate_population(num_classes, num_attributes):
+    '''
+    Generate sql statements that populate a system with *num_classes*
+    classes, each with *num_attributes* attributes.
+    '''
+    lines = ["INSERT INTO S_SYS VALUES (1, 'bench');"]
+    attr_id = 1
+    for obj_id in range(1, num_classes + 1):
+        lines.append("INSERT INTO O_OBJ VALUES (%d, 1, 'class %d', 'C%d', "
+                     "'A generated class');" % (obj_id, obj_id, obj_id))
+        for i in range(num_attributes):
+            lines.append("INSERT INTO O_ATTR VALUES (%d, %d, 'attr%d', '%s', "
+                         "'A generated attribute');" % (attr_id, obj_id, i,
+                                                         TYPES[i % 3]))
+            attr_id += 1
+
+    return '\n'.join(lines)
+
+
+class TimedRuntime(rsl.Runtime):
+    '''
+    Runtime that keeps track of the time spent emitting files, and keeps
+    quiet about files being created.
+    '''
+    emit_time = 0.0
+
+    def invoke_print(self, value, prefix='INFO', location=None):
+        if prefix != 'INFO':
+            rsl.Runtime.invoke_print(self, value, prefix, location)
+
+    def emit_buffer(self, filename):
+        t = time.time()
+        try:
+            return rsl.Runtime.emit_buffer(self, filename)
+        finally:
+            self.emit_time += time.time() - t
+
+
+def run(num_classes, num_attributes, outdir):
+    timings = list()
+    data = generate_population(num_classes, num_attributes)
+
+    t = time.time()
+    loader = xtuml.ModelLoader()
+    loader.input(SCHEMA, 'schema.sql')
+    loader.input(data, 'population.sql')
+    metamodel = loader.build_metamodel()
+    timings.append(('load', time.time() - t))
+
+    # build the parse tables once, they are not part of the measurement
+    rsl.parse_text('')
+    t = time.time()
+    text = '.assign outdir = "%s"\n' % outdir.replace(os.sep, '/')
+    ast = rsl.parse_text(text + ARCHETYPE, 'bench.arc')
+    timings.append(('parse', time.time() - t))
+
+    rt = TimedRuntime(metamodel, emit='change')
+    t = time.time()
+    rsl.evaluate(rt, ast, [])
+    t = time.time() - t
+    timings.append(('evaluate', t - rt.emit_time))
+    timings.append(('emit', rt.emit_time))
+
+    t = time.time()
+    xtuml.persist_database(metamodel, os.path.join(outdir, 'bench.sql'))
+    timings.append(('persist', time.time() - t))
+
+    return timings
+
+
+def main(scale=1):
+    num_classes = 100 * scale
+    num_attributes = 10
+    outdir = tempfile.mkdtemp()
+    try:
+        if tracemalloc:
+            tracemalloc.start()
+
+        timings = run(num_classes, num_attributes, outdir)
+
+        peak = 0
+        if tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(outdir)
+
+    print('%d classes, %d attributes' % (num_classes,
+                                         num_classes * num_attributes))
+    for name, t in timings:
+        print('%-10s %8.3f s' % (name, t))
+
+    print('%-10s %8.3f s' % ('total', sum(t for _, t in timings)))
+    if tracemalloc:
+        print('%-10s %8.1f MiB' % ('peak', peak / 1024.0 ** 2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
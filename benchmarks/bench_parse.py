@@ -0,0 +1,48 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Micro-benchmark of the per-file overhead of parsing small archetypes, e.g.
+files that are pulled in by .include. Compares construction of a new
+RSLParser for each input with the parser pool used by rsl.parse_text.
+'''
+import timeit
+import logging
+
+import rsl.parse
+
+
+TEXT = '''
+.function f
+  .param integer x
+  .assign attr_value = x * 2
+.end function
+.invoke res = f(2)
+Result: ${res.value}
+'''
+
+
+def parse_fresh():
+    rsl.parse.RSLParser().text_input(TEXT, 'bench.arc')
+    
+
+def parse_pooled():
+    rsl.parse.parse_text(TEXT, 'bench.arc')
+    
+
+def main(scale=1):
+    number = 200 * scale
+    # build the parse tables once, they are not part of the measurement
+    rsl.parse.parse_text(TEXT)
+    
+    results = list()
+    for fn in [parse_fresh, parse_pooled]:
+        t = min(timeit.repeat(fn, number=number, repeat=3))
+        results.append(t)
+        print('%-14s %8.3f ms/file' % (fn.__name__, 1000 * t / number))
+        
+    print('%-14s %8.1fx' % ('speedup', results[0] / results[1]))
+    
+    
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,64 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Benchmark of accumulating instances into a set in a loop, i.e. by assigning
+a_set = a_set | a once per instance. Compares the union of instance sets
+provided by the runtime with the generic union of query sets, which copies
+the accumulated set on each iteration. The generic union is only measured on
+smaller populations, since it is quadratic in the number of instances.
+'''
+import time
+import logging
+
+import xtuml
+import rsl
+import rsl.eval
+
+
+ARCHETYPE = '''
+.select many all_set from instances of A
+.select many a_set from instances of A where (false)
+.for each a in all_set
+  .assign a_set = a_set | a
+.end for
+.assign count = cardinality a_set
+.exit count
+'''
+
+
+def run(ast, count, union):
+    original = rsl.eval.SET_OPERATORS['|']
+    rsl.eval.SET_OPERATORS['|'] = union
+    try:
+        metamodel = xtuml.MetaModel(xtuml.IntegerGenerator())
+        metamodel.define_class('A', [('Name', 'string')])
+        for _ in range(count):
+            metamodel.new('A')
+
+        rt = rsl.Runtime(metamodel)
+        t = time.time()
+        try:
+            rsl.evaluate(rt, ast, [])
+        except SystemExit as e:
+            assert e.code == count
+        
+        return time.time() - t
+    finally:
+        rsl.eval.SET_OPERATORS['|'] = original
+
+
+def main(scale=1):
+    ast = rsl.parse_text(ARCHETYPE)
+    for count in [1000, 3000, 10000, 100000 * scale]:
+        for name, union in [('generic', lambda lhs, rhs: lhs | rhs),
+                            ('instances', rsl.eval.SET_OPERATORS['|'])]:
+            if name == 'generic' and count > 3000:
+                continue
+            
+            t = run(ast, count, union)
+            print('%-10s %8d instances %8.3f s' % (name, count, t))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
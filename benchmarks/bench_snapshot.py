@@ -0,0 +1,68 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Benchmark of loading a model from a database, comparing the SQL format
+written by default with the binary snapshot format written by -dumpsnapshot.
+'''
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+import xtuml
+import rsl.snapshot
+
+from benchmarks.bench_model import SCHEMA, generate_population
+
+
+def load_sql(filename):
+    loader = xtuml.ModelLoader()
+    loader.filename_input(filename)
+    metamodel = xtuml.MetaModel(xtuml.IntegerGenerator())
+    loader.populate(metamodel)
+    return metamodel
+
+
+def load_snapshot(filename):
+    metamodel = xtuml.MetaModel(xtuml.IntegerGenerator())
+    rsl.snapshot.load(metamodel, filename)
+    return metamodel
+
+
+def main(scale=1):
+    num_classes = 500 * scale
+    num_attributes = 10
+    outdir = tempfile.mkdtemp()
+    try:
+        loader = xtuml.ModelLoader()
+        loader.input(SCHEMA, 'schema.sql')
+        loader.input(generate_population(num_classes, num_attributes))
+        metamodel = loader.build_metamodel()
+
+        sql_filename = os.path.join(outdir, 'model.sql')
+        snapshot_filename = os.path.join(outdir, 'model.snapshot')
+        xtuml.persist_database(metamodel, sql_filename)
+
+        t = time.time()
+        rsl.snapshot.save(metamodel, snapshot_filename)
+        save_time = time.time() - t
+
+        print('%d instances' % (1 + num_classes * (num_attributes + 1)))
+        for name, fn, filename in [('sql', load_sql, sql_filename),
+                                   ('snapshot', load_snapshot,
+                                    snapshot_filename)]:
+            t = time.time()
+            fn(filename)
+            print('%-10s %8.3f s %8.1f KiB' % (name, time.time() - t,
+                                               os.path.getsize(filename) /
+                                               1024.0))
+
+        print('%-10s %8.3f s' % ('save', save_time))
+    finally:
+        shutil.rmtree(outdir)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -12,7 +12,7 @@ from rsl import bridge
 from rsl import string_formatter
 
 
-@bridge('HASH.MD5')
+@bridge('HASH.MD5', modifies_model=False)
 def hash_md5(s):
     try:
         result = hashlib.md5(s).hexdigest()
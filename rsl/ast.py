@@ -5,125 +5,125 @@ Abstract syntax tree node definitions for the rule-specification language (RSL).
 '''
 
 
+try:
+    from sys import intern
+except ImportError:
+    # python2
+    pass
+
+
+#: Version of the node definitions, which is part of the key of syntax trees
+#: in the parse cache.
+VERSION = 2
+
+
 class Node(object):
-    filename = None
-    lineno = 0
-    
+    '''
+    Base class of nodes in a syntax tree. Nodes use slots rather than a
+    dictionary per instance, and their children are computed once the tree
+    has been frozen.
+    '''
+    __slots__ = ('filename', 'lineno', 'children')
+
+    #: Names of the fields that hold the children of a node, in the order
+    #: they are walked.
+    child_fields = ()
+
+    def __new__(cls, *args, **kwargs):
+        node = object.__new__(cls)
+        node.filename = None
+        node.lineno = 0
+        node.children = ()
+        return node
+
     def __str__(self):
         return self.__class__.__name__
-    
-    @property
-    def children(self):
-        return tuple()
-        
+
+
 #
 # Top-level node in a parsed file
 #
 
 class BodyNode(Node):
-    statement_list = None
+    __slots__ = ('statement_list',)
+    child_fields = ('statement_list',)
 
     def __init__(self, statement_list):
         self.statement_list = statement_list
 
-    @property
-    def children(self):
-        return (self.statement_list,)
-        
+
 #
 # Template-related nodes
-#    
+#
 
 class LiteralListNode(Node):
-    literals = None
-    
+    __slots__ = ('literals', 'resolved')
+    child_fields = ('literals',)
+
     def __init__(self):
         self.literals = list()
+        self.resolved = False
+
 
-    @property
-    def children(self):
-        return iter(self.literals)
-        
 class LiteralNode(Node):
-    value = None
-    
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 
 class SubstitutionVariableNode(Node):
-    expr = None
-    formats = None
-    
+    __slots__ = ('expr', 'formats')
+    child_fields = ('expr',)
+
     def __init__(self, fmt, expr):
         self.formats = fmt
         self.expr = expr
 
-    @property
-    def children(self):
-        return (self.expr,)
-
 
 class SubstitutionNavigationNode(Node):
-    variable = None
-    navigation = None
-    
+    __slots__ = ('variable', 'navigation')
+    child_fields = ('variable',)
+
     def __init__(self, variable, navigation):
         self.variable = variable
         self.navigation = navigation
-        
-    @property
-    def children(self):
-        return (self.variable,)
-        
-        
+
+
 class ParseKeywordNode(Node):
-    expr = None
-    keyword = None
-    
+    __slots__ = ('expr', 'keyword')
+    child_fields = ('expr', 'keyword')
+
     def __init__(self, expr, keyword):
         self.expr = expr
         self.keyword = keyword
-        
-    @property
-    def children(self):
-        return (self.expr, self.keyword)
+
 
 #
 # Function related nodes
 #
 
 class FunctionNode(Node):
-    name = None
-    parameter_list = None
-    statement_list = None
+    __slots__ = ('name', 'parameter_list', 'statement_list')
+    child_fields = ('parameter_list', 'statement_list')
 
     def __init__(self, name, params, body):
         self.name = name
         self.parameter_list = params
         self.statement_list = body
 
-    @property
-    def children(self):
-        return (self.parameter_list, self.statement_list)
-
 
 class ParameterNode(Node):
-    name = None
-    type = None
+    __slots__ = ('name', 'type')
+    child_fields = ('type',)
 
     def __init__(self, ty, name):
         self.name = name
         self.type = ty
 
-    @property
-    def children(self):
-        return (self.type,)
-
 
 class ParameterTypeNode(Node):
-    name = None
-    kind = None
+    __slots__ = ('name', 'kind')
 
     def __init__(self, name, kind=None):
         self.name = name
@@ -131,129 +131,97 @@ class ParameterTypeNode(Node):
 
 
 class ParameterListNode(Node):
-    parameters = None
-    
+    __slots__ = ('parameters',)
+    child_fields = ('parameters',)
+
     def __init__(self):
         self.parameters = list()
 
-    @property
-    def children(self):
-        return iter(self.parameters)
-
 
 class ArgumentListNode(Node):
-    arguments = None
-    
+    __slots__ = ('arguments',)
+    child_fields = ('arguments',)
+
     def __init__(self):
         self.arguments = list()
 
-    @property
-    def children(self):
-        return iter(self.arguments)
-        
 
 class StatementListNode(Node):
-    statements = None
-    
+    __slots__ = ('statements',)
+    child_fields = ('statements',)
+
     def __init__(self):
         self.statements = list()
 
-    @property
-    def children(self):
-        return iter(self.statements)
-        
 
 #
 # Function-like statements
 #
 
 class ExitNode(Node):
-    return_code = None
+    __slots__ = ('return_code',)
+    child_fields = ('return_code',)
 
     def __init__(self, return_code):
         self.return_code = return_code
 
-    @property
-    def children(self):
-        return (self.return_code,)
-
 
 class IncludeNode(Node):
-    inc_filename = None
+    __slots__ = ('inc_filename',)
+    child_fields = ('inc_filename',)
 
     def __init__(self, filename):
         self.inc_filename = filename
 
-    @property
-    def children(self):
-        return (self.inc_filename,)
-        
 
 class PrintNode(Node):
-    value_list = None
+    __slots__ = ('value_list',)
+    child_fields = ('value_list',)
 
     def __init__(self, value_list):
         self.value_list = value_list
 
-    @property
-    def children(self):
-        return (self.value_list,)
-        
 
 class EmitNode(Node):
-    emit_filename = None
+    __slots__ = ('emit_filename',)
+    child_fields = ('emit_filename',)
 
     def __init__(self, filename):
         self.emit_filename = filename
 
-    @property
-    def children(self):
-        return (self.emit_filename,)
-
 
 class ClearNode(Node):
-    pass
-
+    __slots__ = ()
 
 #
 # Assignment statements
 #
 
 class AssignNode(Node):
-    variable = None
-    expr = None
+    __slots__ = ('variable', 'expr')
+    child_fields = ('variable', 'expr')
 
     def __init__(self, variable, expr):
         self.variable = variable
         self.expr = expr
 
-    @property
-    def children(self):
-        return (self.variable, self.expr)
-
 
 class InvokeNode(Node):
-    function_name = None
-    argument_list = None
-    variable_name = None
+    __slots__ = ('function_name', 'argument_list', 'variable_name')
+    child_fields = ('argument_list',)
 
     def __init__(self, function_name, argument_list, variable_name=None):
         self.function_name = function_name
         self.argument_list = argument_list
         self.variable_name = variable_name
 
-    @property
-    def children(self):
-        return (self.argument_list,)
-        
 
 #
 # Meta model manipulation statements
 #
 
 class CreateNode(Node):
-    variable_name = None
-    key_letter = None
+    __slots__ = ('variable_name', 'key_letter')
 
     def __init__(self, variable_name, key_letter):
         self.variable_name = variable_name
@@ -261,77 +229,55 @@ class CreateNode(Node):
 
 
 class SelectNode(Node):
-    variable_name = None
-    instance_chain = None
-    where = None
-    
+    __slots__ = ('variable_name', 'instance_chain', 'where')
+    child_fields = ('instance_chain', 'where')
+
     def __init__(self, variable_name, instance_chain, where):
         self.variable_name = variable_name
         self.instance_chain = instance_chain
         self.where = where
 
-    @property
-    def children(self):
-        return (self.instance_chain, self.where)
-        
 
 class SelectFromNode(Node):
-    variable_name = None
-    key_letter = None
-    where = None
-    
+    __slots__ = ('variable_name', 'key_letter', 'where')
+    child_fields = ('where',)
+
     def __init__(self, variable_name, key_letter, where):
         self.variable_name = variable_name
         self.key_letter = key_letter
         self.where = where
 
-    @property
-    def children(self):
-        return (self.where,)
-        
-        
-class SelectAnyInstanceNode(SelectFromNode):
-    pass
 
+class SelectAnyInstanceNode(SelectFromNode):
+    __slots__ = ()
 
 class SelectManyInstanceNode(SelectFromNode):
-    order_by = None
+    __slots__ = ('order_by',)
+    child_fields = ('where', 'order_by')
 
     def __init__(self, variable_name, key_letter, where, order_by):
         super(SelectManyInstanceNode, self).__init__(variable_name, key_letter, where)
         self.order_by = order_by
 
-    @property
-    def children(self):
-        return (self.where, self.order_by)
-
 
 class SelectOneNode(SelectNode):
-    pass
-
+    __slots__ = ()
 
 class SelectAnyNode(SelectNode):
-    pass
-
+    __slots__ = ()
 
 class SelectManyNode(SelectNode):
-    order_by = None
+    __slots__ = ('order_by',)
+    child_fields = ('where', 'order_by')
 
     def __init__(self, variable_name, instance_chain, where, order_by):
         super(SelectManyNode, self).__init__(variable_name, instance_chain, where)
         self.order_by = order_by
 
-    @property
-    def children(self):
-        return (self.where, self.order_by)
-
 
 class RelateNode(Node):
-    from_variable_name = None
-    to_variable_name = None
-    rel_id = None
-    phrase = None
-    
+    __slots__ = ('from_variable_name', 'to_variable_name', 'rel_id', 'phrase')
+
     def __init__(self, from_variable_name, to_variable_name, rel_id, phrase):
         self.from_variable_name = from_variable_name
         self.to_variable_name = to_variable_name
@@ -340,12 +286,9 @@ class RelateNode(Node):
 
 
 class RelateUsingNode(Node):
-    from_variable_name = None
-    to_variable_name = None
-    rel_id = None
-    phrase = None
-    using_variable_name = None
-    
+    __slots__ = ('from_variable_name', 'to_variable_name', 'rel_id', 'phrase',
+                 'using_variable_name')
+
     def __init__(self, from_variable_name, to_variable_name, rel_id, phrase,
                  using_variable_name):
         self.from_variable_name = from_variable_name
@@ -356,25 +299,19 @@ class RelateUsingNode(Node):
 
 
 class UnrelateNode(Node):
-    from_variable_name = None
-    to_variable_name = None
-    rel_id = None
-    phrase = None
-    
+    __slots__ = ('from_variable_name', 'to_variable_name', 'rel_id', 'phrase')
+
     def __init__(self, from_variable_name, to_variable_name, rel_id, phrase):
         self.from_variable_name = from_variable_name
         self.to_variable_name = to_variable_name
         self.rel_id = rel_id
         self.phrase = phrase
-        
+
 
 class UnrelateUsingNode(Node):
-    from_variable_name = None
-    to_variable_name = None
-    rel_id = None
-    phrase = None
-    using_variable_name = None
-    
+    __slots__ = ('from_variable_name', 'to_variable_name', 'rel_id', 'phrase',
+                 'using_variable_name')
+
     def __init__(self, from_variable_name, to_variable_name, rel_id, phrase,
                  using_variable_name):
         self.from_variable_name = from_variable_name
@@ -382,92 +319,73 @@ class UnrelateUsingNode(Node):
         self.rel_id = rel_id
         self.phrase = phrase
         self.using_variable_name = using_variable_name
-        
+
 
 class DeleteNode(Node):
-    variable_name = None
-    
+    __slots__ = ('variable_name',)
+
     def __init__(self, variable_name):
         self.variable_name = variable_name
 
 
 class WhereNode(Node):
-    expr = None
-    
+    __slots__ = ('expr',)
+    child_fields = ('expr',)
+
     def __init__(self, expr=None):
         self.expr = expr
-        
-    @property
-    def children(self):
-        return (self.expr,)
-        
+
+
 class OrderByNode(Node):
-    reverse = False
-    attributes = None
-    
+    __slots__ = ('reverse', 'attributes')
+    child_fields = ('attributes',)
+
     def __init__(self, reverse=False):
         self.reverse = reverse
         self.attributes = list()
 
-    @property
-    def children(self):
-        return iter(self.attributes)
-
 
 class InstanceChainNode(Node):
-    variable = None
-    navigations = None
-    
+    __slots__ = ('variable', 'navigations')
+    child_fields = ('variable', 'navigations')
+
     def __init__(self, variable):
         self.variable = variable
         self.navigations = list()
 
-    @property
-    def children(self):
-        l = [self.variable]
-        l.extend(self.navigations)
-        return l
-
 
 class NavigationNode(Node):
-    key_letter = None
-    relation = None
-    
+    __slots__ = ('key_letter', 'relation')
+    child_fields = ('relation',)
+
     def __init__(self, key_letter, relation):
         self.key_letter = key_letter
         self.relation = relation
 
-    @property
-    def children(self):
-        return (self.relation,)
-
 
 class RelationNode(Node):
-    rel_id = None
-    phrase = ''
-    
+    __slots__ = ('rel_id', 'phrase')
+
     def __init__(self, rel_id, phrase=''):
         self.rel_id = rel_id
         self.phrase = phrase
 
 
 class AlXlateNode(Node):
-    activity_type = None
-    inst_ref = None
+    __slots__ = ('activity_type', 'inst_ref')
 
     def __init__(self, activity_type, inst_ref):
         self.activity_type = activity_type
         self.inst_ref = inst_ref
 
+
 #
 # Control flow statements
 #
 
 class IfNode(Node):
-    cond = None
-    iftrue = None
-    elif_list = None
-    iffalse = None
+    __slots__ = ('cond', 'iftrue', 'elif_list', 'iffalse')
+    child_fields = ('cond', 'iftrue', 'elif_list', 'iffalse')
 
     def __init__(self, cond, iftrue, elif_list, iffalse):
         self.cond = cond
@@ -475,169 +393,195 @@ class IfNode(Node):
         self.elif_list = elif_list
         self.iffalse = iffalse
 
-    @property
-    def children(self):
-        return (self.cond, self.iftrue, self.elif_list, self.iffalse)
-
 
 class ElIfListNode(Node):
-    elifs = None
-    
+    __slots__ = ('elifs',)
+    child_fields = ('elifs',)
+
     def __init__(self):
         self.elifs = list()
 
-    @property
-    def children(self):
-        return iter(self.elifs)
-
 
 class ElIfNode(Node):
-    cond = None
-    statement_list = None
+    __slots__ = ('cond', 'statement_list')
+    child_fields = ('cond', 'statement_list')
 
     def __init__(self, cond, statement_list):
         self.cond = cond
         self.statement_list = statement_list
-    
-    @property
-    def children(self):
-        return (self.cond, self.statement_list)
 
 
 #
 # Loop statements
 #
-    
+
 class ForNode(Node):
-    variable_name = None
-    set_name = None
-    statement_list = None
+    __slots__ = ('variable_name', 'set_name', 'statement_list', 'parallel')
+    child_fields = ('statement_list',)
 
-    def __init__(self, variable_name, set_name, statement_list):
+    def __init__(self, variable_name, set_name, statement_list,
+                 parallel=False):
         self.variable_name = variable_name
         self.set_name = set_name
         self.statement_list = statement_list
-
-    @property
-    def children(self):
-        return (self.statement_list,)
+        self.parallel = parallel
 
 
 class WhileNode(Node):
-    cond = None
-    statement_list = None
+    __slots__ = ('cond', 'statement_list')
+    child_fields = ('cond', 'statement_list')
 
     def __init__(self, cond, statement_list):
         self.cond = cond
         self.statement_list = statement_list
 
-    @property
-    def children(self):
-        return (self.cond, self.statement_list)
-
 
 class BreakNode(Node):
-    pass
-
+    __slots__ = ()
 
 #
 # Expressions
 #
-    
+
 class BinaryOpNode(Node):
-    sign = None
-    left = None
-    right = None
-    
+    __slots__ = ('sign', 'left', 'right')
+    child_fields = ('left', 'right')
+
     def __init__(self, left, sign, right):
         self.sign = sign.lower()
         self.left = left
         self.right = right
-    
-    @property
-    def children(self):
-        return (self.left, self.right)
-        
+
 
 class UnaryOpNode(Node):
-    sign = None
-    value = None
-    
+    __slots__ = ('sign', 'value')
+    child_fields = ('value',)
+
     def __init__(self, sign, value):
         self.sign = sign.lower()
         self.value = value
-    
-    @property
-    def children(self):
-        return (self.value,)
 
 
 class VariableAccessNode(Node):
-    name = None
-    
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
+
 class VariableAssignmentNode(Node):
-    name = None
-    
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
-        
+
+
 class FieldAccessNode(Node):
-    variable = None
-    field = None
-    
+    __slots__ = ('variable', 'field')
+    child_fields = ('variable',)
+
     def __init__(self, variable, field):
         self.variable = variable
         self.field = field
 
-    @property
-    def children(self):
-        return (self.variable,)
-
 
 class FieldAssignmentNode(Node):
-    variable = None
-    field = None
-    
+    __slots__ = ('variable', 'field')
+    child_fields = ('variable',)
+
     def __init__(self, variable, field):
         self.variable = variable
         self.field = field
 
-    @property
-    def children(self):
-        return (self.variable,)
-        
 
 class StringBodyNode(Node):
-    values = None
-    
+    __slots__ = ('values',)
+    child_fields = ('values',)
+
     def __init__(self):
         self.values = list()
 
-    @property
-    def children(self):
-        return iter(self.values)
-
 
 class StringValueNode(Node):
-    value = None
-    
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 
 class IntegerValueNode(Node):
-    value = None
-    
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 
 class RealValueNode(Node):
-    value = None
-    
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
+
+class ConstantNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+_fields = dict()
+
+
+def node_fields(cls):
+    '''
+    Obtain the names of all fields defined by a class of nodes, except those
+    defined by the base class.
+    '''
+    if cls not in _fields:
+        fields = list()
+        for base in reversed(cls.__mro__[:-2]):
+            for name in base.__dict__.get('__slots__', ()):
+                if name not in fields:
+                    fields.append(name)
+
+        _fields[cls] = tuple(fields)
+
+    return _fields[cls]
+
+
+def freeze(root):
+    '''
+    Freeze a syntax tree in place, and return it. Lists are replaced by
+    tuples, filenames are interned, and the children of each node are
+    computed once and stored on the node.
+    '''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node.filename, str):
+            node.filename = intern(node.filename)
+
+        for name in node_fields(node.__class__):
+            value = getattr(node, name, None)
+            if isinstance(value, list):
+                value = tuple(value)
+                setattr(node, name, value)
+
+            if isinstance(value, Node):
+                stack.append(value)
+
+            elif isinstance(value, tuple):
+                stack.extend(item for item in value if isinstance(item, Node))
+
+        children = list()
+        for name in node.child_fields:
+            value = getattr(node, name)
+            if isinstance(value, tuple):
+                children.extend(value)
+            else:
+                children.append(value)
+
+        node.children = tuple(children)
+
+    return root
@@ -0,0 +1,64 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Streaming serialization of instance populations to SQL insert statements.
+Instances are serialized one at a time by xtuml.serialize_instance, class by
+class, and written through a buffered (and optionally gzip compressed) file,
+so that the memory used does not depend on the size of the population.
+'''
+
+
+import io
+import gzip
+import logging
+
+import xtuml
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Size of the buffer used when writing dumps to disk.
+BUFFER_SIZE = 1024 * 1024
+
+
+def open_dump(filename):
+    '''
+    Open a file for writing a dump to, compressed using gzip if the filename
+    ends with .gz.
+    '''
+    if filename.endswith('.gz'):
+        return io.BufferedWriter(gzip.GzipFile(filename, 'wb'), BUFFER_SIZE)
+    else:
+        return io.open(filename, 'wb', buffering=BUFFER_SIZE)
+
+
+def dump_instances(metamodel, filename, kinds=None):
+    '''
+    Dump instances in a *metamodel* to a file as SQL insert statements,
+    optionally limited to instances of some *kinds* of classes. The number
+    of dumped instances is returned.
+    '''
+    metaclasses = list(metamodel.metaclasses.values())
+    if kinds:
+        ukinds = set(kind.upper() for kind in kinds)
+        for kind in kinds:
+            if kind.upper() not in metamodel.metaclasses:
+                logger.warning('unable to dump unknown class %s', kind)
+
+        metaclasses = [metaclass for metaclass in metaclasses
+                       if metaclass.kind.upper() in ukinds]
+
+    count = 0
+    with open_dump(filename) as f:
+        for metaclass in metaclasses:
+            for inst in metaclass.storage:
+                s = xtuml.serialize_instance(inst)
+                if not isinstance(s, bytes):
+                    s = s.encode('utf-8')
+
+                f.write(s)
+                count += 1
+
+    logger.debug('Dumped %d instances to %s', count, filename)
+    return count
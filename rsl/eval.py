@@ -5,15 +5,21 @@ Evaluation of syntax trees constructed from the rule-specification language (RSL
 '''
 
 
-import sys
 import os
+import sys
 import logging
 
 import xtuml
 
-from . import symtab
+from . import ast
 from . import parse
+from . import symtab
+from . import resolve
 from . import runtime
+from . import optimize
+from . import include
+from . import lint
+from . import parallel
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +28,76 @@ class BreakException(Exception):
     pass
 
 
+def load_include(rt, includes, filename):
+    '''
+    Locate and parse a file referenced by an include statement, searching
+    the folder of the archetype being evaluated before the *includes*
+    folders. Parsed files are cached in the runtime.
+    '''
+    folder = rt.info.arch_folder_path
+    return include.load_include(rt, includes, folder, filename)
+
+
+def breaks_loop(node):
+    '''
+    Check if a statement may break out of the loop that it is placed in.
+    '''
+    if isinstance(node, ast.BreakNode):
+        return True
+    
+    if isinstance(node, (ast.ForNode, ast.WhileNode, ast.FunctionNode)):
+        return False
+    
+    return any(breaks_loop(child) for child in node.children
+               if isinstance(child, ast.Node))
+
+
+def parallel_loop_error(node, includes, cache_dir=None):
+    '''
+    Explain why the iterations of a loop may not be evaluated in parallel,
+    or return None if they may.
+    '''
+    mutations = lint.find_mutations(node.statement_list, includes, cache_dir)
+    if mutations:
+        mutation = mutations[0]
+        return ('parallel loop may modify the model (%s at %s:%d)'
+                % (lint.MUTATIONS[type(mutation).__name__],
+                   mutation.filename, mutation.lineno))
+    
+    if breaks_loop(node.statement_list):
+        return 'parallel loop may not break'
+
+
+def loop_assignments(node, includes, cache_dir=None):
+    '''
+    Obtain the names assigned by the iterations of a loop, including names
+    assigned in files that the body of the loop includes.
+    '''
+    names = [node.variable_name]
+    visited = set()
+    stack = [node.statement_list]
+    while stack:
+        resolver = resolve.walk(stack.pop())
+        names.extend(resolver.names)
+        for inc in resolver.includes:
+            filename = include.constant_filename(inc)
+            if filename is None:
+                continue
+
+            folder = os.path.dirname(inc.filename or '')
+            path = include.search_path(includes, folder, filename)
+            if path is not None and path not in visited:
+                visited.add(path)
+                stack.append(parse.parse_file(path, cache_dir))
+
+    return names
+
+
+def outer_assignment_error(name):
+    return runtime.RuntimeException('parallel loop may not assign %s, which '
+                                    'is declared outside of the loop' % name)
+
+
 class EvalWalker(xtuml.Walker):
     
     def __init__(self, rt, includes):
@@ -107,9 +183,7 @@ class EvalWalker(xtuml.Walker):
         variable.fset(value)
         
     def accept_StringBodyNode(self, node):
-        s = ''
-        for value in node.values:
-            s += self.accept(value).fget()
+        s = ''.join([self.accept(value).fget() for value in node.values])
             
         return property(lambda: s)
     
@@ -130,6 +204,11 @@ class EvalWalker(xtuml.Walker):
         
         return property(lambda: i)
         
+    def accept_ConstantNode(self, node):
+        value = node.value
+        
+        return property(lambda: value)
+        
     def accept_VariableAccessNode(self, node):
         return property(lambda: self.symtab.find_symbol(node.name))
     
@@ -146,7 +225,9 @@ class EvalWalker(xtuml.Walker):
     def accept_FieldAssignmentNode(self, node):
         variable = self.accept(node.variable).fget()
         
-        return property(fset=lambda val: setattr(variable, node.field, val))
+        setter = lambda val: self.runtime.set_attribute(variable, node.field, val)
+        
+        return property(fset=setter)
         
     def accept_SubstitutionVariableNode(self, node):
         value = self.accept(node.expr).fget()
@@ -156,13 +237,11 @@ class EvalWalker(xtuml.Walker):
     
     def accept_SubstitutionNavigationNode(self, node):
         variable = self.accept(node.variable).fget()
-        chain = self.runtime.chain(variable)
-        
-        key_letter = node.navigation.key_letter
-        rel_id = node.navigation.relation.rel_id
-        phrase = node.navigation.relation.phrase
+        navigation = (node.navigation.key_letter,
+                      node.navigation.relation.rel_id,
+                      node.navigation.relation.phrase)
         
-        inst_set = chain.nav(key_letter, rel_id, phrase)()
+        inst_set = self.runtime.navigate(variable, [navigation])
         value = self.runtime.select_any_in(inst_set, lambda selected: True)
         
         return property(lambda: value)
@@ -219,14 +298,39 @@ class EvalWalker(xtuml.Walker):
             self.symtab.leave_block()
         
     def accept_ForNode(self, node):
+        if node.parallel:
+            error = parallel_loop_error(node, self.includes,
+                                        self.runtime.cache_dir)
+            if error:
+                raise runtime.RuntimeException(error)
+            
+            # assignments to outer variables are lost in forked processes
+            for name in loop_assignments(node, self.includes,
+                                         self.runtime.cache_dir):
+                try:
+                    self.symtab.find_symbol(name)
+                except symtab.SymtabException:
+                    continue
+                
+                raise outer_assignment_error(name)
+            
         try:
             self.symtab.enter_block()
             handle = self.symtab.find_symbol(node.set_name)
-            for value in iter(handle):
+            for index, value in enumerate(handle):
                 iterator_name = '_%d' % id(handle)
                 self.symtab.install_symbol(iterator_name, value)
                 self.symtab.install_symbol(node.variable_name, value)
-                self.accept(node.statement_list)
+                if node.parallel:
+                    # each iteration is evaluated in a block of its own
+                    mutations = self.runtime.mutations
+                    self.symtab.enter_block()
+                    self.accept(node.statement_list)
+                    self.symtab.leave_block()
+                    if self.runtime.mutations != mutations:
+                        raise parallel.modified_error('iteration %d' % index)
+                else:
+                    self.accept(node.statement_list)
             self.symtab.leave_block()
         except BreakException:
             self.symtab.leave_block()
@@ -235,25 +339,6 @@ class EvalWalker(xtuml.Walker):
         raise BreakException()
 
     def accept_BinaryOpNode(self, node):
-        ops = {
-            '|':   lambda lhs, rhs: (lhs | rhs),
-            '&':   lambda lhs, rhs: (lhs & rhs),
-            '+':   lambda lhs, rhs: (lhs + rhs),
-            '-':   lambda lhs, rhs: (lhs - rhs),
-            '*':   lambda lhs, rhs: (lhs * rhs),
-            '^':   lambda lhs, rhs: (lhs ^ rhs),
-            '%':   lambda lhs, rhs: (lhs % rhs),
-            '/':   lambda lhs, rhs: (lhs / rhs),
-            '<':   lambda lhs, rhs: (lhs < rhs),
-            '<=':  lambda lhs, rhs: (lhs <= rhs),
-            '>':   lambda lhs, rhs: (lhs > rhs),
-            '>=':  lambda lhs, rhs: (lhs >= rhs),
-            '!=':  lambda lhs, rhs: (lhs != rhs),
-            '==':  lambda lhs, rhs: (lhs == rhs),
-            'or':  lambda lhs, rhs: (lhs or  rhs),
-            'and': lambda lhs, rhs: (lhs and rhs),
-        }
-
         lhs = self.accept(node.left).fget()
 
         if node.sign == 'or' and lhs == True:
@@ -272,7 +357,10 @@ class EvalWalker(xtuml.Walker):
         if self.runtime.is_set(rhs):
             lhs = self.runtime.cast_to_set(lhs)
             
-        value = ops[node.sign](lhs, rhs)
+        if node.sign in SET_OPERATORS and self.runtime.is_set(lhs):
+            value = SET_OPERATORS[node.sign](lhs, rhs)
+        else:
+            value = BINARY_OPERATORS[node.sign](lhs, rhs)
         
         return property(lambda: value)
     
@@ -300,11 +388,12 @@ class EvalWalker(xtuml.Walker):
         return property(lambda: s)
     
     def accept_LiteralListNode(self, node):
-        s = ''
-        for literal in node.literals:
-            s += self.accept(literal).fget()
-         
-        self.runtime.buffer_literal(s)
+        parts = [self.accept(literal).fget() for literal in node.literals]
+        if node.resolved:
+            for part in parts:
+                self.runtime.buffer.write(part)
+        else:
+            self.runtime.buffer_literals(parts)
         
     def accept_EmitNode(self, node):
         filename = self.accept(node.emit_filename).fget()
@@ -315,32 +404,7 @@ class EvalWalker(xtuml.Walker):
             
     def accept_IncludeNode(self, node):
         filename = self.accept(node.inc_filename).fget()
-        root = None
-        
-        # check cache
-        if filename in self.runtime.include_cache:
-            root = self.runtime.include_cache[filename]
-        
-        # check absolute path
-        elif os.path.isabs(filename):
-            root = parse.parse_file(filename)
-            self.runtime.include_cache[filename] = root
-
-        # search relative include paths
-        else:
-            paths_to_search = [self.runtime.info.arch_folder_path]
-            paths_to_search.extend(self.includes)
-            paths_to_search = filter(None, paths_to_search)
-            
-            for path in paths_to_search:
-                abs_path = '%s/%s' % (path, filename)
-                if os.path.exists(abs_path):
-                    root = parse.parse_file(abs_path)
-                    self.runtime.include_cache[filename] = root
-                    break
-            
-        if root is None:
-            raise Exception("unable to find '%s'" % filename)
+        root = load_include(self.runtime, self.includes, filename)
         
         self.callstack.append(node)
         self.accept(root)
@@ -420,14 +484,10 @@ class EvalWalker(xtuml.Walker):
         
     def accept_InstanceChainNode(self, node):
         inst = self.accept(node.variable).fget()
-        chain = self.runtime.chain(inst)
-        
-        for nav in node.navigations:
-            rel_id = nav.relation.rel_id
-            phrase = nav.relation.phrase
-            chain = chain.nav(nav.key_letter, rel_id, phrase)
-        
-        result = chain()
+        navigations = [(nav.key_letter, nav.relation.rel_id,
+                        nav.relation.phrase)
+                       for nav in node.navigations]
+        result = self.runtime.navigate(inst, navigations)
         
         return property(lambda: result)
     
@@ -435,36 +495,953 @@ class EvalWalker(xtuml.Walker):
         from_inst = self.symtab.find_symbol(node.from_variable_name)
         to_inst = self.symtab.find_symbol(node.to_variable_name)
         
-        xtuml.relate(from_inst, to_inst, node.rel_id, node.phrase)
+        self.runtime.relate(from_inst, to_inst, node.rel_id, node.phrase)
         
     def accept_RelateUsingNode(self, node):
         from_inst = self.symtab.find_symbol(node.from_variable_name)
         to_inst = self.symtab.find_symbol(node.to_variable_name)
         using_inst = self.symtab.find_symbol(node.using_variable_name)
         
-        xtuml.relate(from_inst, using_inst, node.rel_id, node.phrase)
-        xtuml.relate(using_inst, to_inst, node.rel_id, node.phrase)
+        self.runtime.relate(from_inst, using_inst, node.rel_id, node.phrase)
+        self.runtime.relate(using_inst, to_inst, node.rel_id, node.phrase)
         
     def accept_UnrelateNode(self, node):
         from_inst = self.symtab.find_symbol(node.from_variable_name)
         to_inst = self.symtab.find_symbol(node.to_variable_name)
         
-        xtuml.unrelate(from_inst, to_inst, node.rel_id, node.phrase)
+        self.runtime.unrelate(from_inst, to_inst, node.rel_id, node.phrase)
         
     def accept_UnrelateUsingNode(self, node):
         from_inst = self.symtab.find_symbol(node.from_variable_name)
         to_inst = self.symtab.find_symbol(node.to_variable_name)
         using_inst = self.symtab.find_symbol(node.using_variable_name)
         
-        xtuml.unrelate(from_inst, using_inst, node.rel_id, node.phrase)
-        xtuml.unrelate(using_inst, to_inst, node.rel_id, node.phrase)
+        self.runtime.unrelate(from_inst, using_inst, node.rel_id, node.phrase)
+        self.runtime.unrelate(using_inst, to_inst, node.rel_id, node.phrase)
         
     def accept_DeleteNode(self, node):
         inst = self.symtab.find_symbol(node.variable_name)
-        xtuml.delete(inst)
+        self.runtime.delete(inst)
+
+
+def is_selected(node):
+    return (isinstance(node, ast.VariableAccessNode) and
+            node.name.lower() == 'selected')
+
+
+def uses_selected(node):
+    if is_selected(node):
+        return True
+    
+    return any(uses_selected(child) for child in node.children
+               if isinstance(child, ast.Node))
+
+
+def split_where(expr):
+    '''
+    Split a where clause into equality terms on attributes of the selected
+    instance, e.g. selected.Obj_ID == obj.Obj_ID, and the remaining terms of
+    the conjunction.
+    '''
+    conjuncts = list()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.BinaryOpNode) and node.sign == 'and':
+            stack.append(node.right)
+            stack.append(node.left)
+        else:
+            conjuncts.append(node)
+            
+    terms = list()
+    rest = list()
+    for node in conjuncts:
+        if isinstance(node, ast.BinaryOpNode) and node.sign == '==':
+            for lhs, rhs in [(node.left, node.right), (node.right, node.left)]:
+                if (isinstance(lhs, ast.FieldAccessNode) and
+                    is_selected(lhs.variable) and not uses_selected(rhs)):
+                    terms.append((lhs.field.lower(), rhs))
+                    break
+            else:
+                rest.append(node)
+        else:
+            rest.append(node)
+            
+    return terms, rest
+    
+
+BINARY_OPERATORS = {
+    '|':   lambda lhs, rhs: (lhs | rhs),
+    '&':   lambda lhs, rhs: (lhs & rhs),
+    '+':   lambda lhs, rhs: (lhs + rhs),
+    '-':   lambda lhs, rhs: (lhs - rhs),
+    '*':   lambda lhs, rhs: (lhs * rhs),
+    '^':   lambda lhs, rhs: (lhs ^ rhs),
+    '%':   lambda lhs, rhs: (lhs % rhs),
+    '/':   lambda lhs, rhs: (lhs / rhs),
+    '<':   lambda lhs, rhs: (lhs < rhs),
+    '<=':  lambda lhs, rhs: (lhs <= rhs),
+    '>':   lambda lhs, rhs: (lhs > rhs),
+    '>=':  lambda lhs, rhs: (lhs >= rhs),
+    '!=':  lambda lhs, rhs: (lhs != rhs),
+    '==':  lambda lhs, rhs: (lhs == rhs),
+    'or':  lambda lhs, rhs: (lhs or  rhs),
+    'and': lambda lhs, rhs: (lhs and rhs),
+}
+
+
+SET_OPERATORS = {
+    '|':   runtime.Runtime.set_union,
+    '&':   runtime.Runtime.set_intersection,
+    '-':   runtime.Runtime.set_difference,
+    '^':   runtime.Runtime.set_symmetric_difference,
+}
+
+
+class CompileWalker(xtuml.Walker):
+    '''
+    Compile syntax trees into python closures. Each node is visited once, and
+    the resulting closure may then be executed any number of times without
+    walking the tree again. Statements compile into closures without
+    arguments, expressions into closures that return a value, and assignment
+    targets into closures that accept the value to assign.
+    '''
+    
+    def __init__(self, rt, includes):
+        xtuml.Walker.__init__(self)
+        self.runtime = rt
+        self.includes = includes
+        self.callstack = list()
+        self.code = dict()
+        self.slots = None
+        self.frames = list()
+        self.symtab = symtab.SymbolTable()
+        
+        self.symtab.install_global('true', True)
+        self.symtab.install_global('false', False)
+        self.symtab.install_global('info', self.runtime.info)
+                
+        self.symtab.enter_scope()
+
+    def compile(self, root):
+        '''
+        Compile a tree, or reuse the closure from a previous compilation of
+        the same tree.
+        '''
+        if root not in self.code:
+            self.code[root] = self.accept(root)
+            
+        return self.code[root]
+    
+    def report(self, e, node):
+        self.runtime.invoke_print(e, 'ERROR')
+        print('Traceback  (most recent call last):')
+        callstack = list(self.callstack)
+        if not callstack or callstack[-1] is not node:
+            callstack.append(node)
+            
+        for n in callstack:
+            print('    File "%s", line %d' % (n.filename, n.lineno))
+        sys.exit(e)
+        
+    def statement(self, node):
+        '''
+        Compile a statement, and keep track of its location in the archetype
+        while executing it.
+        '''
+        fn = self.accept(node)
+        info = self.runtime.info
+        filename = node.filename
+        lineno = node.lineno
+        if self.runtime.profiler:
+            fn = self.runtime.profiler.line(filename, lineno, fn)
+        
+        def statement():
+            info.arch_file_path = filename
+            info.arch_file_line = lineno
+            try:
+                fn()
+            except BreakException as e:
+                raise e
+            except Exception as e:
+                self.report(e, node)
+                
+        return statement
+
+    def slot(self, name):
+        if self.slots is not None:
+            return self.slots.get(name.lower())
+        
+    def load(self, name):
+        '''
+        Compile access to a variable, either from a slot in the frame of the
+        current function, or from the symbol table.
+        '''
+        find_symbol = self.symtab.find_symbol
+        slot = self.slot(name)
+        if slot is None:
+            return lambda: find_symbol(name)
+        
+        frames = self.frames
+        
+        def load_slot():
+            value = frames[-1][slot]
+            if value is resolve.UNDEFINED:
+                return find_symbol(name)
+            
+            return value
+        
+        return load_slot
+    
+    def store(self, name):
+        '''
+        Compile assignment of a variable, either to a slot in the frame of the
+        current function, or to the symbol table.
+        '''
+        slot = self.slot(name)
+        if slot is None:
+            install_symbol = self.symtab.install_symbol
+            return lambda value: install_symbol(name, value)
+        
+        frames = self.frames
+        
+        def store_slot(value):
+            frames[-1][slot] = value
+            
+        return store_slot
+    
+    def clear_slots(self, node, fn):
+        '''
+        Wrap a compiled block so that slots which are assigned for the first
+        time within the block are undefined when leaving it, like symbols
+        installed in a block of the symbol table.
+        '''
+        if self.slots is None:
+            return fn
+        
+        declared = [self.slots[name.lower()]
+                    for name in resolve.declared_names(node)]
+        if not declared:
+            return fn
+
+        frames = self.frames
+        undefined = resolve.UNDEFINED
+        
+        def block():
+            frame = frames[-1]
+            fresh = [slot for slot in declared if frame[slot] is undefined]
+            try:
+                fn()
+            finally:
+                for slot in fresh:
+                    frame[slot] = undefined
+                    
+        return block
+    
+    def block(self, node, fn):
+        '''
+        Wrap a compiled block so that variables declared within it are
+        forgotten when leaving it.
+        '''
+        if self.slots is not None:
+            return self.clear_slots(node, fn)
+        
+        st = self.symtab
+        
+        def block():
+            st.enter_block()
+            try:
+                fn()
+            finally:
+                st.leave_block()
+        
+        return block
+        
+    def default_accept(self, node, **kwargs):
+        name = node.__class__.__name__
+        
+        def unknown():
+            print ('> %s' % name)
+            
+        return unknown
+    
+    def accept_BodyNode(self, node):
+        return self.accept(node.statement_list)
+        
+    def accept_StatementListNode(self, node):
+        statements = tuple(self.statement(stmt) for stmt in node.statements
+                           if stmt is not None)
+        
+        def statement_list():
+            for stmt in statements:
+                stmt()
+                
+        return statement_list
+    
+    def accept_FunctionNode(self, node):
+        name = node.name
+        names = resolve.resolve_slots(node)
+        outer_slots = self.slots
+        if names is None:
+            self.slots = None
+        else:
+            self.slots = dict((n.lower(), i) for i, n in enumerate(names))
+            
+        try:
+            parameter_list = self.accept(node.parameter_list)
+            statement_list = self.accept(node.statement_list)
+        finally:
+            self.slots = outer_slots
+            
+        st = self.symtab
+        frames = self.frames
+        size = len(names or [])
+        undefined = resolve.UNDEFINED
+        
+        def fn(*args):
+            st.enter_scope()
+            frames.append([undefined] * size)
+            parameter_list(args)
+            statement_list()
+            frame = frames.pop()
+            d = st.leave_scope()
+            for slot, value in enumerate(frame):
+                if value is not undefined:
+                    d[names[slot]] = value
+                    
+            return d
+
+        if self.runtime.profiler:
+            fn = self.runtime.profiler.unit(node.filename, node.lineno, name,
+                                            'function', fn)
+            
+        def function():
+            self.runtime.define_function(name, fn)
+            
+        return function
+    
+    def accept_ParameterListNode(self, node):
+        parameters = [(self.store(param.name), param.type)
+                      for param in node.parameters]
+        assert_type = self.runtime.assert_type
+        
+        def parameter_list(args):
+            try:
+                if len(args) != len(parameters):
+                    raise runtime.RuntimeException('wrong number of arguments')
+            
+                for (store, ty), arg in zip(parameters, reversed(args)):
+                    assert_type(ty, arg)
+                    store(arg)
+            except Exception as e:
+                self.report(e, node)
+                
+        return parameter_list
+    
+    def accept_InvokeNode(self, node):
+        function_name = node.function_name
+        store = node.variable_name and self.store(node.variable_name)
+        arguments = [self.accept(arg) for arg in node.argument_list.arguments]
+        callstack = self.callstack
+        
+        def invoke():
+            args = [arg() for arg in arguments]
+            
+            callstack.append(node)
+            value = self.runtime.invoke_function(function_name, args)
+            callstack.pop()
+        
+            if store:
+                store(value)
+                
+        return invoke
+    
+    def accept_AssignNode(self, node):
+        expr = self.accept(node.expr)
+        variable = self.accept(node.variable)
+        
+        def assign():
+            variable(expr())
+            
+        return assign
+        
+    def accept_StringBodyNode(self, node):
+        values = [self.accept(value) for value in node.values]
+        
+        def string_body():
+            return ''.join([value() for value in values])
+            
+        return string_body
+    
+    def accept_StringValueNode(self, node):
+        s = node.value
+        s = s.replace('\\n', '\n')
+        s = s.replace('\\t', '\t')
+        
+        return lambda: s
+        
+    def accept_IntegerValueNode(self, node):
+        try:
+            i = int(node.value)
+        except ValueError:
+            return lambda: int(node.value)
+        
+        return lambda: i
+        
+    def accept_RealValueNode(self, node):
+        try:
+            r = float(node.value)
+        except ValueError:
+            return lambda: float(node.value)
+        
+        return lambda: r
+        
+    def accept_ConstantNode(self, node):
+        value = node.value
+        
+        return lambda: value
+        
+    def accept_VariableAccessNode(self, node):
+        return self.load(node.name)
+    
+    def accept_VariableAssignmentNode(self, node):
+        return self.store(node.name)
+        
+    def accept_FieldAccessNode(self, node):
+        variable = self.accept(node.variable)
+        field = node.field
+        
+        return lambda: getattr(variable(), field)
+    
+    def accept_FieldAssignmentNode(self, node):
+        variable = self.accept(node.variable)
+        field = node.field
+        
+        set_attribute = self.runtime.set_attribute
+        
+        return lambda value: set_attribute(variable(), field, value)
+        
+    def accept_SubstitutionVariableNode(self, node):
+        expr = self.accept(node.expr)
+        pipeline = self.runtime.format_pipeline(node.formats)
+        
+        return lambda: pipeline('%s' % expr())
+    
+    def accept_SubstitutionNavigationNode(self, node):
+        variable = self.accept(node.variable)
+        navigations = [(node.navigation.key_letter,
+                        node.navigation.relation.rel_id,
+                        node.navigation.relation.phrase)]
+        rt = self.runtime
+        
+        def substitution_navigation():
+            inst_set = rt.navigate(variable(), navigations)
+            return rt.select_any_in(inst_set, lambda selected: True)
+        
+        return substitution_navigation
+    
+    def accept_ParseKeywordNode(self, node):
+        keyword = self.accept(node.keyword)
+        expr = self.accept(node.expr)
+        parse_keyword = self.runtime.parse_keyword
+        
+        def parse_keyword_value():
+            kw = keyword()
+            return parse_keyword(expr(), kw)
+        
+        return parse_keyword_value
+    
+    def accept_PrintNode(self, node):
+        value = self.accept(node.value_list)
+        
+        return lambda: self.runtime.invoke_print(value())
+
+    def accept_ExitNode(self, node):
+        return_code = self.accept(node.return_code)
+        
+        return lambda: self.runtime.invoke_exit(return_code())
+        
+    def accept_IfNode(self, node):
+        if (isinstance(node.cond, ast.ConstantNode) and
+            not node.elif_list.elifs):
+            if node.cond.value:
+                return self.block(node, self.accept(node.iftrue))
+            else:
+                return self.block(node, self.accept(node.iffalse))
+            
+        cond = self.accept(node.cond)
+        iftrue = self.accept(node.iftrue)
+        elifs = [(self.accept(el.cond), self.accept(el.statement_list))
+                 for el in node.elif_list.elifs]
+        iffalse = self.accept(node.iffalse)
+        
+        def if_statement():
+            if cond():
+                iftrue()
+            else:
+                for elif_cond, elif_statement_list in elifs:
+                    if elif_cond():
+                        elif_statement_list()
+                        break
+                else:
+                    iffalse()
+        
+        return self.block(node, if_statement)
+    
+    def accept_WhileNode(self, node):
+        cond = self.accept(node.cond)
+        statement_list = self.accept(node.statement_list)
+        
+        def while_statement():
+            try:
+                while cond():
+                    statement_list()
+            except BreakException:
+                pass
+                
+        return self.block(node, while_statement)
+        
+    def accept_ForNode(self, node):
+        load_set = self.load(node.set_name)
+        store = self.store(node.variable_name)
+        statement_list = self.accept(node.statement_list)
+        st = self.symtab
+        
+        def for_statement():
+            st.enter_block()
+            try:
+                handle = load_set()
+                iterator_name = '_%d' % id(handle)
+                for value in iter(handle):
+                    st.install_symbol(iterator_name, value)
+                    store(value)
+                    statement_list()
+            except BreakException:
+                pass
+            finally:
+                st.leave_block()
+                
+        if node.parallel:
+            return self.parallel_for(node)
+        
+        return self.clear_slots(node, for_statement)
+    
+    def parallel_for(self, node):
+        '''
+        Compile a loop whose iterations may be evaluated in parallel. Each
+        iteration is evaluated in a block of its own, and with an output
+        buffer of its own when evaluated in a separate process.
+        '''
+        error = parallel_loop_error(node, self.includes, self.runtime.cache_dir)
+        if error:
+            def refuse():
+                raise runtime.RuntimeException(error)
+            
+            return refuse
+        
+        names = loop_assignments(node, self.includes, self.runtime.cache_dir)
+        loads = [self.load(name) for name in names]
+        load_set = self.load(node.set_name)
+        store = self.store(node.variable_name)
+        statement_list = self.block(node.statement_list,
+                                    self.accept(node.statement_list))
+        rt = self.runtime
+        st = self.symtab
+        
+        def parallel_for_statement():
+            # assignments to outer variables are lost in forked processes
+            for name, load in zip(names, loads):
+                try:
+                    load()
+                except symtab.SymtabException:
+                    continue
+                
+                raise outer_assignment_error(name)
+            
+            st.enter_block()
+            try:
+                handle = load_set()
+                iterator_name = '_%d' % id(handle)
+                values = list(handle)
+                
+                def iteration(index):
+                    st.install_symbol(iterator_name, values[index])
+                    store(values[index])
+                    statement_list()
+                
+                parallel.evaluate_loop(rt, iteration, len(values))
+            finally:
+                st.leave_block()
+                
+        return self.clear_slots(node, parallel_for_statement)
+
+    def accept_BreakNode(self, node):
+        def break_statement():
+            raise BreakException()
+        
+        return break_statement
+
+    def accept_BinaryOpNode(self, node):
+        sign = node.sign
+        op = BINARY_OPERATORS[sign]
+        left = self.accept(node.left)
+        right = self.accept(node.right)
+        set_op = sign in ['|', '&', '^']
+        set_operator = SET_OPERATORS.get(sign, op)
+        is_set = self.runtime.is_set
+        is_instance = self.runtime.is_instance
+        cast_to_set = self.runtime.cast_to_set
+        
+        def binary_operation():
+            lhs = left()
+            
+            if sign == 'or' and lhs == True:
+                return True
+            elif sign == 'and' and lhs == False:
+                return False
+
+            rhs = right()
+            
+            if set_op and is_instance(lhs):
+                lhs = cast_to_set(lhs)
+            
+            if is_set(lhs):
+                rhs = cast_to_set(rhs)
+
+            if is_set(rhs):
+                lhs = cast_to_set(lhs)
+                return set_operator(lhs, rhs)
+            
+            return op(lhs, rhs)
+        
+        return binary_operation
+    
+    def accept_UnaryOpNode(self, node):
+        rt = self.runtime
+        find_symbol = self.symtab.find_symbol
+        ops = {
+            '-':           lambda value:-value,
+            'not':         lambda value: not value,
+            'cardinality': lambda value: rt.cardinality(value),
+            'empty':       lambda value: rt.empty(value),
+            'first':       lambda value: rt.first(find_symbol('_%d' % id(value)), value),
+            'last':        lambda value: rt.last(find_symbol('_%d' % id(value)), value),
+            'not_empty':   lambda value: rt.not_empty(value),
+            'not_first':   lambda value: rt.not_first(find_symbol('_%d' % id(value)), value),
+            'not_last':    lambda value: rt.not_last(find_symbol('_%d' % id(value)), value),
+        }
+        op = ops[node.sign]
+        value = self.accept(node.value)
+        
+        return lambda: op(value())
+    
+    def accept_LiteralNode(self, node):
+        s = node.value
+        
+        return lambda: s
+    
+    def accept_LiteralListNode(self, node):
+        rt = self.runtime
+        buffer_literal = rt.buffer_literal
+        
+        if all(isinstance(literal, ast.LiteralNode) for literal in node.literals):
+            s = ''.join([literal.value for literal in node.literals])
+            if node.resolved:
+                return lambda: rt.buffer.write(s)
+            
+            return lambda: buffer_literal(s)
+        
+        literals = [self.accept(literal) for literal in node.literals]
+        if node.resolved:
+            def resolved_literal_list():
+                write = rt.buffer.write
+                for literal in literals:
+                    write(literal())
+                    
+            return resolved_literal_list
+        
+        buffer_literals = self.runtime.buffer_literals
+        
+        def literal_list():
+            buffer_literals([literal() for literal in literals])
+            
+        return literal_list
+        
+    def accept_EmitNode(self, node):
+        emit_filename = self.accept(node.emit_filename)
+        
+        return lambda: self.runtime.emit_buffer(emit_filename())
+    
+    def accept_ClearNode(self, node):
+        return lambda: self.runtime.clear_buffer()
+            
+    def accept_IncludeNode(self, node):
+        inc_filename = self.accept(node.inc_filename)
+        callstack = self.callstack
+        
+        def include():
+            filename = inc_filename()
+            root = load_include(self.runtime, self.includes, filename)
+            fn = self.compile(root)
+            if self.runtime.profiler:
+                fn = self.runtime.profiler.unit(root.filename, 1,
+                                                root.filename, 'include', fn)
+            
+            callstack.append(node)
+            fn()
+            callstack.pop()
+            
+        return include
+        
+    def accept_CreateNode(self, node):
+        key_letter = node.key_letter
+        store = self.store(node.variable_name)
+        
+        def create():
+            inst = self.runtime.new(key_letter)
+            store(inst)
+            
+        return create
+        
+    def index_lookup(self, node):
+        '''
+        Compile a query for instances of a class from attribute indexes, based
+        on equality terms in the where clause of a select statement. The
+        query returns the candidate instances, or None if the indexes are
+        unable to answer it. Terms that are not answered by the indexes are
+        compiled into a residual where clause.
+        '''
+        if node.where is None or node.where.expr is None:
+            return None, None
+        
+        terms, rest = split_where(node.where.expr)
+        if not terms:
+            return None, None
+        
+        key_letter = node.key_letter
+        attributes = tuple([name for name, _ in terms])
+        values = [self.accept(expr) for _, expr in terms]
+        residual = self.where([self.accept(expr) for expr in rest])
+        index = self.runtime.index
+        
+        def lookup():
+            try:
+                keys = tuple([value() for value in values])
+                return index.lookup(key_letter, attributes, keys)
+            except Exception:
+                # fallback to a full scan, which reports any errors
+                return None
+            
+        return lookup, residual
+        
+    def accept_SelectAnyInstanceNode(self, node):
+        key_letter = node.key_letter
+        store = self.store(node.variable_name)
+        where = self.accept(node.where)
+        lookup, residual = self.index_lookup(node)
+        rt = self.runtime
+        
+        def select_any_instance():
+            inst_set = lookup and lookup()
+            if inst_set is None:
+                value = rt.select_any_from(key_letter, where)
+            else:
+                value = rt.select_any_in(inst_set, residual)
+            store(value)
+            
+        return select_any_instance
+        
+    def accept_SelectManyInstanceNode(self, node):
+        key_letter = node.key_letter
+        store = self.store(node.variable_name)
+        where = self.accept(node.where)
+        order_by = self.accept(node.order_by)
+        lookup, residual = self.index_lookup(node)
+        rt = self.runtime
+        
+        def select_many_instance():
+            inst_set = lookup and lookup()
+            if inst_set is None:
+                value = rt.select_many_from(key_letter, where, order_by)
+            else:
+                value = rt.select_many_in(inst_set, residual, order_by)
+            store(value)
+            
+        return select_many_instance
 
+    def accept_SelectOneNode(self, node):
+        store = self.store(node.variable_name)
+        instance_chain = self.accept(node.instance_chain)
+        where = self.accept(node.where)
+        
+        def select_one():
+            inst_set = iter(instance_chain())
+            value = self.runtime.select_one_in(inst_set, where)
+            store(value)
+            
+        return select_one
+
+    def accept_SelectAnyNode(self, node):
+        store = self.store(node.variable_name)
+        instance_chain = self.accept(node.instance_chain)
+        where = self.accept(node.where)
+        
+        def select_any():
+            inst_set = iter(instance_chain())
+            value = self.runtime.select_any_in(inst_set, where)
+            store(value)
+            
+        return select_any
+        
+    def accept_SelectManyNode(self, node):
+        store = self.store(node.variable_name)
+        instance_chain = self.accept(node.instance_chain)
+        where = self.accept(node.where)
+        order_by = self.accept(node.order_by)
+        
+        def select_many():
+            inst_set = iter(instance_chain())
+            value = self.runtime.select_many_in(inst_set, where, order_by)
+            store(value)
+            
+        return select_many
+
+    def accept_WhereNode(self, node):
+        if node.expr is None:
+            return self.where([])
         
-def evaluate(rt, ast, includes):
-    w = EvalWalker(rt, includes)
-    return w.accept(ast)
+        return self.where([self.accept(node.expr)])
+    
+    def where(self, exprs):
+        '''
+        Compile a where clause from a conjunction of compiled expressions.
+        '''
+        if not exprs:
+            return lambda selected: True
+        
+        elif len(exprs) == 1:
+            expr = exprs[0]
+            
+        else:
+            def expr():
+                for e in exprs:
+                    value = e()
+                    if not value:
+                        return value
+                    
+                return value
+            
+        st = self.symtab
+        
+        def where(selected):
+            st.enter_block()
+            st.install_symbol('selected', selected)
+            value = expr()
+            st.leave_block()
+            
+            return value
+            
+        return where
+
+    def accept_OrderByNode(self, node):
+        if not len(node.attributes):
+            return None
+        
+        elif node.reverse:
+            return xtuml.reverse_order_by(*node.attributes)
+        
+        else:
+            return xtuml.order_by(*node.attributes)
+        
+    def accept_InstanceChainNode(self, node):
+        variable = self.accept(node.variable)
+        navigations = [(nav.key_letter, nav.relation.rel_id, nav.relation.phrase)
+                       for nav in node.navigations]
+        navigate = self.runtime.navigate
+        
+        return lambda: navigate(variable(), navigations)
+    
+    def accept_RelateNode(self, node):
+        load_from = self.load(node.from_variable_name)
+        load_to = self.load(node.to_variable_name)
+        
+        def relate():
+            from_inst = load_from()
+            to_inst = load_to()
+            self.runtime.relate(from_inst, to_inst, node.rel_id, node.phrase)
+        
+        return relate
+        
+    def accept_RelateUsingNode(self, node):
+        load_from = self.load(node.from_variable_name)
+        load_to = self.load(node.to_variable_name)
+        load_using = self.load(node.using_variable_name)
+        
+        def relate_using():
+            from_inst = load_from()
+            to_inst = load_to()
+            using_inst = load_using()
+            self.runtime.relate(from_inst, using_inst, node.rel_id, node.phrase)
+            self.runtime.relate(using_inst, to_inst, node.rel_id, node.phrase)
+            
+        return relate_using
+        
+    def accept_UnrelateNode(self, node):
+        load_from = self.load(node.from_variable_name)
+        load_to = self.load(node.to_variable_name)
+        
+        def unrelate():
+            from_inst = load_from()
+            to_inst = load_to()
+            self.runtime.unrelate(from_inst, to_inst, node.rel_id, node.phrase)
+            
+        return unrelate
+        
+    def accept_UnrelateUsingNode(self, node):
+        load_from = self.load(node.from_variable_name)
+        load_to = self.load(node.to_variable_name)
+        load_using = self.load(node.using_variable_name)
+        
+        def unrelate_using():
+            from_inst = load_from()
+            to_inst = load_to()
+            using_inst = load_using()
+            self.runtime.unrelate(from_inst, using_inst, node.rel_id, node.phrase)
+            self.runtime.unrelate(using_inst, to_inst, node.rel_id, node.phrase)
+            
+        return unrelate_using
+        
+    def accept_DeleteNode(self, node):
+        load = self.load(node.variable_name)
+        
+        def delete():
+            inst = load()
+            self.runtime.delete(inst)
+            
+        return delete
+
+        
+def evaluate(rt, ast, includes, compiled=True):
+    '''
+    Evaluate a syntax tree. By default, the tree is compiled into python
+    closures before being executed. Set *compiled* to False to evaluate the
+    tree by walking it instead, which is never profiled.
+    '''
+    # the model may have been modified since the previous evaluation
+    rt.index.invalidate()
+    rt.navigations.clear()
+    rt.invalidate_memos()
+    
+    if rt.optimize:
+        ast = optimize.optimize(ast)
     
+    if compiled:
+        w = CompileWalker(rt, includes)
+        fn = w.compile(ast)
+        if rt.profiler:
+            fn = rt.profiler.unit(ast.filename, 1, ast.filename, 'archetype',
+                                  fn)
+        return fn()
+    else:
+        w = EvalWalker(rt, includes)
+        return w.accept(ast)
@@ -6,17 +6,27 @@ rule-specification language (RSL) interpreter.
 '''
 
 import sys
+import time
 import logging
 import os
 import xtuml
 
 import rsl.version
+import rsl.dump
+import rsl.loader
+import rsl.snapshot
+import rsl.profiler
+import rsl.parallel
+import rsl.include
  
 
+logger = logging.getLogger(__name__)
+
+
 complete_usage = '''
 USAGE: 
 
-   %s  [-arch <string>] ... [-import <string>] ... [-include <string>] ... [-d <integer>] ... [-diff <string>] [-emit <string>] [-priority <integer>] [-lVHs] [-lSCs] [-l2b] [-l2s] [-l3b] [-l3s] [-nopersist] [-dumpsql <file>] [-force] [-integrity] [-e <string>] [-t <string>] [-v <string>] [-qim] [-q] [-l] [-f <string>] [-# <integer>] [//] [-version] [-h]
+   %s  [-arch <string>] ... [-import <string>] ... [-include <string>] ... [-d <integer>] ... [-diff <string>] [-emit <string>] [-priority <integer>] [-lVHs] [-lSCs] [-l2b] [-l2s] [-l3b] [-l3s] [-nopersist] [-dumpsql <file>] [-dumpsqlclass <string>] ... [-dumpsnapshot <file>] [-cache <dir>] [-emitthreads <integer>] [-profile <file>] [-memoize <string>] ... [-jobs <integer>] [-parallelemit] [-nonavcache] [-nooptimize] [-preload] [-force] [-integrity] [-e <string>] [-t <string>] [-v <string>] [-qim] [-q] [-l] [-f <string>] [-# <integer>] [//] [-version] [-h]
 
 
 Where: 
@@ -83,7 +93,40 @@ Where:
      Disable persistence
 
    -dumpsql <file>
-     (value required)  Dump the instance population as SQL insert statements
+     (value required)  Dump the instance population as SQL insert statements, compressed using gzip if the file name ends with .gz
+
+   -dumpsqlclass <string>  (accepted multiple times)
+     (value required)  Limit the -dumpsql output to instances of a class
+
+   -dumpsnapshot <file>
+     (value required)  Dump the metamodel as a binary snapshot, which may be loaded faster than SQL using -f
+
+   -cache <dir>
+     (value required)  Cache parsed archetypes in a directory
+
+   -emitthreads <integer>
+     (value required)  Write emitted files in the background using a number of threads
+
+   -profile <file>
+     (value required)  Profile the archetypes, and save the result in callgrind (or pstats if the file name ends with .prof) format
+
+   -memoize <string>  (accepted multiple times)
+     (value required)  Name of a pure function whose results may be reused until the model is modified
+
+   -jobs <integer>
+     (value required)  Evaluate archetypes that neither modify the model nor emit files, and .parallel for each loops that do not modify the model, using a number of processes
+
+   -parallelemit
+     Let -jobs evaluate archetypes that emit files or invoke bridges in parallel, when no archetype depends on files written by another one
+
+   -nonavcache
+     Disable caching of navigations, e.g. when bridges modify the model without the interpreter noticing
+
+   -nooptimize
+     Disable folding of constant expressions and removal of dead branches in archetypes, e.g. when debugging
+
+   -preload
+     Parse files included by archetypes with constant filenames before evaluating them, using the number of processes given by -jobs
 
    -force
      make read-only emit files writable
@@ -110,7 +153,7 @@ Where:
      Use log file
 
    -f <string>
-     (value required)  Generated file name (database)
+     (value required)  Generated file name (database), in SQL or binary snapshot format
 
    -# <integer>
      (value required)  Number of files to generate
@@ -130,7 +173,7 @@ Where:
 
 brief_usage = '''
 Brief USAGE: 
-   %s  [-arch <string>] ... [-import <string>] ... [-include <string>] ... [-d <integer>] ... [-diff <string>] [-emit <string>] [-priority <integer>] [-lVHs] [-lSCs] [-l2b] [-l2s] [-l3b] [-l3s] [-nopersist] [-dumpsql <file>] [-force] [-integrity] [-e <string>] [-t <string>] [-v <string>] [-qim] [-q] [-l] [-f <string>] [-# <integer>] [//] [-version] [-h]
+   %s  [-arch <string>] ... [-import <string>] ... [-include <string>] ... [-d <integer>] ... [-diff <string>] [-emit <string>] [-priority <integer>] [-lVHs] [-lSCs] [-l2b] [-l2s] [-l3b] [-l3s] [-nopersist] [-dumpsql <file>] [-dumpsqlclass <string>] ... [-dumpsnapshot <file>] [-cache <dir>] [-emitthreads <integer>] [-profile <file>] [-memoize <string>] ... [-jobs <integer>] [-parallelemit] [-nonavcache] [-nooptimize] [-preload] [-force] [-integrity] [-e <string>] [-t <string>] [-v <string>] [-qim] [-q] [-l] [-f <string>] [-# <integer>] [//] [-version] [-h]
 
 For complete USAGE and HELP type: 
    %s -h
@@ -142,6 +185,17 @@ def main(argv=None):
     database_filename = 'mcdbms.gen'
     enable_persistance = True
     dump_sql_file = ''
+    dump_sql_classes = list()
+    dump_snapshot_file = ''
+    cache_dir = None
+    emit_threads = 0
+    profile_filename = None
+    memoized = list()
+    num_jobs = 1
+    parallel_emit = False
+    navigation_cache = True
+    optimize = True
+    preload = False
     force_overwrite = False
     emit_when = 'change'
     diff_filename = None
@@ -190,6 +244,46 @@ def main(argv=None):
             i += 1
             dump_sql_file = argv[i]
 
+        elif argv[i] == '-dumpsqlclass':
+            i += 1
+            dump_sql_classes.append(argv[i])
+
+        elif argv[i] == '-dumpsnapshot':
+            i += 1
+            dump_snapshot_file = argv[i]
+
+        elif argv[i] == '-cache':
+            i += 1
+            cache_dir = argv[i]
+
+        elif argv[i] == '-emitthreads':
+            i += 1
+            emit_threads = int(argv[i])
+
+        elif argv[i] == '-profile':
+            i += 1
+            profile_filename = argv[i]
+
+        elif argv[i] == '-memoize':
+            i += 1
+            memoized.append(argv[i])
+
+        elif argv[i] == '-jobs':
+            i += 1
+            num_jobs = int(argv[i])
+
+        elif argv[i] == '-parallelemit':
+            parallel_emit = True
+
+        elif argv[i] == '-nonavcache':
+            navigation_cache = False
+
+        elif argv[i] == '-nooptimize':
+            optimize = False
+
+        elif argv[i] == '-preload':
+            preload = True
+
         elif argv[i] == '-v':
             i += 1
             loglevel = logging.DEBUG
@@ -229,7 +323,7 @@ def main(argv=None):
     
     id_generator = xtuml.IntegerGenerator()
     metamodel = xtuml.MetaModel(id_generator)
-    loader = xtuml.ModelLoader()
+    loader = rsl.loader.IncrementalLoader()
     
     if quiet_insert_mismatch:
         load_logger = logging.getLogger(xtuml.load.__name__)
@@ -240,34 +334,178 @@ def main(argv=None):
             f.write(' '.join(argv))
             f.write('\n')
             
-    if enable_persistance and os.path.isfile(database_filename):
-        loader.filename_input(database_filename)
+    manifest = None
+    if enable_persistance:
+        manifest = rsl.runtime.EmitManifest(database_filename + '.manifest')
+        
+    def load(filename):
+        t = time.time()
+        loader.filename_input(filename)
+        logger.debug('Loaded %s in %.3f s', filename, time.time() - t)
+
+    def populate():
+        t = time.time()
+        count = loader.populate(metamodel)
+        if count:
+            logger.debug('Populated %d statements in %.3f s', count,
+                         time.time() - t)
+        
+    # keep track of changes to the model, so that persistence may be skipped
+    # when nothing changed
+    modified = set()
+    imported = False
+    loaded = enable_persistance and os.path.isfile(database_filename)
+    snapshot = False
+    segments = None
+    if loaded:
+        snapshot = rsl.snapshot.is_snapshot(database_filename)
+        if snapshot:
+            t = time.time()
+            segments = rsl.snapshot.load(metamodel, database_filename)
+            logger.debug('Loaded %s in %.3f s', database_filename,
+                         time.time() - t)
+        else:
+            load(database_filename)
+        
+    writer = None
+    if emit_threads > 0:
+        writer = rsl.runtime.EmitWriter(emit_threads)
         
-    for filename, kind in inputs:
-        if kind == 'sql':
-            loader.filename_input(filename)
+    profiler = None
+    if profile_filename:
+        profiler = rsl.profiler.Profiler()
+        
+    parallel = num_jobs > 1 and rsl.parallel.can_fork() and not profiler
+    pending = list()
+    
+    # files included by several archetypes are only parsed once
+    include_cache = dict()
+    include_paths = dict()
+    
+    def make_runtime(writer=None, profiler=None):
+        rt = rsl.Runtime(metamodel, emit_when, force_overwrite, diff_filename,
+                         cache_dir, manifest, writer, profiler)
+        rt.include_cache = include_cache
+        rt.include_paths = include_paths
+        rt.jobs = num_jobs
+        rt.navigation_cache = navigation_cache
+        rt.optimize = optimize
+        for name in memoized:
+            rt.memoize(name)
             
-        elif kind == 'arc':
-            loader.populate(metamodel)
-            rt = rsl.Runtime(metamodel, emit_when, force_overwrite, diff_filename)
-            ast = rsl.parse_file(filename)
-            rsl.evaluate(rt, ast, includes)
-            loader = xtuml.ModelLoader()
+        return rt
+    
+    def evaluate(filename, ast):
+        rt = make_runtime(writer, profiler)
+        rsl.evaluate(rt, ast, includes)
+        modified.update(rt.modified)
+        if navigation_cache:
+            logger.debug('Navigation cache of %s: %s', filename,
+                         rt.navigations)
+        for memo in rt.memos.values():
+            logger.info('Memoized %s', memo)
+    
+    def evaluate_pending():
+        if len(pending) > 1:
+            if writer:
+                writer.flush()
+            rsl.parallel.evaluate_archetypes(make_runtime, pending, includes,
+                                             num_jobs, diff_filename,
+                                             manifest)
+        elif pending:
+            evaluate(*pending[0])
             
-        else:
-            #should not happen
-            print("Unknown %s is of unknown kind '%s', skipping it" % (filename, kind))
+        del pending[:]
+        
+    try:
+        for filename, kind in inputs:
+            if kind == 'sql':
+                evaluate_pending()
+                load(filename)
+                imported = True
+                
+            elif kind == 'arc':
+                populate()
+                ast = rsl.parse_file(filename, cache_dir)
+                if preload:
+                    if writer and num_jobs > 1:
+                        writer.flush()
+                    t = time.time()
+                    rsl.include.preload(make_runtime(), ast, includes,
+                                        num_jobs)
+                    logger.debug('Preloaded includes of %s in %.3f s',
+                                 filename, time.time() - t)
+                    
+                if not parallel:
+                    evaluate(filename, ast)
+                    continue
+                
+                # archetypes that emit files are evaluated in order, since
+                # later archetypes may include or read those files
+                if parallel_emit:
+                    effects = rsl.lint.find_mutations(ast, includes,
+                                                      cache_dir)
+                else:
+                    effects = rsl.lint.find_side_effects(ast, includes,
+                                                         cache_dir)
+                if not effects:
+                    pending.append((filename, ast))
+                    continue
+                
+                logger.debug('%s:%d may modify the model or have side '
+                             'effects, evaluating %s sequentially',
+                             effects[0].filename, effects[0].lineno, filename)
+                evaluate_pending()
+                evaluate(filename, ast)
+                
+            else:
+                #should not happen
+                print("Unknown %s is of unknown kind '%s', skipping it" % (filename, kind))
+                
+        evaluate_pending()
+    finally:
+        # wait for all files to be written before persisting the database
+        if writer:
+            try:
+                writer.close()
+            except Exception as e:
+                sys.exit(e)
+
+        if profiler:
+            profiler.save(profile_filename)
+            profiler.report()
+
+        if cache_dir:
+            try:
+                rsl.parse.prune_cache(cache_dir)
+            except OSError as e:
+                logger.warning('unable to prune %s: %s', cache_dir, e)
 
     errors = 0
     if check_integrity:
         errors += xtuml.check_association_integrity(metamodel)
         errors += xtuml.check_uniqueness_constraint(metamodel)
         
-    if enable_persistance:
+    if enable_persistance and loaded and not (imported or modified):
+        logger.info('Database %s is unchanged, skipping persistence',
+                    database_filename)
+        manifest.save()
+        
+    elif enable_persistance and snapshot:
+        if imported:
+            segments = None
+        rsl.snapshot.save(metamodel, database_filename, segments, modified)
+        manifest.save()
+        
+    elif enable_persistance:
         xtuml.persist_database(metamodel, database_filename)
+        manifest.save()
 
     if dump_sql_file != '':
-        xtuml.persist_instances(metamodel, dump_sql_file)
+        rsl.dump.dump_instances(metamodel, dump_sql_file, dump_sql_classes)
+
+    if dump_snapshot_file != '':
+        rsl.snapshot.save(metamodel, dump_snapshot_file)
 
     return errors
 
@@ -0,0 +1,197 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Resolution and loading of files referenced by include statements. The path
+that an include statement resolves to is cached per folder of the including
+file, and parsed files are cached per absolute path for as long as their
+modification time is unchanged. Optionally, files that are included with a
+constant filename may be discovered and parsed before an archetype is
+evaluated, using a pool of processes.
+'''
+
+
+import os
+import logging
+from functools import partial
+
+from . import ast
+from . import parse
+from . import optimize
+from . import parallel
+
+
+logger = logging.getLogger(__name__)
+
+
+def constant_filename(node):
+    '''
+    Obtain the filename of an include statement if it is a string constant,
+    otherwise None.
+    '''
+    expr = node.inc_filename
+    if isinstance(expr, ast.ConstantNode):
+        return expr.value
+
+    if all(isinstance(value, ast.StringValueNode) for value in expr.values):
+        return ''.join(value.value for value in expr.values)
+
+
+def candidate_paths(includes, folder, filename):
+    '''
+    Obtain the paths where a file referenced by an include statement is
+    searched for, in the *folder* of the including file followed by the
+    *includes* folders.
+    '''
+    if os.path.isabs(filename):
+        return [filename]
+
+    return ['%s/%s' % (path, filename)
+            for path in [folder] + list(includes) if path]
+
+
+def search_path(includes, folder, filename):
+    '''
+    Search for a file referenced by an include statement. The absolute path
+    of the file is returned, or None if it cannot be found.
+    '''
+    for path in candidate_paths(includes, folder, filename):
+        if os.path.exists(path):
+            return os.path.abspath(path)
+
+
+def resolve_path(rt, includes, folder, filename):
+    '''
+    Resolve the absolute path of a file referenced by an include statement,
+    and cache it in the runtime.
+    '''
+    key = (folder, filename)
+    path = rt.include_paths.get(key)
+    if path is None:
+        path = search_path(includes, folder, filename)
+        if path is not None:
+            rt.include_paths[key] = path
+
+    return path
+
+
+def store(rt, path, mtime, root):
+    if rt.optimize:
+        root = optimize.optimize(root)
+
+    rt.include_cache[path] = (mtime, root)
+    return root
+
+
+def load_path(rt, path):
+    '''
+    Load a parsed file from the cache of the runtime, unless it has been
+    modified since it was cached. Raises OSError if the file does not exist.
+    '''
+    mtime = os.stat(path).st_mtime
+    entry = rt.include_cache.get(path)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+
+    root = parse.parse_file(path, rt.cache_dir)
+    return store(rt, path, mtime, root)
+
+
+def load_include(rt, includes, folder, filename):
+    '''
+    Locate and parse a file referenced by an include statement in a file that
+    is located in some *folder*.
+    '''
+    if rt.writer is not None:
+        # the file may have been emitted, but not yet written
+        for path in candidate_paths(includes, folder, filename):
+            rt.writer.wait(path)
+
+    path = resolve_path(rt, includes, folder, filename)
+    if path is not None:
+        try:
+            return load_path(rt, path)
+        except OSError:
+            # the file has been removed since its path was resolved
+            del rt.include_paths[(folder, filename)]
+
+        path = resolve_path(rt, includes, folder, filename)
+
+    if path is None:
+        raise Exception("unable to find '%s'" % filename)
+
+    return load_path(rt, path)
+
+
+def find_includes(rt, root, includes):
+    '''
+    Find the absolute paths of files that are included by a syntax tree with
+    constant filenames.
+    '''
+    paths = list()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        stack.extend(child for child in node.children
+                     if isinstance(child, ast.Node))
+        if not isinstance(node, ast.IncludeNode):
+            continue
+
+        filename = constant_filename(node)
+        if filename is None:
+            continue
+
+        folder = os.path.dirname(node.filename or '')
+        path = resolve_path(rt, includes, folder, filename)
+        if path is not None and path not in paths:
+            paths.append(path)
+
+    return paths
+
+
+def parse_job(paths, cache_dir, index):
+    try:
+        mtime = os.stat(paths[index]).st_mtime
+        return mtime, parse.parse_file(paths[index], cache_dir)
+    except Exception as e:
+        # reported if the file is actually included during evaluation
+        logger.debug('unable to preload %s: %s', paths[index], e)
+        return None, None
+
+
+def preload(rt, root, includes, num_processes=1):
+    '''
+    Discover the files that are included, directly or indirectly, by a
+    syntax tree with constant filenames, and parse them into the cache of
+    the runtime. Files on each level of the include graph are parsed in a
+    pool of *num_processes* processes. The number of parsed files is
+    returned.
+    '''
+    count = 0
+    visited = set()
+    paths = find_includes(rt, root, includes)
+    while paths:
+        pending = list()
+        for path in paths:
+            if path not in visited and path not in rt.include_cache:
+                visited.add(path)
+                pending.append(path)
+
+        fn = partial(parse_job, pending, rt.cache_dir)
+        if num_processes > 1 and len(pending) > 1:
+            results = parallel.map_forked(fn, len(pending), num_processes)
+        else:
+            results = [fn(index) for index in range(len(pending))]
+
+        found = list()
+        for path, (mtime, root) in zip(pending, results):
+            if root is None:
+                continue
+
+            found.extend(find_includes(rt, root, includes))
+            store(rt, path, mtime, root)
+            count += 1
+
+        paths = found
+
+    logger.debug('Preloaded %d included files', count)
+    return count
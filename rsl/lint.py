@@ -6,9 +6,11 @@ Simple linter for the rule-specification language (RSL).
 import optparse
 import logging
 import sys
+import os
 
 import xtuml
 import rsl
+import rsl.include
 
 
 logger = logging.getLogger('rsl.lint')
@@ -136,6 +138,136 @@ class Linter(xtuml.Visitor):
 
             prev = nav
 
+
+#: Descriptions of statements found by the MutationFinder.
+MUTATIONS = {'CreateNode': '.create',
+             'DeleteNode': '.delete',
+             'RelateNode': '.relate',
+             'RelateUsingNode': '.relate',
+             'UnrelateNode': '.unrelate',
+             'UnrelateUsingNode': '.unrelate',
+             'FieldAssignmentNode': 'attribute assignment',
+             'FieldAccessNode': 'info.unique_num',
+             'IncludeNode': '.include',
+             'InvokeNode': 'bridge invocation'}
+
+
+class MutationFinder(xtuml.Visitor):
+    '''
+    Find statements that may modify the model, including access to the
+    id generator of the model via info.unique_num, and invocations of
+    bridges that are not registered with modifies_model=False. Include
+    statements are followed when their filename is a string constant,
+    otherwise they are considered to modify the model.
+    '''
+    
+    def __init__(self, includes, cache_dir=None):
+        self.includes = includes
+        self.cache_dir = cache_dir
+        self.nodes = list()
+        self.visited = set()
+        
+    def enter_CreateNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_DeleteNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_RelateNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_RelateUsingNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_UnrelateNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_UnrelateUsingNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_FieldAssignmentNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_FieldAccessNode(self, node):
+        if node.field.lower() == 'unique_num':
+            self.nodes.append(node)
+
+    def enter_InvokeNode(self, node):
+        fn = rsl.Runtime.bridges.get(node.function_name)
+        if getattr(fn, 'modifies_model', False):
+            self.nodes.append(node)
+
+    def enter_IncludeNode(self, node):
+        filename = rsl.include.constant_filename(node)
+        if filename is None:
+            self.nodes.append(node)
+            return
+        
+        folder = os.path.dirname(node.filename)
+        path = rsl.include.search_path(self.includes, folder, filename)
+        if path is None:
+            self.nodes.append(node)
+            return
+        
+        if path not in self.visited:
+            self.visited.add(path)
+            root = rsl.parse.parse_file(path, self.cache_dir)
+            w = xtuml.Walker()
+            w.visitors.append(self)
+            w.accept(root)
+        
+
+def find_mutations(root, includes, cache_dir=None):
+    '''
+    Find statements in a syntax tree, and in files that it includes, that
+    may modify the model.
+    '''
+    w = xtuml.Walker()
+    finder = MutationFinder(includes, cache_dir)
+    w.visitors.append(finder)
+    w.accept(root)
+
+    return finder.nodes
+
+
+#: Bridges that neither write files nor affect the state of the process.
+READ_ONLY_BRIDGES = frozenset(['GET_ENV_VAR',
+                               'FILE_READ',
+                               'STRING_TO_INTEGER',
+                               'STRING_TO_REAL',
+                               'INTEGER_TO_STRING',
+                               'REAL_TO_STRING',
+                               'BOOLEAN_TO_STRING'])
+
+
+class SideEffectFinder(MutationFinder):
+    '''
+    Find statements that may modify the model, or that have side effects
+    that later archetypes may depend on, i.e. emitting files and invoking
+    bridges that may e.g. write files.
+    '''
+    
+    def enter_EmitNode(self, node):
+        self.nodes.append(node)
+        
+    def enter_InvokeNode(self, node):
+        name = node.function_name
+        if name in rsl.Runtime.bridges and name not in READ_ONLY_BRIDGES:
+            self.nodes.append(node)
+            
+
+def find_side_effects(root, includes, cache_dir=None):
+    '''
+    Find statements in a syntax tree, and in files that it includes, that
+    may modify the model or have other side effects.
+    '''
+    w = xtuml.Walker()
+    finder = SideEffectFinder(includes, cache_dir)
+    w.visitors.append(finder)
+    w.accept(root)
+
+    return finder.nodes
+
             
 def lint_ast(metamodel, root):
     w = xtuml.Walker()
@@ -0,0 +1,106 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Incremental loading of xtuml models. Data imported from several files may be
+populated into the same metamodel at different points in time, e.g. once per
+archetype on the command line, where each population only integrates the
+statements read since the previous one.
+'''
+
+
+import logging
+
+import xtuml
+
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalLoader(xtuml.ModelLoader):
+    '''
+    Model loader that discards its statements once they have been populated
+    into a metamodel, so that a subsequent population only integrates new
+    statements. Connections are only established from new instances, and
+    from instances of classes that are formalized by new associations.
+    '''
+
+    def populate(self, metamodel):
+        '''
+        Populate a *metamodel* with entities encountered from input since
+        the previous population, and return the number of statements that
+        were integrated.
+        '''
+        count = len(self.statements)
+        if not count:
+            return 0
+
+        num_associations = len(metamodel.associations)
+        self.populate_classes(metamodel)
+        self.populate_unique_identifiers(metamodel)
+        self.populate_associations(metamodel)
+
+        offsets = dict((metaclass, len(metaclass.storage))
+                       for metaclass in metamodel.metaclasses.values())
+        self.populate_instances(metamodel)
+
+        new_associations = metamodel.associations[num_associations:]
+        self.populate_new_connections(metamodel, offsets, new_associations)
+        del self.statements[:]
+
+        return count
+
+    @staticmethod
+    def populate_new_connections(metamodel, offsets, new_associations):
+        '''
+        Populate links from instances that were created after the storage
+        *offsets* were recorded, and from all instances that are formalized
+        by *new associations*.
+        '''
+        indices = dict()
+        formalized = set(ass.source_link.to_metaclass
+                         for ass in new_associations)
+        for ass in metamodel.associations:
+            source_class = ass.source_link.to_metaclass
+            target_class = ass.target_link.to_metaclass
+            if ass in new_associations:
+                sources = source_class.storage
+            else:
+                sources = source_class.storage[offsets.get(source_class, 0):]
+
+            if not sources:
+                continue
+
+            link_key = (target_class,
+                        frozenset(ass.source_link.key_map.values()))
+            if link_key not in indices:
+                index = indices[link_key] = dict()
+                for other_inst in target_class.storage:
+                    inst_key = ass.source_link.compute_index_key(other_inst)
+                    if inst_key is None:
+                        continue
+
+                    if inst_key not in index:
+                        index[inst_key] = xtuml.OrderedSet()
+
+                    index[inst_key].add(other_inst)
+
+            index = indices[link_key]
+            for inst in sources:
+                inst_key = ass.source_link.compute_lookup_key(inst)
+                if inst_key not in index:
+                    continue
+
+                for other_inst in index[inst_key]:
+                    ass.source_link.connect(other_inst, inst, check=False)
+                    ass.target_link.connect(inst, other_inst, check=False)
+
+        for metaclass in metamodel.metaclasses.values():
+            if metaclass in formalized:
+                instances = metaclass.storage
+            else:
+                instances = metaclass.storage[offsets.get(metaclass, 0):]
+
+            for inst in instances:
+                for attr in metaclass.referential_attributes:
+                    if attr in inst.__dict__:
+                        delattr(inst, attr)
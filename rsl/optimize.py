@@ -0,0 +1,239 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Optimization of syntax trees of the rule-specification language (RSL) before
+they are evaluated. Expressions that only depend on literal values are folded
+into constants, branches of if statements that are never taken are removed,
+and adjacent lines of literal text are merged into a single line. Trees are
+optimized in place.
+'''
+
+
+import xtuml
+
+import rsl.eval
+
+from . import ast
+from . import parse
+from . import resolve
+
+
+#: Unary operators that may be applied to constants.
+UNARY_OPERATORS = {
+    '-':   lambda value:-value,
+    'not': lambda value: not value,
+}
+
+#: Global symbols with constant values, unless declared by the tree.
+CONSTANT_SYMBOLS = {
+    'true': True,
+    'false': False,
+}
+
+
+class DeclarationCollector(resolve.SlotResolver):
+    '''
+    Collect names declared by statements in a tree, including in the bodies
+    of functions.
+    '''
+
+    def enter_FunctionNode(self, node):
+        pass
+
+    def leave_FunctionNode(self, node):
+        pass
+
+
+def is_literal_line(node):
+    return (isinstance(node, ast.LiteralListNode) and node.resolved and
+            all(isinstance(literal, ast.LiteralNode)
+                for literal in node.literals))
+
+
+class Optimizer(xtuml.Walker):
+    '''
+    Walk a tree and return an optimized version of each node, or None for
+    statements that may be removed. Fields of optimized nodes are assigned
+    lists, which are turned back into tuples when the tree is frozen.
+    '''
+
+    def __init__(self, declared=()):
+        xtuml.Walker.__init__(self)
+        self.constants = dict((name, value)
+                              for name, value in CONSTANT_SYMBOLS.items()
+                              if name not in declared)
+
+    def constant(self, node, value):
+        const = ast.ConstantNode(value)
+        const.filename = node.filename
+        const.lineno = node.lineno
+        return const
+
+    def default_accept(self, node):
+        for name in ast.node_fields(node.__class__):
+            value = getattr(node, name, None)
+            if isinstance(value, ast.Node):
+                setattr(node, name, self.accept(value))
+
+            elif isinstance(value, (list, tuple)):
+                setattr(node, name, [self.accept(item)
+                                     if isinstance(item, ast.Node) else item
+                                     for item in value])
+        return node
+
+    def accept_StatementListNode(self, node):
+        statements = list()
+        for stmt in node.statements:
+            stmt = self.accept(stmt)
+            if stmt is None:
+                continue
+
+            if (statements and is_literal_line(stmt) and
+                is_literal_line(statements[-1])):
+                stmt = self.merge_literals(statements.pop(), stmt)
+
+            statements.append(stmt)
+
+        node.statements = statements
+        return node
+
+    def merge_literals(self, first, second):
+        merged = ast.LiteralListNode()
+        merged.filename = first.filename
+        merged.lineno = first.lineno
+        merged.literals = list(first.literals) + list(second.literals)
+        merged.resolved = True
+        return parse.resolve_literals(merged)
+
+    def accept_LiteralListNode(self, node):
+        self.default_accept(node)
+        for index, literal in enumerate(node.literals):
+            if isinstance(literal, ast.ConstantNode):
+                node.literals[index] = ast.LiteralNode(literal.value)
+                node.literals[index].filename = literal.filename
+                node.literals[index].lineno = literal.lineno
+
+        return parse.resolve_literals(node)
+
+    def accept_IfNode(self, node):
+        self.default_accept(node)
+        branches = [(node.cond, node.iftrue, None)]
+        branches.extend((el.cond, el.statement_list, el)
+                        for el in node.elif_list.elifs)
+
+        live = list()
+        iffalse = node.iffalse
+        for cond, statement_list, el in branches:
+            if not isinstance(cond, ast.ConstantNode):
+                live.append((cond, statement_list, el))
+            elif cond.value:
+                # subsequent branches are never taken
+                iffalse = statement_list
+                break
+
+        if not live:
+            if not iffalse.statements:
+                return None
+
+            live.append((self.constant(node, True), iffalse, None))
+            iffalse = ast.StatementListNode()
+            iffalse.filename = node.filename
+            iffalse.lineno = node.lineno
+
+        node.cond, node.iftrue, _ = live[0]
+        node.elif_list.elifs = [el for _, _, el in live[1:]]
+        node.iffalse = iffalse
+        return node
+
+    def accept_StringValueNode(self, node):
+        s = node.value
+        s = s.replace('\\n', '\n')
+        s = s.replace('\\t', '\t')
+
+        return self.constant(node, s)
+
+    def accept_IntegerValueNode(self, node):
+        try:
+            return self.constant(node, int(node.value))
+        except ValueError:
+            return node
+
+    def accept_RealValueNode(self, node):
+        try:
+            return self.constant(node, float(node.value))
+        except ValueError:
+            return node
+
+    def accept_VariableAccessNode(self, node):
+        key = node.name.lower()
+        if key in self.constants:
+            return self.constant(node, self.constants[key])
+
+        return node
+
+    def accept_StringBodyNode(self, node):
+        self.default_accept(node)
+        if not all(isinstance(value, ast.ConstantNode)
+                   for value in node.values):
+            return node
+
+        try:
+            return self.constant(node, ''.join([value.value
+                                                for value in node.values]))
+        except TypeError:
+            return node
+
+    def accept_SubstitutionVariableNode(self, node):
+        self.default_accept(node)
+        if node.formats or not isinstance(node.expr, ast.ConstantNode):
+            return node
+
+        return self.constant(node, '%s' % node.expr.value)
+
+    def accept_BinaryOpNode(self, node):
+        self.default_accept(node)
+        if not isinstance(node.left, ast.ConstantNode):
+            return node
+
+        lhs = node.left.value
+        if node.sign == 'or' and lhs == True:
+            return self.constant(node, True)
+        elif node.sign == 'and' and lhs == False:
+            return self.constant(node, False)
+
+        if not isinstance(node.right, ast.ConstantNode):
+            return node
+
+        try:
+            value = rsl.eval.BINARY_OPERATORS[node.sign](lhs, node.right.value)
+        except Exception:
+            # leave errors to be reported when the expression is evaluated
+            return node
+
+        return self.constant(node, value)
+
+    def accept_UnaryOpNode(self, node):
+        self.default_accept(node)
+        if (node.sign not in UNARY_OPERATORS or
+            not isinstance(node.value, ast.ConstantNode)):
+            return node
+
+        try:
+            value = UNARY_OPERATORS[node.sign](node.value.value)
+        except Exception:
+            return node
+
+        return self.constant(node, value)
+
+
+def optimize(root):
+    '''
+    Optimize a tree in place, and return it.
+    '''
+    collector = DeclarationCollector()
+    w = xtuml.Walker()
+    w.visitors.append(collector)
+    w.accept(root)
+
+    w = Optimizer(collector.keys)
+    return ast.freeze(w.accept(root))
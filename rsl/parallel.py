@@ -0,0 +1,275 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Parallel evaluation of archetypes, and of iterations of loops, that leave
+the model unchanged. The work is distributed to a pool of processes that are
+forked once the model has been loaded, so that each process inherits a copy
+of the model. Output from the processes is collated in the original order.
+'''
+
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import traceback
+import multiprocessing
+from functools import partial
+
+try:
+    # python2
+    from StringIO import StringIO
+except ImportError:
+    # python3
+    from io import StringIO
+
+import rsl.eval
+import rsl.runtime
+
+
+logger = logging.getLogger(__name__)
+
+
+# the task to perform in forked processes, inherited when forking
+_task = None
+
+# set in forked processes, which may not fork a pool of their own
+_worker = False
+
+#: Estimated time, in seconds, spent forking a pool of processes and
+#: collating their results, which the iterations of a loop must amortize
+#: to be evaluated in parallel.
+POOL_OVERHEAD = 0.1
+
+
+def can_fork():
+    return hasattr(os, 'fork') and not _worker
+
+
+class Result(object):
+    '''
+    The outcome of a task performed in a forked process on behalf of a
+    runtime.
+    '''
+    exited = False
+    exit_code = None
+    mutated = False
+    output = ''
+    buffer = ''
+    diff = ''
+    manifest = None
+
+    def __init__(self, name):
+        self.name = name
+        self.manifest = dict()
+
+
+def run_isolated(rt, fn, result):
+    '''
+    Run a function on behalf of a runtime in a forked process. Output to
+    stdout, diffs and updates to the emit manifest are recorded in the
+    result, so that they may be collated by the parent process.
+    '''
+    writer = rt.writer
+    diff = rt.diff
+    mutations = rt.mutations
+    entries = dict(rt.manifest.entries) if rt.manifest else dict()
+
+    # threads do not survive forking, so emit synchronously
+    rt.writer = None
+    if diff:
+        fd, rt.diff = tempfile.mkstemp()
+        os.close(fd)
+
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        fn()
+    except SystemExit as e:
+        result.exited = True
+        if e.code is None or isinstance(e.code, int):
+            result.exit_code = e.code
+        else:
+            result.exit_code = str(e.code)
+    except Exception:
+        result.exited = True
+        result.exit_code = traceback.format_exc()
+    finally:
+        result.output = sys.stdout.getvalue()
+        sys.stdout = stdout
+
+    result.mutated = rt.mutations != mutations
+    if diff:
+        with open(rt.diff, 'r') as f:
+            result.diff = f.read()
+        os.remove(rt.diff)
+
+    if rt.manifest:
+        for path, entry in rt.manifest.entries.items():
+            if entries.get(path) != entry:
+                result.manifest[path] = entry
+
+    rt.writer = writer
+    rt.diff = diff
+
+
+def collate(result, diff=None, manifest=None):
+    '''
+    Collate the outcome of a task performed in a forked process.
+    '''
+    sys.stdout.write(result.output)
+    if diff and result.diff:
+        with open(diff, 'a') as f:
+            f.write(result.diff)
+
+    if manifest is not None:
+        manifest.entries.update(result.manifest)
+
+
+def run_task(index):
+    global _worker
+    _worker = True
+    return _task(index)
+
+
+def get_pool(num_processes):
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError:
+        context = multiprocessing
+
+    return context.Pool(num_processes)
+
+
+def map_forked(fn, count, num_processes):
+    '''
+    Call a function with each integer in range(count) in a pool of forked
+    processes, and return the results in order.
+    '''
+    global _task
+    if not can_fork():
+        return [fn(index) for index in range(count)]
+
+    _task = fn
+    pool = get_pool(num_processes)
+    try:
+        return pool.map(run_task, range(count), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _task = None
+
+
+def evaluate_job(make_runtime, includes, archetypes, index):
+    filename, ast = archetypes[index]
+    result = Result(filename)
+    rt = make_runtime()
+    run_isolated(rt, partial(rsl.eval.evaluate, rt, ast, includes), result)
+    return result
+
+
+def evaluate_archetypes(make_runtime, archetypes, includes, num_processes,
+                        diff=None, manifest=None):
+    '''
+    Evaluate a list of (filename, ast) pairs in a pool of processes, using
+    runtimes obtained from *make_runtime*. Archetypes that exit, e.g. due
+    to an error, are reported once all output has been collated, and the
+    first one to exit terminates the program like it would have done if
+    evaluated sequentially.
+    '''
+    archetypes = list(archetypes)
+    fn = partial(evaluate_job, make_runtime, includes, archetypes)
+    results = map_forked(fn, len(archetypes), num_processes)
+
+    exits = list()
+    for result in results:
+        collate(result, diff, manifest)
+        if result.mutated:
+            result.exited = True
+            result.exit_code = 'the model was modified'
+
+        if result.exited:
+            exits.append(result)
+
+    for result in exits:
+        if result.exit_code:
+            logger.error('%s exited with %s', result.name, result.exit_code)
+
+    if exits:
+        sys.exit(exits[0].exit_code)
+
+
+def iterate_job(rt, iteration, start, index):
+    index += start
+    result = Result('iteration %d' % index)
+    buffer = rt.buffer
+    rt.buffer = rsl.runtime.OutputBuffer()
+    try:
+        run_isolated(rt, partial(iteration, index), result)
+        result.buffer = rt.buffer.getvalue()
+    finally:
+        rt.buffer = buffer
+
+    return result
+
+
+def modified_error(name):
+    return rsl.runtime.RuntimeException('%s of a parallel loop modified the '
+                                        'model' % name)
+
+
+def evaluate_sequentially(rt, iteration, count, start=0):
+    '''
+    Evaluate iterations of a loop one at a time in the current process.
+    Like iterations evaluated in a pool of processes, they may not modify
+    the model.
+    '''
+    for index in range(start, start + count):
+        mutations = rt.mutations
+        iteration(index)
+        if rt.mutations != mutations:
+            raise modified_error('iteration %d' % index)
+
+
+def evaluate_iterations(rt, iteration, count, start=0):
+    '''
+    Evaluate iterations of a loop in a pool of rt.jobs processes, each
+    iteration with its own output buffer. The output is appended to the
+    buffer of the runtime in the order of the iterations.
+    '''
+    if rt.writer:
+        rt.writer.flush()
+
+    fn = partial(iterate_job, rt, iteration, start)
+    for result in map_forked(fn, count, rt.jobs):
+        collate(result, rt.diff, rt.manifest)
+        rt.buffer.write(result.buffer)
+        if result.exited:
+            sys.exit(result.exit_code)
+
+        if result.mutated:
+            raise modified_error(result.name)
+
+
+def evaluate_loop(rt, iteration, count):
+    '''
+    Evaluate the iterations of a parallel loop. The first iteration is
+    evaluated in the current process, and the remaining ones are evaluated
+    in a pool of rt.jobs processes only if the time that is estimated to be
+    saved exceeds the cost of forking the pool, e.g. not for small loops
+    nested in other loops.
+    '''
+    if not count:
+        return
+
+    t = time.time()
+    evaluate_sequentially(rt, iteration, 1)
+    elapsed = time.time() - t
+
+    remaining = count - 1
+    if (rt.jobs > 1 and remaining > 1 and can_fork() and
+        elapsed * remaining * (1 - 1.0 / rt.jobs) > POOL_OVERHEAD):
+        evaluate_iterations(rt, iteration, remaining, start=1)
+    else:
+        evaluate_sequentially(rt, iteration, remaining, start=1)
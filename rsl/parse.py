@@ -9,12 +9,20 @@ Heavily inspired by:
 
 
 import os
+import time
+import marshal
+import sys
 import logging
+import hashlib
+import tempfile
+import threading
 
 from ply import lex
 from ply import yacc
 
 from . import ast
+from . import runtime
+from . import version
 
 
 logger = logging.getLogger(__name__)
@@ -40,6 +48,7 @@ class RSLParser(object):
               'IF',
               'TO',
               'FOR',
+              'PARFOR',
               'TYPE',
               'RELATEDBY',
               'ELIF',
@@ -146,15 +155,26 @@ class RSLParser(object):
         with open(filename, 'rU') as f:
             return self.text_input(f.read(), filename)
     
+    def reset(self, filename=''):
+        '''
+        Reset the state of the lexer so that the parser may be reused for
+        another input.
+        '''
+        self.filename = filename
+        self.lexer.lineno = 1
+        self.lexer.lexstatestack = list()
+        self.lexer.begin('INITIAL')
+        
     def text_input(self, text, filename=''):
         logger.debug('parsing %s' % filename)
-        self.filename = filename
+        self.reset(filename)
         if not text: text = '\n'
         elif text[-1] != '\n': text += '\n'
         
-        return self.parser.parse(lexer=self.lexer, 
+        root = self.parser.parse(lexer=self.lexer, 
                                  input=text,
                                  tracking=1)
+        return ast.freeze(root)
     
     def t_literal_INITIAL_pc_control_NEWLINE(self, t):
         r"\n"
@@ -293,6 +313,12 @@ class RSLParser(object):
         t.lexer.begin('control')
         return t
     
+    def t_pc_PARFOR(self, t):
+        r"(?i)\.parallel[\s]+for[\s]+each"
+        t.endlexpos = t.lexpos + len(t.value)
+        t.lexer.begin('control')
+        return t
+    
     def t_pc_FOR(self, t):
         r"(?i)\.for[\s]+each"
         t.endlexpos = t.lexpos + len(t.value)
@@ -786,6 +812,12 @@ class RSLParser(object):
         p[0].filename = self.filename
         p[0].lineno = p.lineno(0)
     
+    def p_statement_6(self, p):
+        """statement : PARFOR inst_ref_var IN inst_ref_set_var lineabreak code endforrer"""
+        p[0] = ast.ForNode(p[2], p[4], p[6], parallel=True)
+        p[0].filename = self.filename
+        p[0].lineno = p.lineno(0)
+    
     def p_statement_5(self, p):
         """statement : BREAKFOR lineabreak"""
         p[0] = ast.BreakNode()
@@ -1433,6 +1465,8 @@ class RSLParser(object):
             lit.filename = self.filename
             lit.lineno = p.lineno(1)
             p[0].literals.insert(0, lit)
+            
+        resolve_literals(p[0])
     
     def p_literal_2(self, p):
         """literal : NEWLINE"""
@@ -1444,6 +1478,7 @@ class RSLParser(object):
         p[0].filename = self.filename
         p[0].lineno = p.lineno(1)
         p[0].literals.insert(0, lit)
+        resolve_literals(p[0])
     
     def p_literalbody_1(self, p):
         """literalbody : """
@@ -1508,14 +1543,314 @@ class RSLParser(object):
             raise ParseException("unknown parsing error in %s" % self.filename)
             
             
-def parse_file(filename):
-    parser = RSLParser()
+def resolve_literals(node):
+    '''
+    Merge adjacent literals in a line of literal text, and apply the line
+    ending of the line unless it depends on substituted values, i.e. when
+    trailing backslashes may continue those of a substituted value. The
+    literals and substituted values of a resolved line are buffered as is.
+    '''
+    literals = list()
+    for literal in node.literals:
+        if (isinstance(literal, ast.LiteralNode) and literals and
+            isinstance(literals[-1], ast.LiteralNode)):
+            merged = ast.LiteralNode(literals[-1].value + literal.value)
+            merged.filename = literals[-1].filename
+            merged.lineno = literals[-1].lineno
+            literals[-1] = merged
+        else:
+            literals.append(literal)
+    
+    if not literals:
+        literal = ast.LiteralNode('')
+        literal.filename = node.filename
+        literal.lineno = node.lineno
+        literals.append(literal)
+    
+    last = literals[-1]
+    if node.resolved or not isinstance(last, ast.LiteralNode):
+        pass
+    
+    elif (len(literals) > 1 and len(last.value) < 3 and
+          last.value.endswith('\\')):
+        pass
+    
+    else:
+        last.value = runtime.buffered_literal(last.value)
+        literals = [literal for literal in literals
+                    if not isinstance(literal, ast.LiteralNode) or literal.value]
+        node.resolved = True
+        
+    node.literals = literals
+    return node
+
+
+_pool = threading.local()
+
+
+def get_parser():
+    '''
+    Obtain a parser from the pool. Building the lexer and parser tables is
+    costly, so each thread reuses a single instance between inputs.
+    '''
+    parser = getattr(_pool, 'parser', None)
+    if parser is None:
+        parser = RSLParser()
+        _pool.parser = parser
+        
+    return parser
+
+
+def cache_key(text, filename):
+    '''
+    Compute the key used to identify a syntax tree in the parse cache. Since
+    nodes in the tree refer to the name of the parsed file, the filename is
+    part of the key as well as its content.
+    '''
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+        
+    if not isinstance(filename, bytes):
+        filename = filename.encode('utf-8')
+        
+    h = hashlib.sha1()
+    h.update(version.release.encode('utf-8'))
+    h.update(('%d' % ast.VERSION).encode('utf-8'))
+    h.update(('%d.%d' % sys.version_info[:2]).encode('utf-8'))
+    h.update(filename)
+    h.update(b'\0')
+    h.update(text)
+    
+    return h.hexdigest()
+
+
+#: Header of syntax trees in the parse cache, followed by the sha1 digest of
+#: the serialized tree. The last byte is the version of the format.
+CACHE_MAGIC = b'RSLAST\x01'
+
+#: Maximum size in bytes of the parse cache. Once exceeded, the least recently
+#: used syntax trees are removed.
+CACHE_SIZE = 64 * 1024 * 1024
+
+#: Age in seconds of temporary files in the parse cache, beyond which they
+#: are assumed to be left behind by interrupted writes.
+CACHE_TEMP_AGE = 3600
+
+#: Types of field values that are stored as is in the parse cache.
+PLAIN_TYPES = (type(None), bool, int, float, str, type(u''), type(2**64))
+
+
+def serialize(root):
+    '''
+    Serialize a syntax tree into a flat tuple of nodes, so that it may be
+    stored using marshal. Each node is stored as its class name, filename,
+    line number and field values, where references to other nodes are
+    replaced by their index in the tuple.
+    '''
+    indices = {id(root): 0}
+    nodes = [root]
+    records = list()
+    
+    def encode(value):
+        if isinstance(value, ast.Node):
+            if id(value) not in indices:
+                indices[id(value)] = len(nodes)
+                nodes.append(value)
+            return (1, indices[id(value)])
+        
+        if isinstance(value, (tuple, list)):
+            return (2, tuple(encode(item) for item in value))
+        
+        if isinstance(value, PLAIN_TYPES):
+            return (0, value)
+
+        raise TypeError('unable to serialize %s' % type(value).__name__)
+    
+    for node in nodes:
+        cls = node.__class__
+        values = tuple(encode(getattr(node, name, None))
+                       for name in ast.node_fields(cls))
+        records.append((cls.__name__, node.filename, node.lineno, values))
+        
+    return tuple(records)
+
+
+def deserialize(records):
+    '''
+    Rebuild a syntax tree from its serialized form. Only node classes from
+    the ast module and plain field values are accepted, so that a tampered
+    cache entry cannot do more than fail to load.
+    '''
+    nodes = list()
+    for name, _, _, _ in records:
+        cls = getattr(ast, name, None)
+        if not isinstance(cls, type) or not issubclass(cls, ast.Node):
+            raise ValueError('unknown node %s' % name)
+        nodes.append(cls.__new__(cls))
+        
+    def decode(value):
+        kind, value = value
+        if kind == 0 and isinstance(value, PLAIN_TYPES):
+            return value
+        
+        if kind == 1:
+            return nodes[value]
+        
+        if kind == 2:
+            return tuple(decode(item) for item in value)
+        
+        raise ValueError('invalid field value')
+    
+    for node, (_, filename, lineno, values) in zip(nodes, records):
+        fields = ast.node_fields(node.__class__)
+        if len(fields) != len(values):
+            raise ValueError('invalid fields of %s' % node)
+
+        node.filename = decode((0, filename))
+        node.lineno = decode((0, lineno))
+        for name, value in zip(fields, values):
+            setattr(node, name, decode(value))
+            
+    return ast.freeze(nodes[0])
+
+
+def load_cached(cache_dir, key):
+    '''
+    Load a syntax tree from the parse cache, or return None if it is not
+    available.
+    '''
+    path = os.path.join(cache_dir, key + '.ast')
+    if not os.path.isfile(path):
+        return None
+    
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+            
+        header = len(CACHE_MAGIC)
+        if data[:header] != CACHE_MAGIC:
+            raise ValueError('unknown format')
+        
+        digest = data[header:header + 20]
+        payload = data[header + 20:]
+        if hashlib.sha1(payload).digest() != digest:
+            raise ValueError('checksum mismatch')
+        
+        root = deserialize(marshal.loads(payload))
+    except Exception as e:
+        logger.warning('unable to load %s from cache: %s' % (path, e))
+        return None
+    
+    try:
+        # mark the entry as recently used, the cache may be read-only
+        os.utime(path, None)
+    except OSError:
+        pass
+    
+    return root
+
+
+def prune_cache(cache_dir, max_size=CACHE_SIZE, max_temp_age=CACHE_TEMP_AGE):
+    '''
+    Remove the least recently used syntax trees from the parse cache until
+    its size is at most *max_size* bytes, and temporary files that are older
+    than *max_temp_age* seconds.
+    '''
+    if not os.path.isdir(cache_dir):
+        return
+    
+    now = time.time()
+    entries = list()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+            if name.endswith('.tmp') and now - st.st_mtime > max_temp_age:
+                os.remove(path)
+        except OSError:
+            # removed by someone else
+            continue
+
+        if name.endswith('.ast'):
+            entries.append((st.st_mtime, st.st_size, path))
+
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        
+        try:
+            os.remove(path)
+        except OSError:
+            # removed by someone else
+            pass
+        
+        size -= entry_size
+        
+        
+def store_cached(cache_dir, key, root):
+    '''
+    Store a syntax tree in the parse cache. The tree is written to a
+    temporary file which is then renamed, so that concurrent writers never
+    expose partially written files to readers.
+    '''
+    path = os.path.join(cache_dir, key + '.ast')
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+    except OSError:
+        # another process may have created it
+        if not os.path.isdir(cache_dir):
+            raise
+    
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            payload = marshal.dumps(serialize(root))
+            f.write(CACHE_MAGIC)
+            f.write(hashlib.sha1(payload).digest())
+            f.write(payload)
+        
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # the destination exists on windows, i.e. someone else stored the
+            # same tree before we did.
+            os.remove(temp_path)
+            
+    except Exception as e:
+        logger.warning('unable to store %s in cache: %s' % (path, e))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def parse_file(filename, cache_dir=None):
+    '''
+    Parse a file. If a *cache_dir* is given, syntax trees are cached on disk
+    and reused as long as the content of the file is unchanged.
+    '''
     filename = os.path.abspath(filename)
-    return parser.filename_input(filename)
+    if not cache_dir:
+        parser = get_parser()
+        return parser.filename_input(filename)
+    
+    with open(filename, 'rU') as f:
+        text = f.read()
+        
+    key = cache_key(text, filename)
+    root = load_cached(cache_dir, key)
+    if root is None:
+        parser = get_parser()
+        root = parser.text_input(text, filename)
+        store_cached(cache_dir, key, root)
+    else:
+        logger.debug('loaded %s from cache' % filename)
+        
+    return root
 
 
 def parse_text(text, filename=''):
-    parser = RSLParser()
+    parser = get_parser()
     return parser.text_input(text, filename)
 
 
@@ -0,0 +1,253 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Profiling of archetypes written in the rule-specification language (RSL).
+Time is measured per line in the archetypes, and per function, include and
+archetype, i.e. per unit of code. The measurements may be saved in the
+callgrind format, e.g. for inspection in KCachegrind, or as python pstats.
+'''
+
+
+import sys
+import marshal
+import logging
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
+
+
+logger = logging.getLogger(__name__)
+
+
+class Entry(object):
+    '''
+    Measurements of a line or unit of code. Inclusive time is only accounted
+    for by the outermost activation of recursive code.
+    '''
+    __slots__ = ('hits', 'primitive', 'inclusive', 'exclusive')
+
+    def __init__(self):
+        self.hits = 0
+        self.primitive = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+
+
+class Profiler(object):
+    '''
+    Collect the time spent executing archetypes. Lines are identified by a
+    (filename, lineno) pair, and units by a (filename, lineno, name) triple.
+    '''
+
+    def __init__(self):
+        self.lines = dict()
+        self.units = dict()
+        self.kinds = dict()
+        self.costs = dict()
+        self.calls = dict()
+        self.line_stack = list()
+        self.unit_stack = list()
+        self.active = dict()
+
+    def enter_line(self, key):
+        self.active[key] = self.active.get(key, 0) + 1
+        self.line_stack.append([key, clock(), 0.0])
+
+    def leave_line(self):
+        key, start, children = self.line_stack.pop()
+        elapsed = clock() - start
+        exclusive = elapsed - children
+        self.active[key] -= 1
+
+        entry = self.lines.get(key)
+        if entry is None:
+            entry = self.lines[key] = Entry()
+
+        entry.hits += 1
+        entry.exclusive += exclusive
+        if not self.active[key]:
+            entry.primitive += 1
+            entry.inclusive += elapsed
+
+        if self.line_stack:
+            self.line_stack[-1][2] += elapsed
+
+        unit = self.unit_stack[-1][0] if self.unit_stack else None
+        cost = (unit, key[1])
+        self.costs[cost] = self.costs.get(cost, 0.0) + exclusive
+
+    def enter_unit(self, key, kind):
+        self.kinds[key] = kind
+        self.active[key] = self.active.get(key, 0) + 1
+        caller = self.unit_stack[-1][0] if self.unit_stack else None
+        callsite = self.line_stack[-1][0][1] if self.line_stack else 0
+        self.unit_stack.append([key, clock(), 0.0, caller, callsite])
+
+    def leave_unit(self):
+        key, start, children, caller, callsite = self.unit_stack.pop()
+        elapsed = clock() - start
+        self.active[key] -= 1
+        outermost = not self.active[key]
+
+        entry = self.units.get(key)
+        if entry is None:
+            entry = self.units[key] = Entry()
+
+        entry.hits += 1
+        entry.exclusive += elapsed - children
+        if outermost:
+            entry.primitive += 1
+            entry.inclusive += elapsed
+
+        if self.unit_stack:
+            self.unit_stack[-1][2] += elapsed
+
+        if caller is None:
+            return
+
+        # callgrind accounts for all calls, pstats only for outermost ones
+        call = (caller, callsite, key)
+        count, inclusive, total = self.calls.get(call, (0, 0.0, 0.0))
+        if outermost:
+            inclusive += elapsed
+
+        self.calls[call] = (count + 1, inclusive, elapsed + total)
+
+    def line(self, filename, lineno, fn):
+        '''
+        Wrap a compiled statement so that its execution is measured.
+        '''
+        key = (filename, lineno)
+        enter_line = self.enter_line
+        leave_line = self.leave_line
+
+        def profiled_line():
+            enter_line(key)
+            try:
+                fn()
+            finally:
+                leave_line()
+
+        return profiled_line
+
+    def unit(self, filename, lineno, name, kind, fn):
+        '''
+        Wrap a compiled function, include or archetype so that its execution
+        is measured.
+        '''
+        key = (filename, lineno, name)
+        enter_unit = self.enter_unit
+        leave_unit = self.leave_unit
+
+        def profiled_unit(*args):
+            enter_unit(key, kind)
+            try:
+                return fn(*args)
+            finally:
+                leave_unit()
+
+        return profiled_unit
+
+    def save_callgrind(self, f):
+        '''
+        Save the measurements in the callgrind format.
+        '''
+        def usec(t):
+            return int(round(t * 1000000))
+
+        costs = dict()
+        for (unit, lineno), t in self.costs.items():
+            costs.setdefault(unit, list()).append((lineno, t))
+
+        calls = dict()
+        for (caller, lineno, callee), value in self.calls.items():
+            calls.setdefault(caller, list()).append((lineno, callee, value))
+
+        f.write('# callgrind format\n')
+        f.write('version: 1\n')
+        f.write('creator: pyrsl\n')
+        f.write('positions: line\n')
+        f.write('events: Microseconds\n\n')
+        for key in sorted(self.units):
+            filename, _, name = key
+            f.write('fl=%s\n' % filename)
+            f.write('fn=%s\n' % name)
+            for lineno, t in sorted(costs.get(key, [])):
+                f.write('%d %d\n' % (lineno, usec(t)))
+
+            for lineno, callee, (count, _, t) in sorted(calls.get(key, [])):
+                f.write('cfl=%s\n' % callee[0])
+                f.write('cfn=%s\n' % callee[2])
+                f.write('calls=%d %d\n' % (count, callee[1]))
+                f.write('%d %d\n' % (lineno, usec(t)))
+
+            f.write('\n')
+
+    def stats(self):
+        '''
+        Obtain the measurements as a dictionary in the format of python
+        pstats, where each function, include and archetype is a function.
+        '''
+        callers = dict((key, dict()) for key in self.units)
+        for (caller, _, callee), (count, t, _) in self.calls.items():
+            value = callers[callee].get(caller, (0, 0, 0.0, 0.0))
+            callers[callee][caller] = (value[0] + count, value[1] + count,
+                                       0.0, value[3] + t)
+
+        stats = dict()
+        for key, entry in self.units.items():
+            stats[key] = (entry.primitive, entry.hits, entry.exclusive,
+                          entry.inclusive, callers[key])
+
+        return stats
+
+    def save(self, filename):
+        '''
+        Save the measurements to a file, in the pstats format if the filename
+        ends with .prof or .pstats, otherwise in the callgrind format.
+        '''
+        if filename.endswith(('.prof', '.pstats')):
+            with open(filename, 'wb') as f:
+                marshal.dump(self.stats(), f)
+        else:
+            with open(filename, 'w') as f:
+                self.save_callgrind(f)
+
+        logger.info('Profile saved to %s', filename)
+
+    def report(self, f=None, limit=20):
+        '''
+        Write a report of the most time consuming units and lines, ordered
+        by exclusive time.
+        '''
+        f = f or sys.stdout
+        header = '%8s %10s %10s  %s\n' % ('hits', 'incl (s)', 'excl (s)',
+                                          'location')
+
+        def write_entries(items):
+            items = sorted(items, key=lambda item: item[1].exclusive,
+                           reverse=True)
+            for location, entry in items[:limit]:
+                f.write('%8d %10.3f %10.3f  %s\n' % (entry.hits,
+                                                     entry.inclusive,
+                                                     entry.exclusive,
+                                                     location))
+
+        for kind in ['archetype', 'include', 'function']:
+            items = [('%s:%d %s' % key if kind == 'function' else key[0],
+                      entry)
+                     for key, entry in self.units.items()
+                     if self.kinds[key] == kind]
+            if not items:
+                continue
+
+            f.write('\n%ss\n' % kind.capitalize())
+            f.write(header)
+            write_entries(items)
+
+        f.write('\nLines\n')
+        f.write(header)
+        write_entries(('%s:%d' % key, entry)
+                      for key, entry in self.lines.items())
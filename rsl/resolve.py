@@ -0,0 +1,126 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Static resolution of local variables in functions of the rule-specification
+language (RSL). Each name declared in a function body is assigned a slot in
+a frame, so that the compiled function may access its locals by index rather
+than by searching a symbol table.
+'''
+
+
+import xtuml
+
+
+#: Names that are installed dynamically by the evaluator, and thus never
+#: resolved to a slot.
+DYNAMIC_NAMES = ('selected',)
+
+
+class Undefined(object):
+    '''
+    Marker for slots that have not been assigned a value.
+    '''
+    def __repr__(self):
+        return 'UNDEFINED'
+
+
+UNDEFINED = Undefined()
+
+
+class SlotResolver(xtuml.Visitor):
+    '''
+    Collect names declared by statements in a tree, in the order they appear.
+    Nested functions have their own frames and are not descended into.
+    '''
+
+    def __init__(self):
+        self.names = list()
+        self.keys = set()
+        self.depth = 0
+        self.dynamic = False
+        self.includes = list()
+
+    def declare(self, name):
+        if self.depth or not name:
+            return
+
+        key = name.lower()
+        if key in self.keys or key in DYNAMIC_NAMES:
+            return
+
+        self.keys.add(key)
+        self.names.append(name)
+
+    def enter_FunctionNode(self, node):
+        self.depth += 1
+
+    def leave_FunctionNode(self, node):
+        self.depth -= 1
+
+    def enter_IncludeNode(self, node):
+        if not self.depth:
+            self.dynamic = True
+            self.includes.append(node)
+
+    def enter_ParameterNode(self, node):
+        self.declare(node.name)
+
+    def enter_VariableAssignmentNode(self, node):
+        self.declare(node.name)
+
+    def enter_InvokeNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_CreateNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_ForNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_SelectAnyInstanceNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_SelectManyInstanceNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_SelectOneNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_SelectAnyNode(self, node):
+        self.declare(node.variable_name)
+
+    def enter_SelectManyNode(self, node):
+        self.declare(node.variable_name)
+
+
+def walk(*nodes):
+    resolver = SlotResolver()
+    w = xtuml.Walker()
+    w.visitors.append(resolver)
+    for node in nodes:
+        w.accept(node)
+
+    return resolver
+
+
+def declared_names(node):
+    '''
+    Obtain the names declared by statements in a tree, e.g. in the body of
+    a loop.
+    '''
+    return walk(node).names
+
+
+def resolve_slots(node):
+    '''
+    Resolve the locals of a function to slots. The returned list holds the
+    name of each slot, as it is spelled where it first appears. None is
+    returned for functions that need to be evaluated dynamically, e.g.
+    because they include other files into their scope.
+    '''
+    resolver = walk(node.parameter_list, node.statement_list)
+    if resolver.dynamic:
+        return None
+
+    return resolver.names
+
@@ -16,6 +16,11 @@ import logging
 import re
 import difflib
 import getpass
+import hashlib
+import json
+import itertools
+import threading
+import collections
 from functools import partial
 
 import rsl.version
@@ -27,18 +32,52 @@ except ImportError:
     pass
 
 try:
-    from StringIO import StringIO
+    import Queue as queue
 except ImportError:
-    from io import StringIO
+    import queue
+
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 
 
 logger = logging.getLogger(__name__)
 
 
+#: Formatted strings longer than this are not memorized.
+MEMO_STRING_LENGTH = 256
+
+WHITESPACE_REGEXP = re.compile(r'\s+')
+NONWORD_REGEXP = re.compile(r'[^\w]')
+XML_NAME_REGEXP = re.compile(r'(^[^\w_])|[^\w_.-]')
+
+
 class RuntimeException(Exception):
     pass
 
 
+def buffered_literal(literal):
+    '''
+    Obtain the text that is buffered for a line of literal text, where
+    trailing backslashes either continue the line or escape a backslash.
+    '''
+    if   literal.endswith('\\' * 3):
+        return literal[:-2]
+    
+    elif literal.endswith('\\' * 2):
+        return literal[:-1] + '\n'
+    
+    elif literal.endswith('\\'):
+        return literal[:-1]
+    
+    elif literal.endswith('\n'):
+        return literal
+    
+    else:
+        return literal + '\n'
+
+
 class Info(object):
     '''
     Helper class for providing access to the built-in
@@ -99,48 +138,667 @@ class Fragment(xtuml.Class):
     __repr__ = __str__
 
     
+class EmitManifest(object):
+    '''
+    Record of emitted files, mapping the path of each file to its size,
+    modification time and a hash of its content. As long as the size and
+    modification time of a file on disk matches the record, its content is
+    assumed to be unchanged since it was recorded, and emit may compare
+    hashes instead of reading the file.
+    '''
+    
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = dict()
+        if filename and os.path.isfile(filename):
+            self.load()
+            
+    @staticmethod
+    def digest(s):
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+            
+        return hashlib.sha1(s).hexdigest()
+    
+    def lookup(self, path):
+        '''
+        Lookup the hash of the content in a file, or return None if the file
+        was modified since it was recorded.
+        '''
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        
+        size, mtime, digest = entry
+        if st.st_size == size and st.st_mtime == mtime:
+            return digest
+        
+    def update(self, path, digest):
+        st = os.stat(path)
+        self.entries[os.path.abspath(path)] = (st.st_size, st.st_mtime, digest)
+        
+    def load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            logger.warning('unable to load %s: %s' % (self.filename, e))
+            return
+        
+        for path, entry in entries.items():
+            self.entries[path] = tuple(entry)
+            
+    def save(self):
+        with open(self.filename, 'w') as f:
+            json.dump(self.entries, f, indent=0, sort_keys=True)
+
+        
+class OutputBuffer(object):
+    '''
+    Buffer for output text. Text is kept as a list of chunks which are only
+    joined when the content of the buffer is requested, e.g. when emitted to
+    disk or when a function returns its body.
+    '''
+    
+    def __init__(self):
+        self.chunks = list()
+        
+    def write(self, s):
+        if s:
+            self.chunks.append(s)
+            
+    def getvalue(self):
+        if len(self.chunks) > 1:
+            self.chunks = [''.join(self.chunks)]
+        
+        if self.chunks:
+            return self.chunks[0]
+        else:
+            return ''
+        
+    def close(self):
+        self.chunks = list()
+
+        
+class EmitJob(object):
+    done = None
+    result = None
+    error = None
+    
+    def __init__(self, key, fn, callback):
+        self.key = key
+        self.fn = fn
+        self.callback = callback
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.fn()
+        except Exception as e:
+            self.error = e
+        
+        # release the buffer as soon as it has been written
+        self.fn = None
+        self.done.set()
+        
+
+class EmitWriter(object):
+    '''
+    Write emitted files in the background using a pool of threads. Files with
+    the same path are always written by the same thread, in the order they
+    were emitted. Each thread accepts a bounded number of pending files, after
+    which emit blocks until the thread catches up. Outcomes are reported on
+    the interpreter thread, in the order files were emitted.
+    '''
+    
+    def __init__(self, num_threads=4, max_pending=16):
+        self.pending = collections.deque()
+        self.latest = dict()
+        self.queues = list()
+        self.threads = list()
+        self.errors = list()
+        
+        for _ in range(max(1, num_threads)):
+            q = queue.Queue(max_pending)
+            t = threading.Thread(target=self.work, args=(q,))
+            t.daemon = True
+            t.start()
+            self.queues.append(q)
+            self.threads.append(t)
+            
+    @staticmethod
+    def work(q):
+        while True:
+            job = q.get()
+            if job is None:
+                break
+            
+            job.run()
+
+    def submit(self, path, fn, callback):
+        '''
+        Schedule a call to *fn* that writes a file to *path*. Once done,
+        *callback* is invoked with the result of the call and the error it
+        raised, if any.
+        '''
+        key = os.path.normcase(os.path.abspath(path))
+        job = EmitJob(key, fn, callback)
+        q = self.queues[hash(key) % len(self.queues)]
+        self.pending.append(job)
+        self.latest[key] = job
+        q.put(job)
+        self.drain(block=False)
+        
+    def wait(self, path):
+        '''
+        Wait for pending files with some *path* to be written, e.g. before
+        the file is read back.
+        '''
+        key = os.path.normcase(os.path.abspath(path))
+        job = self.latest.get(key)
+        if job is not None:
+            job.done.wait()
+            
+        self.drain(block=False)
+        
+    def drain(self, block=True):
+        '''
+        Report the outcome of files that have been written, in the order they
+        were emitted. If *block* is True, wait for all pending files.
+        '''
+        while self.pending:
+            job = self.pending[0]
+            if not block and not job.done.is_set():
+                break
+            
+            job.done.wait()
+            self.pending.popleft()
+            if self.latest.get(job.key) is job:
+                del self.latest[job.key]
+                
+            if job.error is not None:
+                self.errors.append(job.error)
+                
+            job.callback(job.result, job.error)
+            
+    def flush(self):
+        '''
+        Wait for all pending files to be written, and raise the first error
+        that occurred while writing them.
+        '''
+        self.drain()
+        if self.errors:
+            error = self.errors[0]
+            self.errors = list()
+            raise error
+        
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for q in self.queues:
+                q.put(None)
+                
+            for t in self.threads:
+                t.join()
+
+                
+class InstanceSet(xtuml.QuerySet):
+    '''
+    Ordered set of instances kept in an append-only log, which is shared with
+    the sets derived from it by union. Each set only covers a prefix of the
+    log, so a union with a set that covers the entire log is computed by
+    appending the new instances to the log, rather than by copying the set.
+    This keeps accumulation of instances in a loop, e.g. by assigning
+    all = all | one, linear in the number of instances.
+    '''
+    
+    def __init__(self, iterable=None):
+        self.items = list()
+        self.positions = dict()
+        self.length = 0
+        if iterable is not None:
+            self.extend(iterable)
+            
+    def derive(self):
+        '''
+        Obtain a set with the same content, sharing the log of this set.
+        '''
+        other = InstanceSet()
+        other.items = self.items
+        other.positions = self.positions
+        other.length = self.length
+        return other
+        
+    def own(self):
+        '''
+        Make sure the log is not shared beyond the prefix covered by this set
+        before it is appended to.
+        '''
+        if self.length != len(self.items):
+            self.items = self.items[:self.length]
+            self.positions = dict((inst, index)
+                                  for index, inst in enumerate(self.items))
+    
+    def extend(self, iterable):
+        self.own()
+        items = self.items
+        positions = self.positions
+        for inst in iterable:
+            if inst not in positions:
+                positions[inst] = len(items)
+                items.append(inst)
+                
+        self.length = len(items)
+        
+    def union(self, iterable):
+        other = self.derive()
+        other.extend(iterable)
+        return other
+    
+    def add(self, inst):
+        self.extend([inst])
+        
+    def discard(self, inst):
+        if inst in self:
+            self.items = self.items[:self.length]
+            del self.items[self.positions[inst]]
+            self.positions = dict((inst, index)
+                                  for index, inst in enumerate(self.items))
+            self.length = len(self.items)
+            
+    def pop(self, last=True):
+        if not self:
+            raise KeyError('set is empty')
+        
+        if last:
+            inst = self.items[self.length - 1]
+        else:
+            inst = self.items[0]
+            
+        self.discard(inst)
+        return inst
+    
+    def __len__(self):
+        return self.length
+    
+    def __contains__(self, inst):
+        return self.positions.get(inst, self.length) < self.length
+    
+    def __iter__(self):
+        return itertools.islice(self.items, self.length)
+    
+    def __reversed__(self):
+        items = self.items
+        for index in range(self.length - 1, -1, -1):
+            yield items[index]
+            
+    def __or__(self, other):
+        if not isinstance(other, Iterable):
+            return NotImplemented
+        
+        return self.union(other)
+
+    
+class InstanceIndex(object):
+    '''
+    Hash indexes over attributes of instances in a metamodel. An index is
+    built when first queried, and dropped when the instances or attribute
+    values it covers may have changed.
+    '''
+    
+    def __init__(self, metamodel):
+        self.metamodel = metamodel
+        self.indexes = dict()
+        self.referential = set()
+        
+    def lookup(self, key_letter, attributes, values):
+        '''
+        Lookup instances of a class whose *attributes* equal some *values*,
+        in the order they were created.
+        '''
+        metaclass = self.metamodel.find_metaclass(key_letter)
+        key = (metaclass, attributes)
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.build(metaclass, attributes)
+            self.indexes[key] = index
+            
+        return index.get(values, ())
+    
+    def build(self, metaclass, attributes):
+        index = dict()
+        for inst in metaclass.storage:
+            values = tuple([getattr(inst, name) for name in attributes])
+            index.setdefault(values, list()).append(inst)
+        
+        # referential attributes are derived from links, and may change when
+        # instances of other classes are modified.
+        referential = set(name.lower()
+                          for name in metaclass.referential_attributes)
+        if referential.intersection(attributes):
+            self.referential.add((metaclass, attributes))
+        
+        return index
+    
+    def invalidate(self, metaclass=None):
+        '''
+        Drop indexes over instances of a *metaclass*, and all indexes over
+        referential attributes. If no *metaclass* is given, all indexes are
+        dropped.
+        '''
+        if not self.indexes:
+            return
+        
+        if metaclass is None:
+            self.indexes.clear()
+            self.referential.clear()
+            return
+        
+        for key in list(self.indexes.keys()):
+            if key[0] is metaclass:
+                del self.indexes[key]
+                self.referential.discard(key)
+                
+        self.invalidate_referential()
+        
+    def invalidate_referential(self):
+        for key in self.referential:
+            self.indexes.pop(key, None)
+            
+        self.referential.clear()
+        
+        
+class NavigationCache(object):
+    '''
+    Results of navigations across links from individual instances. Only
+    results from traversing a single link are stored, since they may only
+    change when the instance at either end is related, unrelated or deleted.
+    Navigations across associative links are composed from such results.
+    '''
+    
+    def __init__(self):
+        self.paths = dict()
+        self.results = dict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        
+    def path(self, metaclass, kind, rel_id, phrase):
+        '''
+        Obtain the links traversed when navigating from instances of a
+        *metaclass* to some *kind*, one link for ordinary associations, and
+        two for associations that are formalized by an associative class.
+        '''
+        key = (metaclass, kind, rel_id, phrase)
+        links = self.paths.get(key)
+        if links is None:
+            link_key = (kind.upper(), rel_id, phrase)
+            if link_key in metaclass.links:
+                links = (metaclass.links[link_key],)
+            else:
+                links = metaclass._find_assoc_links(kind, rel_id, phrase)
+                
+            self.paths[key] = links
+            
+        return links
+    
+    def follow(self, inst, link, key=None):
+        results = self.results.get(inst)
+        if results is None:
+            results = self.results[inst] = dict()
+            
+        # links are dictionaries, and thus not hashable
+        key = key or id(link)
+        try:
+            value = results[key]
+        except KeyError:
+            self.misses += 1
+            value = results[key] = tuple(link.navigate(inst))
+        else:
+            self.hits += 1
+            
+        return value
+    
+    def navigate(self, inst, kind, rel_id, phrase):
+        '''
+        Navigate from an instance to some *kind* across a link with a given
+        *rel_id* and *phrase*.
+        '''
+        key = (kind, rel_id, phrase)
+        results = self.results.get(inst)
+        if results is not None and key in results:
+            self.hits += 1
+            return results[key]
+        
+        metaclass = xtuml.get_metaclass(inst)
+        links = self.path(metaclass, kind, rel_id, phrase)
+        if len(links) == 1:
+            return self.follow(inst, links[0], key)
+        
+        # the result depends on links of the associative instances, so only
+        # the navigations across each link are stored
+        result = list()
+        for other in self.follow(inst, links[0]):
+            result.extend(self.follow(other, links[1]))
+            
+        return result
+    
+    def invalidate(self, instances):
+        '''
+        Drop results of navigations from some *instances*.
+        '''
+        for inst in instances:
+            if self.results.pop(inst, None):
+                self.invalidations += 1
+        
+    def clear(self):
+        if self.results:
+            self.invalidations += 1
+            self.results.clear()
+            
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return '%d hits (%.1f%%), %d misses, %d invalidations' % (self.hits,
+                                                                   rate,
+                                                                   self.misses,
+                                                                   self.invalidations)
+    
+    
+class FunctionMemo(object):
+    '''
+    Results from invocations of a pure function, i.e. a function that given
+    the same arguments always produces the same result as long as the model
+    is left unchanged. Arguments are compared by value if they are numbers
+    or strings, and by identity otherwise. At most *size* results are kept,
+    and the least recently used result is evicted first.
+    
+    Functions with side effects, i.e. that emit files, print messages, invoke
+    bridges or modify the model, are not pure. Their results are never
+    memorized, since the side effects would be lost.
+    '''
+    VALUE_TYPES = (bool, int, float, str, type(u''), type(None))
+    
+    def __init__(self, name, size=4096):
+        self.name = name
+        self.size = size
+        self.results = collections.OrderedDict()
+        self.impure = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        
+    def key(self, args):
+        key = list()
+        for arg in args:
+            if isinstance(arg, self.VALUE_TYPES):
+                key.append((type(arg), arg))
+            elif isinstance(arg, xtuml.QuerySet):
+                key.append(tuple(id(inst) for inst in arg))
+            else:
+                key.append(id(arg))
+                
+        return tuple(key)
+    
+    def lookup(self, key):
+        try:
+            entry = self.results.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        
+        self.results[key] = entry
+        self.hits += 1
+        return entry[1]
+    
+    def store(self, key, args, values):
+        if len(self.results) >= self.size:
+            self.results.popitem(last=False)
+            
+        # keep the arguments alive, or their identities may be reused
+        self.results[key] = (args, values)
+        
+    def exclude(self):
+        '''
+        Stop memorizing results, since the function has side effects.
+        '''
+        logger.warning('%s has side effects, and is not memoized', self.name)
+        self.impure = True
+        self.results.clear()
+        
+    def clear(self):
+        if self.results:
+            self.invalidations += 1
+            self.results.clear()
+            
+    def __str__(self):
+        return '%s: %d hits, %d misses, %d invalidations' % (self.name,
+                                                               self.hits,
+                                                               self.misses,
+                                                               self.invalidations)
+    
+    
 class Runtime(object):
     bridges = dict()
     string_formatters = dict()
     
-    def __init__(self, metamodel, emit=None, force=False, diff=None):
+    #: The maximum number of formatted strings memorized per list of builtin
+    #: string formatters, or zero to disable memorization. Lists that contain
+    #: a user supplied formatter are never memorized, since it may not always
+    #: produce the same output for a given input.
+    format_memo_size = 4096
+    
+    #: The maximum number of results memorized per pure function.
+    function_memo_size = 4096
+    
+    #: The number of processes used to evaluate parallel loops.
+    jobs = 1
+    
+    #: Cache results of navigations across links, which assumes that the
+    #: model is only modified by the runtime or by bridges.
+    navigation_cache = True
+    
+    #: Fold constant expressions and remove dead branches from syntax trees
+    #: before they are evaluated.
+    optimize = True
+    
+    def __init__(self, metamodel, emit=None, force=False, diff=None,
+                 cache_dir=None, manifest=None, writer=None, profiler=None):
         self.metamodel = metamodel
         self.emit = emit
         self.force_emit = force
         self.diff = diff
+        self.cache_dir = cache_dir
+        self.manifest = manifest
+        self.writer = writer
+        self.profiler = profiler
         self.functions = dict()
-        self.buffer = StringIO()
+        self.buffer = OutputBuffer()
         self.include_cache = dict()
+        self.include_paths = dict()
+        self.index = InstanceIndex(metamodel)
+        self.navigations = NavigationCache()
         self.info = Info(metamodel)
+        self.format_pipelines = dict()
+        self.memos = dict()
+        self.mutations = 0
+        self.side_effects = 0
+        self.modified = set()
         
     def format_string(self, expr, fmt):
-
-        def swap_rc_with_cr(formats):
-            '''
-            The removal of whitespace should occur after the capitalization
-            has taken place in the case of the CR or RC combination.
-            '''
-            for i in range(len(formats) - 1):
-                if formats[i].lower() == 'r' and formats[i+1].lower() == 'c':
-                    formats[i], formats[i+1] = formats[i+1], formats[i]
-
-        def apply_formats(s, formats):
-            for formatter in formats:
-                try:
-                    f = self.string_formatters[formatter.lower()]
-                except KeyError:
-                    raise RuntimeException('%s is not a valid string formatter' % formatter)
+        return self.format_pipeline(fmt)('%s' % expr)
+    
+    def format_pipeline(self, fmt):
+        '''
+        Obtain a function that applies a list of string formatters to a
+        string. The function is composed once per list of formatters, and
+        memorizes the result of formatting short strings if all formatters
+        are builtin.
+        '''
+        key = tuple(fmt)
+        if key in self.format_pipelines:
+            return self.format_pipelines[key]
+        
+        formats = list(fmt)
+        
+        # The removal of whitespace should occur after the capitalization
+        # has taken place in the case of the CR or RC combination.
+        for i in range(len(formats) - 1):
+            if formats[i].lower() == 'r' and formats[i+1].lower() == 'c':
+                formats[i], formats[i+1] = formats[i+1], formats[i]
+        
+        formats = ([f for f in formats if f[0] == 't'] +
+                   [f for f in formats if f[0] != 't'])
+        
+        formatters = list()
+        for formatter in formats:
+            try:
+                formatters.append(self.string_formatters[formatter.lower()])
+            except KeyError:
+                msg = '%s is not a valid string formatter' % formatter
+                
+                def invalid_pipeline(s):
+                    raise RuntimeException(msg)
+                
+                self.format_pipelines[key] = invalid_pipeline
+                return invalid_pipeline
+            
+        formatters = tuple(formatters)
+        memo = dict()
+        memo_size = self.format_memo_size
+        
+        def apply_formats(s):
+            for f in formatters:
                 s = f(s)
             return s
-
-        s = '%s' % expr
-
-        swap_rc_with_cr(fmt)
+            
+        def pipeline(s):
+            if len(s) > MEMO_STRING_LENGTH:
+                return apply_formats(s)
+            
+            try:
+                return memo[s]
+            except KeyError:
+                pass
+            
+            value = apply_formats(s)
+            if len(memo) >= memo_size:
+                memo.clear()
+            
+            memo[s] = value
+            return value
         
-        s = apply_formats(s, [f for f in fmt if f[0] == 't'])
-        s = apply_formats(s, [f for f in fmt if f[0] != 't'])
-    
-        return s
+        if not memo_size or not PURE_FORMATTERS.issuperset(formatters):
+            pipeline = apply_formats
+            
+        self.format_pipelines[key] = pipeline
+        return pipeline
     
     @staticmethod
     def parse_keyword(expr, keyword):
@@ -155,7 +813,31 @@ class Runtime(object):
     def define_function(self, name, fn):
         self.functions[name] = fn
         
+    def memoize(self, name):
+        '''
+        Declare a function as pure, and memorize the result of invoking it
+        until the model is modified.
+        '''
+        if name not in self.memos:
+            self.memos[name] = FunctionMemo(name, self.function_memo_size)
+            
+        return self.memos[name]
+    
+    def invalidate_memos(self):
+        for memo in self.memos.values():
+            memo.clear()
+        
     def invoke_function(self, name, args):
+        memo = self.memos.get(name)
+        if memo is not None and memo.impure:
+            memo = None
+            
+        if memo is not None:
+            memo_key = memo.key(args)
+            values = memo.lookup(memo_key)
+            if values is not None:
+                return Fragment(**values)
+                
         if name in self.functions:
             fn = self.functions[name]
         elif name in self.bridges:
@@ -163,10 +845,28 @@ class Runtime(object):
         else:
             raise RuntimeException("Function '%s' is undefined" % name)
         
+        side_effects = self.side_effects + self.mutations
+        if name not in self.functions:
+            # bridges may e.g. write files, so they are never pure
+            self.side_effects += 1
+            
+        if (self.writer is not None and name not in self.functions and
+            getattr(fn, 'accesses_files', True)):
+            # bridges may read files that are yet to be written
+            self.writer.drain()
+            
         previous_buffer = self.buffer
-        self.buffer = StringIO()
+        self.buffer = OutputBuffer()
         
         d = fn(*args)
+        if (name not in self.functions and
+            getattr(fn, 'modifies_model', True)):
+            # bridges may modify the model behind our back, so assume that
+            # all metaclasses have been modified when persisting the model
+            self.index.invalidate()
+            self.navigations.clear()
+            self.model_modified(*self.metamodel.metaclasses.values())
+            
         return_values = dict({'body': self.buffer.getvalue()})
         
         self.buffer.close()
@@ -177,11 +877,26 @@ class Runtime(object):
                 key = key.split("_", 1)[1]
                 return_values[key] = value
         
+        if memo is not None and side_effects != (self.side_effects +
+                                                 self.mutations):
+            memo.exclude()
+            
+        elif memo is not None:
+            memo.store(memo_key, args, return_values)
+            return_values = dict(return_values)
+            
         return Fragment(**return_values)
     
-    def invoke_print(self, value, prefix='INFO'):
-        sys.stdout.write("%s: %d:  %s:  %s\n" % (self.info.arch_file_name,
-                                                 self.info.arch_file_line,
+    def invoke_print(self, value, prefix='INFO', location=None):
+        self.side_effects += 1
+        self.print_message(value, prefix, location)
+        
+    def print_message(self, value, prefix='INFO', location=None):
+        if location is None:
+            location = (self.info.arch_file_name, self.info.arch_file_line)
+            
+        sys.stdout.write("%s: %d:  %s:  %s\n" % (location[0],
+                                                 location[1],
                                                  prefix,
                                                  value))
     
@@ -196,25 +911,51 @@ class Runtime(object):
         else:
             return value
         
-    def buffer_literal(self, literal):
-        if   literal.endswith('\\' * 3):
-            self.buffer.write(literal[:-2])
-        
-        elif literal.endswith('\\' * 2):
-            self.buffer.write(literal[:-1])
-            self.buffer.write('\n')
+    @staticmethod
+    def set_union(lhs, rhs):
+        if not isinstance(lhs, InstanceSet):
+            lhs = InstanceSet(lhs)
             
-        elif literal.endswith('\\'):
-            self.buffer.write(literal[:-1])
+        return lhs.union(rhs)
+    
+    @staticmethod
+    def set_intersection(lhs, rhs):
+        return InstanceSet(inst for inst in rhs if inst in lhs)
+    
+    @staticmethod
+    def set_difference(lhs, rhs):
+        return InstanceSet(inst for inst in lhs if inst not in rhs)
+    
+    @staticmethod
+    def set_symmetric_difference(lhs, rhs):
+        return InstanceSet(itertools.chain(
+            (inst for inst in lhs if inst not in rhs),
+            (inst for inst in rhs if inst not in lhs)))
+        
+    def buffer_literals(self, parts):
+        '''
+        Buffer a line of literal text given as a sequence of parts, e.g.
+        literals and substituted values, without joining them.
+        '''
+        parts = [part for part in parts if part]
+        if not parts:
+            return self.buffer_literal('')
+        
+        literal = parts.pop()
+        if literal.endswith('\\'):
+            # line continuations may span several parts
+            while parts and len(literal) < 3:
+                literal = parts.pop() + literal
             
-        elif literal.endswith('\n'):
-            self.buffer.write(literal)
+        for part in parts:
+            self.buffer.write(part)
             
-        else:
-            self.buffer.write(literal)
-            self.buffer.write('\n')
+        self.buffer_literal(literal)
+        
+    def buffer_literal(self, literal):
+        self.buffer.write(buffered_literal(literal))
     
-    def append_diff(self, filename, org, buf):
+    def format_diff(self, filename, org, buf):
         org = org.splitlines(1)
         buf = buf.splitlines(1)
         
@@ -230,12 +971,11 @@ class Runtime(object):
             todate = ''
         
         diff = difflib.unified_diff(org, buf, fromfile, tofile, fromdate, todate)
-
-        with open(self.diff, 'a') as f:
-            f.write(''.join(diff))
+        
+        return ''.join(diff)
 
     def emit_buffer(self, filename):
-        org = ''
+        self.side_effects += 1
         buf = self.buffer.getvalue()
         
         self.clear_buffer()
@@ -244,7 +984,50 @@ class Runtime(object):
             buf += '\n'
             
         filename = os.path.normpath(filename)
-        if os.path.exists(filename):
+        location = (self.info.arch_file_name, self.info.arch_file_line)
+        
+        # the file may be included once it has been written
+        self.include_cache.pop(os.path.abspath(filename), None)
+        
+        if self.writer is None:
+            result = self.write_file(filename, buf)
+            self.report_emit(location, result)
+        else:
+            fn = partial(self.write_file, filename, buf)
+            callback = partial(self.report_emit, location)
+            self.writer.submit(filename, fn, callback)
+            
+    def report_emit(self, location, result, error=None):
+        if error is not None:
+            self.print_message(error, 'ERROR', location)
+            return
+        
+        message, diff = result
+        if message:
+            self.print_message(message, location=location)
+
+        if diff:
+            with open(self.diff, 'a') as f:
+                f.write(diff)
+    
+    def write_file(self, filename, buf):
+        '''
+        Write a buffer to a file, unless told otherwise by the emit policy.
+        Return a message to report, and a diff against the previous content
+        of the file (if requested).
+        '''
+        org = ''
+        message = None
+        diff = None
+        digest = None
+        if self.manifest is not None:
+            digest = self.manifest.digest(buf)
+
+        if digest and digest == self.manifest.lookup(filename):
+            # unchanged since the previous emit, no need to read it
+            org = buf
+            
+        elif os.path.exists(filename):
             with open(filename, 'rU') as f:
                 org = f.read()
         
@@ -257,8 +1040,8 @@ class Runtime(object):
         else:
             do_write = True
                 
-        if self.diff:
-            self.append_diff(filename, org, buf)
+        if self.diff and org != buf:
+            diff = self.format_diff(filename, org, buf)
 
         if do_write and self.force_emit and os.path.exists(filename):
             st = os.stat(filename)
@@ -266,27 +1049,128 @@ class Runtime(object):
 
         if do_write:
             dirname = os.path.dirname(filename)
-            if dirname and not os.path.exists(dirname):
-                os.makedirs(dirname)
+            try:
+                if dirname and not os.path.exists(dirname):
+                    os.makedirs(dirname)
+            except OSError:
+                # another thread may have created it
+                if not os.path.isdir(dirname):
+                    raise
 
             if os.path.exists(filename):
-                self.invoke_print("File '%s' REPLACED" % filename)
+                message = "File '%s' REPLACED" % filename
             else:
-                self.invoke_print("File '%s' CREATED" % filename)
+                message = "File '%s' CREATED" % filename
 
             with open(filename, 'w+') as f:
                 f.write(buf)
+                
+        if digest and do_write:
+            self.manifest.update(filename, digest)
+            
+        elif digest and org == buf and os.path.exists(filename):
+            self.manifest.update(filename, digest)
+            
+        return message, diff
     
     def clear_buffer(self):
         self.buffer.close()
-        self.buffer = StringIO()
-
+        self.buffer = OutputBuffer()
+
+    def model_modified(self, *metaclasses):
+        '''
+        Keep track of modifications to the model, and of which metaclasses
+        they were made to.
+        '''
+        self.mutations += 1
+        self.modified.update(metaclasses)
+        self.invalidate_memos()
+        
     def new(self, key_letter):
-        return self.metamodel.new(key_letter)
+        inst = self.metamodel.new(key_letter)
+        metaclass = xtuml.get_metaclass(inst)
+        self.index.invalidate(metaclass)
+        self.model_modified(metaclass)
+        return inst
     
+    def delete(self, inst):
+        if isinstance(inst, xtuml.Class):
+            metaclass = xtuml.get_metaclass(inst)
+            self.navigations.invalidate([inst])
+            for link in metaclass.links.values():
+                self.navigations.invalidate(link.navigate(inst))
+            
+        xtuml.delete(inst)
+        metaclass = xtuml.get_metaclass(inst)
+        self.index.invalidate(metaclass)
+        self.model_modified(metaclass)
+        
+    def relate(self, from_inst, to_inst, rel_id, phrase):
+        xtuml.relate(from_inst, to_inst, rel_id, phrase)
+        self.navigations.invalidate([from_inst, to_inst])
+        self.index.invalidate_referential()
+        self.model_modified(xtuml.get_metaclass(from_inst),
+                            xtuml.get_metaclass(to_inst))
+        
+    def unrelate(self, from_inst, to_inst, rel_id, phrase):
+        xtuml.unrelate(from_inst, to_inst, rel_id, phrase)
+        self.navigations.invalidate([from_inst, to_inst])
+        self.index.invalidate_referential()
+        self.model_modified(xtuml.get_metaclass(from_inst),
+                            xtuml.get_metaclass(to_inst))
+        
+    def set_attribute(self, inst, name, value):
+        setattr(inst, name, value)
+        if isinstance(inst, Fragment):
+            # fragments are not part of the model
+            self.invalidate_memos()
+            
+        elif isinstance(inst, xtuml.Class):
+            metaclass = xtuml.get_metaclass(inst)
+            self.index.invalidate(metaclass)
+            self.model_modified(metaclass)
+            
+        else:
+            self.model_modified()
+        
     def chain(self, inst):
         return xtuml.navigate_many(inst)
     
+    def navigate(self, handle, navigations):
+        '''
+        Navigate from an instance or a set of instances across a sequence of
+        (key_letter, rel_id, phrase) triples, and return the resulting set.
+        '''
+        if not self.navigation_cache:
+            chain = self.chain(handle)
+            for key_letter, rel_id, phrase in navigations:
+                chain = chain.nav(key_letter, rel_id, phrase)
+                
+            return chain()
+        
+        if handle is None:
+            handle = ()
+            
+        elif isinstance(handle, xtuml.Class):
+            handle = (handle,)
+            
+        elif not isinstance(handle, Iterable):
+            raise xtuml.MetaException("Unable to navigate across '%s'"
+                                      % type(handle))
+        
+        navigate = self.navigations.navigate
+        for key_letter, rel_id, phrase in navigations:
+            if isinstance(rel_id, int):
+                rel_id = 'R%d' % rel_id
+                
+            result = list()
+            for inst in handle:
+                result.extend(navigate(inst, key_letter, rel_id, phrase))
+                
+            handle = result
+        
+        return xtuml.QuerySet(handle)
+    
     def select_any_from(self, key_letter, where_cond):
         return self.metamodel.select_any(key_letter, where_cond)
          
@@ -400,14 +1284,21 @@ class Runtime(object):
 
 class Bridge(object):
     '''
-    Decorator for adding bridges to the Runtime class.
+    Decorator for adding bridges to the Runtime class. Unless told otherwise
+    by *modifies_model* and *accesses_files*, a bridge is assumed to modify
+    the model and to read or write files, e.g. files that are emitted.
     '''
     cls = None
     name = None
+    modifies_model = True
+    accesses_files = True
     
-    def __init__(self, name, cls=None):
+    def __init__(self, name, cls=None, modifies_model=True,
+                 accesses_files=True):
         self.name = name
         self.cls = cls
+        self.modifies_model = modifies_model
+        self.accesses_files = accesses_files
         
     def __call__(self, f):
         cls = self.cls or Runtime
@@ -420,6 +1311,8 @@ class Bridge(object):
                 res['attr_%s' % key] = value
             return res
         
+        wrapper.modifies_model = self.modifies_model
+        wrapper.accesses_files = self.accesses_files
         cls.bridges[name] = wrapper
         
         return f
@@ -427,7 +1320,7 @@ class Bridge(object):
 bridge = Bridge
 
 
-@bridge('GET_ENV_VAR')
+@bridge('GET_ENV_VAR', modifies_model=False, accesses_files=False)
 def get_env_var(name):
     if name in os.environ:
         result = os.environ[name]
@@ -440,18 +1333,18 @@ def get_env_var(name):
             'result': result}
 
 
-@bridge('PUT_ENV_VAR')
+@bridge('PUT_ENV_VAR', modifies_model=False, accesses_files=False)
 def put_env_var(value, name):
     os.environ[name] = value
     return {'success': name in os.environ}
 
 
-@bridge('SHELL_COMMAND')
+@bridge('SHELL_COMMAND', modifies_model=False)
 def shell_command(cmd):
     return {'result': subprocess.call(cmd, shell=True)}
 
 
-@bridge('FILE_READ')
+@bridge('FILE_READ', modifies_model=False)
 def file_read(filename):
     try:
         with open(filename, 'r') as f:
@@ -465,7 +1358,7 @@ def file_read(filename):
             'result': result}
 
 
-@bridge('FILE_WRITE')
+@bridge('FILE_WRITE', modifies_model=False)
 def file_write(contents, filename):
     try:
         with open(filename, 'w') as f:
@@ -477,7 +1370,7 @@ def file_write(contents, filename):
     return {'success': success}
 
 
-@bridge('STRING_TO_INTEGER')
+@bridge('STRING_TO_INTEGER', modifies_model=False, accesses_files=False)
 def string_to_integer(value):
     try:
         return {'result': int(value.strip())}
@@ -485,7 +1378,7 @@ def string_to_integer(value):
         raise RuntimeException('Unable to convert the string "%s" to an integer' % value)
 
     
-@bridge('STRING_TO_REAL')
+@bridge('STRING_TO_REAL', modifies_model=False, accesses_files=False)
 def string_to_real(value):
     try:
         return {'result': float(value.strip())}
@@ -493,17 +1386,17 @@ def string_to_real(value):
         raise RuntimeException('Unable to convert the string "%s" to a real' % value)
 
     
-@bridge('INTEGER_TO_STRING')
+@bridge('INTEGER_TO_STRING', modifies_model=False, accesses_files=False)
 def integer_to_string(value):
     return {'result': str(value)}
 
 
-@bridge('REAL_TO_STRING')
+@bridge('REAL_TO_STRING', modifies_model=False, accesses_files=False)
 def real_to_string(value):
     return {'result': str(value)}
 
 
-@bridge('BOOLEAN_TO_STRING')
+@bridge('BOOLEAN_TO_STRING', modifies_model=False, accesses_files=False)
 def boolean_to_string(value):
     return {'result': str(value).upper()}  
 
@@ -537,13 +1430,10 @@ def camelcase(value):
     following word capitalized and all other characters of the words lower
     case. Characters other than a-Z a-z 0-9 are ignored.
     '''
-    whitespace_regexp = re.compile(r'\s+')
-    nonword_regexp = re.compile(r'[^\w]')
-    
     value = value.replace('_', ' ')
     value = value.title()
-    value = re.sub(nonword_regexp, '', value)
-    value = re.sub(whitespace_regexp, '', value)
+    value = NONWORD_REGEXP.sub('', value)
+    value = WHITESPACE_REGEXP.sub('', value)
     if value:
         value = value[0].lower() + value[1:]
         
@@ -573,15 +1463,13 @@ def capitalize(value):
 @string_formatter('_')
 def underscore(value):
     'Change all white space characters in value to underscore characters'
-    regexp = re.compile(r'\s+')
-    return re.sub(regexp, '_', value)
+    return WHITESPACE_REGEXP.sub('_', value)
 
 
 @string_formatter('r')
 def remove_whitespace(value):
     'Remove all white space characters in value'
-    regexp = re.compile(r'\s+')
-    return re.sub(regexp, '', value)
+    return WHITESPACE_REGEXP.sub('', value)
 
 
 @string_formatter('t')
@@ -661,8 +1549,7 @@ def xml_quot(value):
 @string_formatter('txmlname')
 def xml_name(value):
     'Replace illegal characters in an XML name with an underscore'
-    regexp = re.compile(r'(^[^\w_])|[^\w_.-]')
-    return re.sub(regexp, '_', value)
+    return XML_NAME_REGEXP.sub('_', value)
 
 
 class NavigationParser(StringFormatter):
@@ -743,3 +1630,6 @@ def remove_last_navigation_step(result):
     return result.string[:result.start(1)]
 
 
+#: The builtin string formatters, which always produce the same output for a
+#: given input.
+PURE_FORMATTERS = frozenset(Runtime.string_formatters.values())
@@ -0,0 +1,242 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+'''
+Binary snapshots of xtuml metamodels. A snapshot is a versioned file that
+starts with a fixed-size header and a table of contents, followed by a
+number of sections: the schema, the instances of each class, and the links
+of each association. Sections are serialized with marshal, which only handles
+plain values, and are aligned so that the file may be mapped into memory.
+Sections of classes and associations that have not been modified since the
+snapshot was loaded are reused as is when the snapshot is saved again.
+
+Instances are restored without the need to parse any SQL or to compute the
+connections between instances from their referential attributes, which makes
+loading a snapshot considerably faster than loading the equivalent SQL.
+'''
+
+
+import struct
+import marshal
+import logging
+
+import xtuml
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'RSLSNAP\0'
+
+#: Version of the snapshot format, bumped on incompatible changes.
+VERSION = 1
+
+HEADER = struct.Struct('<8sHHI')
+TOC_ENTRY = struct.Struct('<QQ')
+ALIGNMENT = 8
+
+
+class SnapshotException(Exception):
+    pass
+
+
+def is_snapshot(filename):
+    '''
+    Check if a file contains a snapshot, rather than e.g. SQL.
+    '''
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def serialize_schema(metamodel):
+    classes = list()
+    for metaclass in metamodel.metaclasses.values():
+        classes.append((metaclass.kind,
+                        tuple(metaclass.attributes),
+                        tuple(sorted(metaclass.indices.items()))))
+
+    associations = list()
+    for ass in metamodel.associations:
+        source = ass.source_link
+        target = ass.target_link
+        associations.append((ass.rel_id,
+                             source.to_metaclass.kind,
+                             tuple(ass.source_keys),
+                             source.many,
+                             source.conditional,
+                             target.phrase,
+                             target.to_metaclass.kind,
+                             tuple(ass.target_keys),
+                             target.many,
+                             target.conditional,
+                             source.phrase))
+
+    return tuple(classes), tuple(associations)
+
+
+def serialize_instances(metaclass):
+    names = tuple(name for name, _ in metaclass.attributes
+                  if name not in metaclass.referential_attributes)
+    values = tuple(tuple(inst.__dict__.get(name) for name in names)
+                   for inst in metaclass.storage)
+
+    return names, values
+
+
+def serialize_link(link, rows):
+    connections = list()
+    for inst, others in link.items():
+        if id(inst) not in rows:
+            continue
+
+        indices = tuple(rows[id(other)] for other in others
+                        if id(other) in rows)
+        connections.append((rows[id(inst)], indices))
+
+    return tuple(connections)
+
+
+def save(metamodel, filename, segments=None, modified=()):
+    '''
+    Save a snapshot of a *metamodel* to a file. Optionally, *segments*
+    returned when the snapshot was loaded may be passed together with the
+    metaclasses that have been *modified* since then, in which case the
+    sections of unmodified classes and associations are reused.
+    '''
+    segments = segments or dict()
+    rows = dict()
+    reused = 0
+    sections = [marshal.dumps(serialize_schema(metamodel))]
+    for metaclass in metamodel.metaclasses.values():
+        for index, inst in enumerate(metaclass.storage):
+            rows[id(inst)] = index
+
+        if metaclass in segments and metaclass not in modified:
+            sections.append(segments[metaclass])
+            reused += 1
+        else:
+            section = serialize_instances(metaclass)
+            sections.append(marshal.dumps(section))
+
+    for ass in metamodel.associations:
+        if (ass in segments and
+            ass.source_link.to_metaclass not in modified and
+            ass.target_link.to_metaclass not in modified):
+            sections.append(segments[ass])
+            reused += 1
+        else:
+            section = (serialize_link(ass.source_link, rows),
+                       serialize_link(ass.target_link, rows))
+            sections.append(marshal.dumps(section))
+
+    offset = HEADER.size + TOC_ENTRY.size * len(sections)
+    toc = list()
+    for section in sections:
+        offset += -offset % ALIGNMENT
+        toc.append((offset, len(section)))
+        offset += len(section)
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, marshal.version, len(sections)))
+        for entry in toc:
+            f.write(TOC_ENTRY.pack(*entry))
+
+        for (offset, _), section in zip(toc, sections):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(section)
+
+    logger.debug('Saved snapshot of %d instances to %s, reusing %d of %d '
+                 'sections', len(rows), filename, reused, len(sections) - 1)
+
+
+def read_sections(filename):
+    '''
+    Read the raw sections of a snapshot.
+    '''
+    with open(filename, 'rb') as f:
+        buf = f.read()
+
+    if len(buf) < HEADER.size:
+        raise SnapshotException('%s: not a snapshot' % filename)
+
+    magic, version, marshal_version, count = HEADER.unpack(buf[:HEADER.size])
+    if magic != MAGIC:
+        raise SnapshotException('%s: not a snapshot' % filename)
+
+    if version != VERSION or marshal_version != marshal.version:
+        raise SnapshotException('%s: unsupported snapshot version %d.%d'
+                                % (filename, version, marshal_version))
+
+    sections = list()
+    for index in range(count):
+        start = HEADER.size + index * TOC_ENTRY.size
+        offset, length = TOC_ENTRY.unpack(buf[start:start + TOC_ENTRY.size])
+        if offset + length > len(buf):
+            raise SnapshotException('%s: truncated snapshot' % filename)
+
+        sections.append(buf[offset:offset + length])
+
+    return sections
+
+
+def restore_link(link, connections, source, target):
+    for index, indices in connections:
+        link[source[index]] = xtuml.OrderedSet(target[i] for i in indices)
+
+
+def load(metamodel, filename):
+    '''
+    Load a snapshot from a file into a *metamodel*. The raw sections of the
+    snapshot are returned as segments, keyed by metaclass and association,
+    so that they may be reused when the snapshot is saved again.
+    '''
+    sections = read_sections(filename)
+    classes, associations = marshal.loads(sections[0])
+    class_sections = sections[1:len(classes) + 1]
+    link_sections = sections[len(classes) + 1:]
+    links = [marshal.loads(section) for section in link_sections]
+    if len(link_sections) != len(associations):
+        raise SnapshotException('%s: corrupt snapshot' % filename)
+
+    metaclasses = list()
+    for kind, attributes, indices in classes:
+        metaclass = metamodel.define_class(kind, attributes)
+        for name, attribute_names in indices:
+            metamodel.define_unique_identifier(kind, name, *attribute_names)
+
+        metaclasses.append(metaclass)
+
+    defined = list()
+    for args in associations:
+        ass = metamodel.define_association(*args)
+        ass.formalize()
+        defined.append(ass)
+
+    segments = dict()
+    storage = dict()
+    for metaclass, section in zip(metaclasses, class_sections):
+        names, values = marshal.loads(section)
+        clazz = metaclass.clazz
+        instances = list()
+        for row in values:
+            inst = clazz()
+            inst.__dict__.update(zip(names, row))
+            instances.append(inst)
+
+        metaclass.storage.extend(instances)
+        storage[metaclass] = instances
+        segments[metaclass] = section
+
+    for ass, section, (source, target) in zip(defined, link_sections, links):
+        source_class = ass.source_link.to_metaclass
+        target_class = ass.target_link.to_metaclass
+        restore_link(ass.source_link, source, storage[target_class],
+                     storage[source_class])
+        restore_link(ass.target_link, target, storage[source_class],
+                     storage[target_class])
+        segments[ass] = section
+
+    logger.debug('Loaded snapshot of %d instances from %s',
+                 sum(len(instances) for instances in storage.values()),
+                 filename)
+
+    return segments
@@ -10,21 +10,41 @@ class SymtabException(Exception):
 
 
 class Block(dict):
+    '''
+    Names declared in a block, mapping the normalized (lower case) name to
+    the name as it was spelled when first installed.
+    '''
     pass
 
 
 class Scope(list):
+    '''
+    Blocks of a scope. Since a name is declared at most once per scope,
+    values are indexed by their normalized name in a single dictionary.
+    '''
     
     def __init__(self):
+        self.values = dict()
         self.append(Block())
 
+    def install(self, name, handle):
+        key = name.lower()
+        if key not in self.values:
+            self[-1][key] = name
+            
+        self.values[key] = handle
+        
     @property
     def symbols(self):
+        return self.to_dict().items()
+    
+    def to_dict(self):
         return_symbols = dict()
-        for d in self:
-            return_symbols.update(d)
+        for block in self:
+            for key, name in block.items():
+                return_symbols[name] = self.values[key]
             
-        return return_symbols.items()
+        return return_symbols
     
 
 class SymbolTable(object):
@@ -49,45 +69,35 @@ class SymbolTable(object):
         if not len(self._scopes): 
             raise SymtabException('Out of scope')
         
-        d = dict()
-        for block in self._scopes.pop():
-            d.update(block)
-        return d
+        return self._scopes.pop().to_dict()
     
     def enter_block(self):        
         block = Block()
         self.scope_head.append(block)
     
     def leave_block(self):
-        if not len(self.scope_head): 
+        scope = self.scope_head
+        if not len(scope): 
             raise SymtabException('Out of block')
         
-        block = self.scope_head.pop()
-        del block
+        block = scope.pop()
+        for key in block:
+            del scope.values[key]
     
     def install_global(self, name, handle):
-        self._global_scope[name] = handle
+        self._global_scope[name.lower()] = handle
         
     def install_symbol(self, name, handle):
-        for block in self.scope_head:
-            for key in block.keys():
-                if key.lower() == name.lower():
-                    block[key] = handle
-                    return
-
-        block = self.scope_head[-1]
-        block[name] = handle
+        self.scope_head.install(name, handle)
 
     def find_symbol(self, name):
-        for block in self.scope_head:
-            for key in block.keys():
-                if key.lower() == name.lower():
-                    return block[key]
+        key = name.lower()
+        values = self.scope_head.values
+        if key in values:
+            return values[key]
         
-        for key in self._global_scope.keys():
-            if key.lower() == name.lower():
-                return self._global_scope[key]
+        if key in self._global_scope:
+            return self._global_scope[key]
         
         raise SymtabException("Unknown symbol '%s'" % name)
 
-
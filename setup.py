@@ -54,6 +54,40 @@ class TestCommand(Command):
         sys.exit(exit_code)
 
 
+class BenchCommand(Command):
+    description = "Execute benchmarks"
+    user_options = [('name=', None, 'Limit benchmarking to a single benchmark'),
+                    ('scale=', None, 'Scale factor applied to the size of each benchmark')]
+
+    def initialize_options(self):
+        self.name = None
+        self.scale = 1
+
+    def finalize_options(self):
+        if self.name and not self.name.startswith('benchmarks.'):
+            self.name = 'benchmarks.' + self.name
+
+        self.scale = int(self.scale)
+
+    def run(self):
+        import importlib
+
+        logging.getLogger().setLevel(logging.WARNING)
+        if self.name:
+            names = [self.name]
+        else:
+            names = sorted('benchmarks.' + filename[:-3]
+                           for filename in os.listdir('benchmarks')
+                           if filename.startswith('bench_') and
+                              filename.endswith('.py'))
+
+        for name in names:
+            print('%s (scale=%d)' % (name, self.scale))
+            mod = importlib.import_module(name)
+            mod.main(self.scale)
+            print('')
+
+
 class BundleCommand(Command):
     description = "Bundle pyrsl into a self-contained and executable pyz archive"
     user_options = [('main=', 'm', 'Path to a customized entry point'),
@@ -131,6 +165,7 @@ opts = dict(name='pyrsl',
                            ['editors/gtksourceview/rsl.lang'])],
             requires=['ply', 'xtuml'],
             cmdclass={'build_py': BuildCommand,
+                      'bench': BenchCommand,
                       'bundle': BundleCommand,
                       'test': TestCommand})
 
@@ -0,0 +1,66 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import pickle
+import unittest
+
+import rsl
+import rsl.ast
+
+
+class TestAST(unittest.TestCase):
+
+    def parse(self, text, filename='test.arc'):
+        return rsl.parse_text(text, filename)
+
+    def test_slots(self):
+        root = self.parse('.assign x = 1\n')
+        stmt = root.statement_list.statements[0]
+        self.assertFalse(hasattr(stmt, '__dict__'))
+        self.assertRaises(AttributeError, setattr, stmt, 'unknown', 1)
+
+    def test_tuple_fields(self):
+        root = self.parse('.select many insts from instances of A\n'
+                          '.select any inst related by insts->B[R1]->C[R2]\n')
+        stmts = root.statement_list.statements
+        self.assertIsInstance(stmts, tuple)
+        self.assertIsInstance(stmts[1].instance_chain.navigations, tuple)
+
+    def test_children(self):
+        root = self.parse('.select any inst related by x->B[R1]->C[R2]\n')
+        chain = root.statement_list.statements[0].instance_chain
+        self.assertEqual((chain.variable,) + chain.navigations,
+                         chain.children)
+        self.assertIs(chain.children, chain.children)
+
+    def test_interned_filename(self):
+        root1 = self.parse('.exit 1\n', ''.join(['test', '.arc']))
+        root2 = self.parse('.exit 2\n', ''.join(['test', '.arc']))
+        stmt1 = root1.statement_list.statements[0]
+        stmt2 = root2.statement_list.statements[0]
+        self.assertIs(stmt1.filename, stmt2.filename)
+
+    def test_pickle(self):
+        root = self.parse('.if (x)\n'
+                          'Hello ${x}\n'
+                          '.end if\n')
+        s = pickle.dumps(root, pickle.HIGHEST_PROTOCOL)
+        copy = pickle.loads(s)
+        stmt = copy.statement_list.statements[0]
+        self.assertIsInstance(stmt, rsl.ast.IfNode)
+        self.assertIs(stmt.iftrue, stmt.children[1])
+        self.assertEqual('test.arc', stmt.filename)
+        self.assertEqual(2, stmt.iftrue.statements[0].lineno)
+
+    def test_freeze(self):
+        node = rsl.ast.ElIfListNode()
+        node.elifs.append(rsl.ast.ElIfNode(None, rsl.ast.StatementListNode()))
+        rsl.ast.freeze(node)
+        self.assertIsInstance(node.elifs, tuple)
+        self.assertEqual(node.elifs, node.children)
+        self.assertEqual((None, node.elifs[0].statement_list),
+                         node.elifs[0].children)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -330,3 +330,81 @@ class TestBinaryOperation(RSLTestCase):
         '''
         self.assertEqual(0, rc)
 
+
+    @evaluate_docstring
+    def test_pipe_accumulation(self, rc):
+        '''
+        .create object instance a1 of A
+        .create object instance a2 of A
+        .create object instance a3 of A
+        .assign a1.Name = "A1"
+        .assign a2.Name = "A2"
+        .assign a3.Name = "A3"
+        .select many all_set from instances of A
+        .select many a_set from instances of A where (false)
+        .for each a in all_set
+          .assign a_set = a_set | a
+          .assign a_set = a_set | a1
+        .end for
+        .assign s = ""
+        .for each a in a_set
+          .assign s = s + a.Name
+        .end for
+        .exit s
+        '''
+        self.assertEqual('A1A2A3', rc)
+
+    @evaluate_docstring
+    def test_pipe_accumulation_with_aliases(self, rc):
+        '''
+        .create object instance a1 of A
+        .create object instance a2 of A
+        .create object instance a3 of A
+        .assign a1.Name = "A1"
+        .assign a2.Name = "A2"
+        .assign a3.Name = "A3"
+        .select many a_set from instances of A where (false)
+        .assign a_set = a_set | a1
+        .assign b_set = a_set
+        .assign a_set = a_set | a2
+        .assign c_set = b_set | a3
+        .assign s = ""
+        .for each a in b_set
+          .assign s = s + a.Name
+        .end for
+        .assign s = s + ","
+        .for each a in a_set
+          .assign s = s + a.Name
+        .end for
+        .assign s = s + ","
+        .for each a in c_set
+          .assign s = s + a.Name
+        .end for
+        .exit s
+        '''
+        self.assertEqual('A1,A1A2,A1A3', rc)
+
+    @evaluate_docstring
+    def test_set_operations_order(self, rc):
+        '''
+        .create object instance a1 of A
+        .create object instance a2 of A
+        .create object instance a3 of A
+        .assign a1.Name = "A1"
+        .assign a2.Name = "A2"
+        .assign a3.Name = "A3"
+        .select many all_set from instances of A
+        .assign a_set = a3 | a1
+        .assign b_set = all_set & a_set
+        .assign c_set = a_set ^ a2
+        .assign s = ""
+        .for each a in b_set
+          .assign s = s + a.Name
+        .end for
+        .assign s = s + ","
+        .for each a in c_set
+          .assign s = s + a.Name
+        .end for
+        .exit s
+        '''
+        self.assertEqual('A3A1,A3A1A2', rc)
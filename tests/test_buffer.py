@@ -0,0 +1,59 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+from utils import RSLTestCase
+
+import rsl
+
+
+class TestBuffer(RSLTestCase):
+
+    def buffered(self, parts):
+        self.runtime.clear_buffer()
+        self.runtime.buffer_literals(parts)
+        return self.runtime.buffer.getvalue()
+
+    def test_output_buffer(self):
+        buf = rsl.runtime.OutputBuffer()
+        self.assertEqual('', buf.getvalue())
+        
+        buf.write('Hello')
+        buf.write('')
+        buf.write(' world')
+        self.assertEqual(['Hello', ' world'], buf.chunks)
+        self.assertEqual('Hello world', buf.getvalue())
+        self.assertEqual(['Hello world'], buf.chunks)
+        
+        buf.close()
+        self.assertEqual('', buf.getvalue())
+        
+    def test_parts_are_not_joined(self):
+        self.runtime.clear_buffer()
+        body = 'x' * 100
+        self.runtime.buffer_literals(['  ', body, '\n'])
+        self.assertIs(body, self.runtime.buffer.chunks[1])
+
+    def test_parts_like_joined(self):
+        for parts in [[], [''], ['a', 'b'], ['a', '\n'], ['a\\', '\\'],
+                      ['a\\\\', '\\'], ['a', '\\', '\\', '\\'], ['\\\\\\'],
+                      ['a', '', '\\'], ['a\\', '\\', '']]:
+            runtime = rsl.runtime.Runtime(self.metamodel)
+            runtime.buffer_literal(''.join(parts))
+            self.assertEqual(runtime.buffer.getvalue(), self.buffered(parts))
+
+    def test_nested_fragments(self):
+        text = '''
+.function inner
+  .param integer n
+Inner ${n}\\
+.end function
+.function outer
+  .invoke i1 = inner(1)
+  .invoke i2 = inner(2)
+${i1.body} and ${i2.body}
+.end function
+.invoke o = outer()
+.exit o.body
+'''
+        self.assertEqual('Inner 1 and Inner 2\n', self.eval_text(text))
+
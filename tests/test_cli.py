@@ -3,9 +3,11 @@
 
 import unittest
 import tempfile
+import gzip
 import sys
 import os
 import stat
+import shutil
 import logging
 
 try:
@@ -198,7 +200,89 @@ class TestCommandLineInterface(unittest.TestCase):
             s = f.read()
             self.assertIn('CREATE TABLE', s)
             self.assertIn('INSERT INTO', s)
+
+
+    def test_persist_unchanged(self):
+        db = self.temp_file(mode='w')
+        db.file.write('CREATE TABLE Cls (Id UNIQUE_ID);\n')
+        db.file.write('-- a comment that is lost when the database is saved\n')
+        db.file.flush()
+
+        script = self.temp_file(mode='w')
+        script.file.write('.select many clss from instances of Cls\n')
+        script.file.flush()
+
+        argv = ['test_persist_unchanged',
+                '-f', db.name,
+                '-arch', script.name]
+
+        rsl.main(argv)
+        with open(db.name, 'r') as f:
+            self.assertIn('a comment', f.read())
+
+        script = self.temp_file(mode='w')
+        script.file.write('.create object instance cls of Cls\n')
+        script.file.flush()
+
+        argv = ['test_persist_unchanged',
+                '-f', db.name,
+                '-arch', script.name]
+
+        rsl.main(argv)
+        with open(db.name, 'r') as f:
+            s = f.read()
+            self.assertNotIn('a comment', s)
+            self.assertIn('INSERT INTO', s)
+
+        os.remove(db.name + '.manifest')
     
+    def test_persist_bridge(self):
+        @rsl.bridge('TEST_PERSIST_BRIDGE')
+        def rename(inst):
+            inst.Name = 'renamed'
+
+        db = self.temp_file(mode='w')
+        db.file.write('CREATE TABLE Cls (Name STRING);\n')
+        db.file.write("INSERT INTO Cls VALUES ('original');\n")
+        db.file.flush()
+
+        script = self.temp_file(mode='w')
+        script.file.write('.select any cls from instances of Cls\n')
+        script.file.write('.invoke TEST_PERSIST_BRIDGE(cls)\n')
+        script.file.flush()
+
+        argv = ['test_persist_bridge',
+                '-f', db.name,
+                '-arch', script.name]
+        try:
+            rsl.main(argv)
+        finally:
+            del rsl.Runtime.bridges['TEST_PERSIST_BRIDGE']
+
+        with open(db.name, 'r') as f:
+            self.assertIn('renamed', f.read())
+
+        os.remove(db.name + '.manifest')
+
+    def test_persist_builtin_bridge(self):
+        db = self.temp_file(mode='w')
+        db.file.write('CREATE TABLE Cls (Name STRING);\n')
+        db.file.write('-- a comment that is lost when the database is saved\n')
+        db.file.flush()
+
+        script = self.temp_file(mode='w')
+        script.file.write('.invoke s = INTEGER_TO_STRING(1)\n')
+        script.file.flush()
+
+        argv = ['test_persist_builtin_bridge',
+                '-f', db.name,
+                '-arch', script.name]
+        rsl.main(argv)
+        with open(db.name, 'r') as f:
+            self.assertIn('a comment', f.read())
+
+        os.remove(db.name + '.manifest')
+
     def test_disable_emit(self):
         emit_filename = tempfile.mktemp().replace('\\', '/')
         script = self.temp_file(mode='w')
@@ -254,6 +338,176 @@ class TestCommandLineInterface(unittest.TestCase):
             s = f.read()
             self.assertIn('Hello file', s)
 
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        script = self.temp_file(mode='w')
+        script.file.write('.print "Hello"\n')
+        script.file.write('.include "spam.inc"\n')
+        script.file.flush()
+        
+        argv = ['test_cache', 
+                '-arch', script.name,
+                '-include', 
+                os.path.dirname(__file__) + os.path.sep + 'test_files',
+                '-cache', cache_dir,
+                '-nopersist']
+        
+        # left behind by an interrupted write, and removed when pruning
+        stale = os.path.join(cache_dir, 'stale.tmp')
+        with open(stale, 'w') as f:
+            f.write('partial')
+        os.utime(stale, (0, 0))
+        
+        rsl.main(argv)
+        rsl.main(argv)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(4, output.count('Hello'))
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+        shutil.rmtree(cache_dir)
+
+    def test_emitthreads(self):
+        script = self.temp_file(mode='w')
+        emitted = self.temp_file(mode='r')
+        script.file.write('Hello\n')
+        script.file.write('.emit to file "%s"\n' % emitted.name)
+        script.file.flush()
+        
+        argv = ['test_emitthreads', 
+                '-arch', script.name,
+                '-emitthreads', '2',
+                '-nopersist']
+        
+        rsl.main(argv)
+        with open(emitted.name, 'r') as f:
+            self.assertEqual('Hello\n', f.read())
+
+    def test_profile(self):
+        script = self.temp_file(mode='w')
+        profile = self.temp_file(mode='r')
+        script.file.write('.function f\n')
+        script.file.write('.end function\n')
+        script.file.write('.invoke f()\n')
+        script.file.flush()
+        
+        argv = ['test_profile', 
+                '-arch', script.name,
+                '-profile', profile.name,
+                '-nopersist']
+        
+        rsl.main(argv)
+        with open(profile.name, 'r') as f:
+            self.assertIn('fn=f\n', f.read())
+            
+        self.assertIn('%s:1 f' % script.name, sys.stdout.getvalue())
+        
+    def test_memoize(self):
+        script = self.temp_file(mode='w')
+        script.file.write('.function f\n')
+        script.file.write('.print "Hello"\n')
+        script.file.write('.end function\n')
+        script.file.write('.invoke f()\n')
+        script.file.write('.invoke f()\n')
+        script.file.flush()
+        
+        argv = ['test_memoize', 
+                '-arch', script.name,
+                '-memoize', 'f',
+                '-nopersist']
+        
+        rsl.main(argv)
+        
+        # functions with side effects are never memoized
+        self.assertEqual(2, sys.stdout.getvalue().count('Hello'))
+        
+    def test_jobs(self):
+        scripts = list()
+        for i in range(3):
+            script = self.temp_file(mode='w')
+            script.file.write('.print "Hello %d"\n' % i)
+            script.file.flush()
+            scripts.extend(['-arch', script.name])
+        
+        argv = ['test_jobs', '-jobs', '2', '-nopersist'] + scripts
+        rsl.main(argv)
+        output = sys.stdout.getvalue()
+        positions = [output.index('Hello %d' % i) for i in range(3)]
+        self.assertEqual(sorted(positions), positions)
+        
+    def test_jobs_emit(self):
+        include = self.temp_file(mode='w')
+        include.file.write('.print "old"\n')
+        include.file.flush()
+
+        scripts = list()
+        for text in ['..print "new"\n.emit to file "%s"\n' % include.name,
+                     '.include "%s"\n' % include.name]:
+            script = self.temp_file(mode='w')
+            script.file.write(text)
+            script.file.flush()
+            scripts.extend(['-arch', script.name])
+
+        argv = ['test_jobs_emit', '-jobs', '2', '-nopersist'] + scripts
+        rsl.main(argv)
+        output = sys.stdout.getvalue()
+        self.assertIn('new', output)
+        self.assertNotIn('old', output)
+
+    def test_jobs_bridge(self):
+        @rsl.bridge('TEST_JOBS_BRIDGE')
+        def rename(inst):
+            inst.Name = 'renamed'
+
+        db = self.temp_file(mode='w')
+        db.file.write('CREATE TABLE Cls (Name STRING);\n')
+        db.file.write("INSERT INTO Cls VALUES ('original');\n")
+        db.file.flush()
+
+        scripts = list()
+        for text in ['.select any cls from instances of Cls\n'
+                     '.invoke TEST_JOBS_BRIDGE(cls)\n',
+                     '.select any cls from instances of Cls\n'
+                     '.print "${cls.Name}"\n']:
+            script = self.temp_file(mode='w')
+            script.file.write(text)
+            script.file.flush()
+            scripts.extend(['-arch', script.name])
+
+        argv = ['test_jobs_bridge', '-jobs', '2', '-parallelemit',
+                '-f', db.name] + scripts
+        try:
+            rsl.main(argv)
+        finally:
+            del rsl.Runtime.bridges['TEST_JOBS_BRIDGE']
+
+        self.assertIn('INFO:  renamed', sys.stdout.getvalue())
+        with open(db.name, 'r') as f:
+            self.assertIn('renamed', f.read())
+
+        os.remove(db.name + '.manifest')
+
+    def test_preload(self):
+        includes = list()
+        for i in range(3):
+            include = self.temp_file(mode='w')
+            include.file.write('.print "Included %d"\n' % i)
+            include.file.flush()
+            includes.append(include.name)
+
+        scripts = list()
+        for i in range(2):
+            script = self.temp_file(mode='w')
+            for name in includes:
+                script.file.write('.include "%s"\n' % name)
+            script.file.flush()
+            scripts.extend(['-arch', script.name])
+
+        argv = ['test_preload', '-preload', '-jobs', '2',
+                '-nopersist'] + scripts
+        rsl.main(argv)
+        output = sys.stdout.getvalue()
+        for i in range(3):
+            self.assertEqual(2, output.count('Included %d' % i))
+
     def test_dumpsql(self):
         dump = self.temp_file(mode='r')
         schema = self.temp_file(mode='w')
@@ -278,6 +532,74 @@ class TestCommandLineInterface(unittest.TestCase):
             s = f.read()
             self.assertIn('INSERT INTO Person', s)
 
+    def test_dumpsql_gzip(self):
+        dump = self.temp_file(mode='r')
+        schema = self.temp_file(mode='w')
+        schema.file.write('CREATE TABLE Person (Name STRING);\n')
+        schema.file.write('CREATE TABLE Pet (Name STRING);\n')
+        schema.file.flush()
+
+        script = self.temp_file(mode='w')
+        script.file.write('.create object instance person of Person\n')
+        script.file.write('.create object instance pet of Pet\n')
+        script.file.flush()
+
+        filename = dump.name + '.gz'
+        argv = ['test_dumpsql_gzip',
+                '-nopersist',
+                '-dumpsql', filename,
+                '-dumpsqlclass', 'Pet',
+                '-import', schema.name,
+                '-arch', script.name]
+
+        try:
+            self.assertEqual(0, rsl.main(argv))
+            with gzip.open(filename, 'rb') as f:
+                s = f.read().decode('utf-8')
+        finally:
+            os.remove(filename)
+
+        self.assertIn('INSERT INTO Pet', s)
+        self.assertNotIn('INSERT INTO Person', s)
+
+    def test_dumpsnapshot(self):
+        snapshot = self.temp_file(mode='r')
+        schema = self.temp_file(mode='w')
+        schema.file.write('CREATE TABLE Person (Name STRING, Age INTEGER);\n')
+        schema.file.flush()
+
+        script = self.temp_file(mode='w')
+        script.file.write('.create object instance person1 of Person\n')
+        script.file.write('.assign person1.Name = "Levi"\n')
+        script.file.write('.assign person1.Age = 24\n')
+        script.file.flush()
+
+        argv = ['test_dumpsnapshot',
+                '-nopersist',
+                '-dumpsnapshot', snapshot.name,
+                '-import', schema.name,
+                '-arch', script.name]
+
+        self.assertEqual(0, rsl.main(argv))
+        self.assertTrue(rsl.snapshot.is_snapshot(snapshot.name))
+
+        script = self.temp_file(mode='w')
+        script.file.write('.select any person from instances of Person\n')
+        script.file.write('.assign person.Age = person.Age + 1\n')
+        script.file.write('.print "${person.Name} ${person.Age}"\n')
+        script.file.flush()
+
+        argv = ['test_dumpsnapshot',
+                '-f', snapshot.name,
+                '-arch', script.name]
+
+        for age in [25, 26]:
+            self.assertEqual(0, rsl.main(argv))
+            self.assertIn('Levi %d' % age, sys.stdout.getvalue())
+            self.assertTrue(rsl.snapshot.is_snapshot(snapshot.name))
+
+        os.remove(snapshot.name + '.manifest')
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,183 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import sys
+
+from utils import RSLTestCase
+
+import rsl
+
+
+class TestCompile(RSLTestCase):
+
+    def eval_both(self, text):
+        results = list()
+        for compiled in [False, True]:
+            ast = rsl.parse_text(text + '\n', '')
+            try:
+                rsl.evaluate(self.runtime, ast, self.includes, compiled)
+            except SystemExit as e:
+                results.append(e.code)
+            else:
+                results.append(None)
+
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_function_invoked_in_loop(self):
+        text = '''
+        .function f
+          .param integer x
+          .assign attr_value = x * 2
+        .end function
+        .assign i = 0
+        .assign sum = 0
+        .while (i < 100)
+          .invoke res = f(i)
+          .assign sum = sum + res.value
+          .assign i = i + 1
+        .end while
+        .exit sum
+        '''
+        self.assertEqual(9900, self.eval_both(text))
+
+    def test_nested_control_flow(self):
+        text = '''
+        .assign s = ""
+        .assign i = 0
+        .while (i < 10)
+          .assign i = i + 1
+          .if ((i % 2) == 0)
+            .assign s = s + "e"
+          .elif (i == 5)
+            .break while
+          .else
+            .assign s = s + "o"
+          .end if
+        .end while
+        .exit s
+        '''
+        self.assertEqual('oeoe', self.eval_both(text))
+
+    def test_select_where(self):
+        self.metamodel.define_class('A', [('Id', 'INTEGER')])
+        for i in range(10):
+            self.metamodel.new('A', Id=i)
+
+        text = '''
+        .select many a_set from instances of A where (selected.Id > 4)
+        .assign x = 0
+        .for each a in a_set
+          .if (not_last a_set)
+            .assign x = x + a.Id
+          .end if
+        .end for
+        .exit x
+        '''
+        self.assertEqual(5 + 6 + 7 + 8, self.eval_both(text))
+
+    def test_literal_output(self):
+        text = '''
+        .function f
+          .param string name
+Hello $u{name}!
+        .end function
+        .invoke res = f("world")
+        .exit res.body
+        '''
+        self.assertEqual('Hello WORLD!\n', self.eval_both(text))
+
+    def test_compile_once(self):
+        text = '''
+        .function f
+        .end function
+        '''
+        root = rsl.parse_text(text, '')
+        w = rsl.eval.CompileWalker(self.runtime, self.includes)
+        self.assertIs(w.compile(root), w.compile(root))
+
+    def test_error_location(self):
+        text = '''
+        .assign x = 1
+        .assign y = x.Name
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, AttributeError)
+        self.assertIn(': 3:  ERROR:', sys.stdout.getvalue())
+
+    def test_recursive_frames(self):
+        text = '''
+        .function fib
+          .param integer n
+          .assign attr_value = n
+          .if (n >= 2)
+            .invoke a = fib(n - 1)
+            .invoke b = fib(n - 2)
+            .assign attr_value = a.value + b.value
+          .end if
+        .end function
+        .invoke res = fib(15)
+        .exit res.value
+        '''
+        self.assertEqual(610, self.eval_both(text))
+
+    def test_slot_undefined_after_block(self):
+        text = '''
+        .function f
+          .if (true)
+            .assign x = 1
+          .end if
+          .assign attr_value = x
+        .end function
+        .invoke res = f()
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.symtab.SymtabException)
+
+    def test_slot_defined_before_block(self):
+        text = '''
+        .function f
+          .assign X = 0
+          .assign i = 0
+          .while (i < 3)
+            .assign x = x + 1
+            .assign y = x
+            .assign i = i + 1
+          .end while
+          .assign attr_value = x
+        .end function
+        .invoke res = f()
+        .exit res.value
+        '''
+        self.assertEqual(3, self.eval_both(text))
+
+    def test_slot_global_fallback(self):
+        text = '''
+        .function f
+          .assign attr_value = 0
+          .if (true)
+            .assign true = false
+            .assign attr_value = true
+          .end if
+          .assign attr_other = true
+        .end function
+        .invoke res = f()
+        .exit "${res.value} ${res.other}"
+        '''
+        self.assertEqual('False True', self.eval_both(text))
+
+    def test_slot_in_where(self):
+        self.metamodel.define_class('A', [('Id', 'INTEGER')])
+        for i in range(10):
+            self.metamodel.new('A', Id=i)
+
+        text = '''
+        .function f
+          .param integer limit
+          .select many a_set from instances of A where (selected.Id < limit)
+          .assign attr_value = cardinality a_set
+        .end function
+        .invoke res = f(4)
+        .exit res.value
+        '''
+        self.assertEqual(4, self.eval_both(text))
@@ -0,0 +1,82 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import os
+import io
+import gzip
+import tempfile
+import unittest
+
+import xtuml
+import rsl.dump
+
+
+SCHEMA = u'''
+CREATE TABLE S_SYS (Sys_ID UNIQUE_ID, Name STRING);
+CREATE TABLE O_OBJ (Obj_ID UNIQUE_ID, Sys_ID UNIQUE_ID, Name STRING,
+                    Active BOOLEAN, Size REAL, Count INTEGER);
+CREATE TABLE EMPTY ();
+CREATE ROP REF_ID R1 FROM MC O_OBJ (Sys_ID) TO 1 S_SYS (Sys_ID);
+'''
+
+POPULATION = u'''
+INSERT INTO S_SYS VALUES (1, 'Törnblom');
+INSERT INTO O_OBJ VALUES (10, 1, 'it''s', 1, 1.5, -3);
+INSERT INTO O_OBJ VALUES (11, 2, 'orphan', 0, 0.0, 0);
+INSERT INTO EMPTY VALUES ();
+'''
+
+
+class TestDump(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        loader = xtuml.ModelLoader()
+        loader.input(SCHEMA)
+        loader.input(POPULATION)
+        self.metamodel = loader.build_metamodel()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def read(self, filename, opener=io.open):
+        with opener(filename, 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def test_same_as_xtuml(self):
+        self.assertEqual(4, rsl.dump.dump_instances(self.metamodel,
+                                                    self.filename))
+        expected = ''.join(xtuml.serialize_instance(inst)
+                           for inst in self.metamodel.instances)
+        if not isinstance(expected, type(u'')):
+            expected = expected.decode('utf-8')
+
+        self.assertEqual(expected, self.read(self.filename))
+
+    def test_class_filter(self):
+        count = rsl.dump.dump_instances(self.metamodel, self.filename,
+                                        ['o_obj', 'UNKNOWN'])
+        self.assertEqual(2, count)
+        s = self.read(self.filename)
+        self.assertIn('INSERT INTO O_OBJ', s)
+        self.assertNotIn('INSERT INTO S_SYS', s)
+
+    def test_gzip(self):
+        filename = self.filename + '.gz'
+        try:
+            rsl.dump.dump_instances(self.metamodel, filename)
+            s = self.read(filename, gzip.open)
+        finally:
+            os.remove(filename)
+
+        loader = xtuml.ModelLoader()
+        loader.input(SCHEMA)
+        loader.input(s)
+        m = loader.build_metamodel()
+        self.assertEqual(xtuml.serialize_instances(self.metamodel),
+                         xtuml.serialize_instances(m))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,14 @@
 # encoding: utf-8
 # Copyright (C) 2015 John Törnblom
 import os
+import sys
 import time
 
 from utils import RSLTestCase
 from utils import evaluate_docstring
 
+import rsl
+
 
 class TestEmit(RSLTestCase):
 
@@ -147,3 +150,152 @@ Hello world!
         self.eval_text('test' + code, 'test_emit_on_change')
         self.assertEqual(t, os.path.getmtime(path))
         
+
+    def test_emit_with_manifest(self):
+        path = "/tmp/RSLTestCase"
+        if os.path.exists(path):
+            os.remove(path)
+            
+        self.runtime.emit = 'change'
+        self.runtime.manifest = rsl.runtime.EmitManifest()
+        code = 'Test\n.emit to file "/tmp/RSLTestCase"'
+        self.eval_text(code, 'test_emit_with_manifest')
+        with open(path) as f:
+            content = f.read()
+            
+        digest = self.runtime.manifest.lookup(path)
+        self.assertEqual(rsl.runtime.EmitManifest.digest(content), digest)
+        
+        t = os.path.getmtime(path)
+        self.eval_text(code, 'test_emit_with_manifest')
+        self.assertEqual(t, os.path.getmtime(path))
+        
+        # modified behind our back
+        time.sleep(0.05)
+        with open(path, 'w') as f:
+            f.write('Other\n')
+        self.assertIsNone(self.runtime.manifest.lookup(path))
+        
+        self.eval_text(code, 'test_emit_with_manifest')
+        with open(path) as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(digest, self.runtime.manifest.lookup(path))
+
+    def test_manifest_save_load(self):
+        path = "/tmp/RSLTestCase"
+        with open(path, 'w') as f:
+            f.write('Test\n')
+        
+        manifest_path = "/tmp/RSLTestCase.manifest"
+        manifest = rsl.runtime.EmitManifest(manifest_path)
+        manifest.update(path, manifest.digest('Test\n'))
+        manifest.save()
+        
+        manifest = rsl.runtime.EmitManifest(manifest_path)
+        self.assertEqual(manifest.digest('Test\n'), manifest.lookup(path))
+        os.remove(manifest_path)
+
+    def test_emit_in_background(self):
+        self.runtime.writer = rsl.runtime.EmitWriter(num_threads=3)
+        paths = ['/tmp/RSLTestCase%d' % i for i in range(10)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                
+        text = ''
+        for i, path in enumerate(paths):
+            text += 'Hello %d\n.emit to file "%s"\n' % (i, path)
+            
+        # emit the same file twice to check the order of writes
+        text += 'Goodbye\n.emit to file "%s"\n' % paths[0]
+        
+        self.eval_text(text, 'test_emit_in_background')
+        self.runtime.writer.close()
+        
+        with open(paths[0]) as f:
+            self.assertEqual(f.read(), 'Goodbye\n')
+
+        for i, path in enumerate(paths[1:], 1):
+            with open(path) as f:
+                self.assertEqual(f.read(), 'Hello %d\n' % i)
+            os.remove(path)
+        
+        os.remove(paths[0])
+        
+        lines = sys.stdout.getvalue().splitlines()
+        expected = ["File '%s' CREATED" % path for path in paths]
+        expected.append("File '%s' REPLACED" % paths[0])
+        self.assertEqual(expected, [line.split('INFO:  ')[1] for line in lines])
+
+    def slow_writes(self):
+        write_file = self.runtime.write_file
+        
+        def slow_write_file(filename, buf):
+            time.sleep(0.02)
+            return write_file(filename, buf)
+        
+        self.runtime.write_file = slow_write_file
+        
+    def test_include_emitted_in_background(self):
+        self.runtime.writer = rsl.runtime.EmitWriter(num_threads=4)
+        self.slow_writes()
+        paths = ['/tmp/RSLTestCase%d.arc' % i for i in range(5)]
+        text = ''
+        for i, path in enumerate(paths):
+            text += '..print "Included %d"\n' % i
+            text += '.emit to file "%s"\n' % path
+            text += '.include "%s"\n' % path
+            
+        try:
+            rc = self.eval_text(text, 'test_include_emitted_in_background')
+            self.runtime.writer.close()
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+                    
+        self.assertIsNone(rc)
+        for i in range(5):
+            self.assertIn('Included %d' % i, sys.stdout.getvalue())
+
+    def test_read_emitted_in_background(self):
+        self.runtime.writer = rsl.runtime.EmitWriter(num_threads=2)
+        self.slow_writes()
+        path = '/tmp/RSLTestCase'
+        if os.path.exists(path):
+            os.remove(path)
+            
+        text = ('Hello\n'
+                '.emit to file "%s"\n'
+                '.invoke res = FILE_READ("%s")\n'
+                '.exit res.result\n' % (path, path))
+        rc = self.eval_text(text, 'test_read_emitted_in_background')
+        self.runtime.writer.close()
+        self.assertEqual('Hello\n', rc)
+
+    def test_pure_bridge_in_background(self):
+        writer = rsl.runtime.EmitWriter(num_threads=2)
+        drain = writer.drain
+        blocking = list()
+
+        def counting_drain(block=True):
+            blocking.append(block)
+            drain(block)
+
+        writer.drain = counting_drain
+        self.runtime.writer = writer
+        text = ('Hello\n'
+                '.emit to file "/tmp/RSLTestCase"\n'
+                '.invoke res = STRING_TO_INTEGER("1")\n'
+                '.invoke res = FILE_READ("/tmp/RSLTestCase")\n')
+        self.eval_text(text, 'test_pure_bridge_in_background')
+        
+        # only FILE_READ waits for the emitted file to be written
+        self.assertEqual(1, blocking.count(True))
+        writer.close()
+
+    def test_emit_in_background_error(self):
+        self.runtime.writer = rsl.runtime.EmitWriter(num_threads=2)
+        self.eval_text('Hello\n.emit to file "/tmp"', 'test_emit_error')
+        self.assertRaises(Exception, self.runtime.writer.close)
+        self.assertIn('ERROR', sys.stdout.getvalue())
@@ -4,6 +4,7 @@
 from utils import RSLTestCase
 from utils import evaluate_docstring
 
+import rsl.runtime
 from rsl.runtime import RuntimeException
 
 
@@ -438,3 +439,56 @@ Hej $t{s}
         .exit "${${a}}"
         '''
         self.assertEqual("b", rc)
+
+    def test_pipeline_reused(self):
+        pipeline = self.runtime.format_pipeline(['u', 'r'])
+        self.assertIs(pipeline, self.runtime.format_pipeline(['u', 'r']))
+        self.assertEqual('HELLOWORLD', pipeline('hello world'))
+        self.assertEqual('HELLOWORLD', pipeline('hello world'))
+
+    def test_pipeline_keeps_formats(self):
+        formats = ['r', 'c']
+        self.runtime.format_pipeline(formats)
+        self.assertEqual(['r', 'c'], formats)
+
+    def test_pipeline_memo_bounded(self):
+        calls = list()
+        
+        def translate(value):
+            calls.append(value)
+            return value
+        
+        pure = rsl.runtime.PURE_FORMATTERS
+        self.addCleanup(setattr, rsl.runtime, 'PURE_FORMATTERS', pure)
+        rsl.runtime.PURE_FORMATTERS = pure | frozenset([translate])
+        self.runtime.string_formatters = dict(self.runtime.string_formatters)
+        self.runtime.string_formatters['tcount'] = translate
+        self.runtime.format_memo_size = 2
+        pipeline = self.runtime.format_pipeline(['tcount'])
+        for s in ['a', 'b', 'a', 'c', 'a']:
+            pipeline(s)
+            
+        self.assertEqual(['a', 'b', 'c', 'a'], calls)
+
+    def test_pipeline_user_formatter(self):
+        calls = list()
+        
+        def translate(value):
+            calls.append(value)
+            return '%s%d' % (value, len(calls))
+        
+        self.runtime.string_formatters = dict(self.runtime.string_formatters)
+        self.runtime.string_formatters['t'] = translate
+        pipeline = self.runtime.format_pipeline(['u', 't'])
+        self.assertEqual('A1', pipeline('a'))
+        self.assertEqual('A2', pipeline('a'))
+
+    def test_pipeline_without_memo(self):
+        calls = list()
+        self.runtime.string_formatters = dict(self.runtime.string_formatters)
+        self.runtime.string_formatters['tcount'] = calls.append
+        self.runtime.format_memo_size = 0
+        pipeline = self.runtime.format_pipeline(['tcount'])
+        pipeline('a')
+        pipeline('a')
+        self.assertEqual(['a', 'a'], calls)
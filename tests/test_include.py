@@ -1,6 +1,13 @@
 # encoding: utf-8
 # Copyright (C) 2015 Per Jonsson
 
+import os
+import shutil
+import tempfile
+
+import rsl
+import rsl.include
+
 from utils import RSLTestCase
 from utils import evaluate_docstring
 
@@ -17,13 +24,13 @@ class TestInclude(RSLTestCase):
         .end function
         .invoke res = f()
         .clear
-        .assign attr_x = 2
+        ..assign attr_x = 2
         .emit to file "/tmp/RSLTestCase"
         .function g
           .include "/tmp/RSLTestCase"
         .end function
         .invoke res2 = g()
-        .if (res.x != res2.x)
+        .if ((res.x != 1) or (res2.x != 2))
           .exit 1
         .end if
         .exit 0
@@ -44,3 +51,92 @@ class TestInclude(RSLTestCase):
         '''
         self.assertIsInstance(rc, Exception)
 
+
+class TestIncludeCache(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        RSLTestCase.tearDown(self)
+        shutil.rmtree(self.folder)
+
+    def write(self, filename, text):
+        path = os.path.join(self.folder, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'w') as f:
+            f.write(text)
+
+        return path
+
+    def eval_file(self, path):
+        ast = rsl.parse_file(path)
+        try:
+            rsl.evaluate(self.runtime, ast, self.includes)
+        except SystemExit as e:
+            return e.code
+
+    def test_relative_to_folder(self):
+        self.write('a/inc.arc', '.exit 1\n')
+        self.write('b/inc.arc', '.exit 2\n')
+        path_a = self.write('a/main.arc', '.include "inc.arc"\n')
+        path_b = self.write('b/main.arc', '.include "inc.arc"\n')
+        self.assertEqual(1, self.eval_file(path_a))
+        self.assertEqual(2, self.eval_file(path_b))
+        self.assertEqual(2, len(self.runtime.include_paths))
+
+    def test_reload_modified(self):
+        inc = self.write('inc.arc', '.exit 1\n')
+        path = self.write('main.arc', '.include "inc.arc"\n')
+        self.assertEqual(1, self.eval_file(path))
+        self.write('inc.arc', '.exit 2\n')
+        os.utime(inc, (0, 0))
+        self.assertEqual(2, self.eval_file(path))
+
+    def test_reuse_unmodified(self):
+        inc = self.write('inc.arc', '.exit 1\n')
+        path = self.write('main.arc', '.include "inc.arc"\n')
+        self.eval_file(path)
+        _, root = self.runtime.include_cache[inc]
+        self.eval_file(path)
+        self.assertIs(root, self.runtime.include_cache[inc][1])
+
+    def test_preload(self):
+        inc1 = self.write('inc1.arc', '.include "sub/inc2.arc"\n')
+        inc2 = self.write('sub/inc2.arc', '.include "inc3.arc"\n'
+                                          '.exit 3\n')
+        inc3 = self.write('sub/inc3.arc', '\n')
+        path = self.write('main.arc', '.assign name = "missing.arc"\n'
+                                      '.include "${name}"\n'
+                                      '.include "inc1.arc"\n')
+        root = rsl.parse_file(path)
+        count = rsl.include.preload(self.runtime, root, self.includes)
+        self.assertEqual(3, count)
+        self.assertEqual(set([inc1, inc2, inc3]),
+                         set(self.runtime.include_cache))
+        self.assertEqual(0, rsl.include.preload(self.runtime, root,
+                                                self.includes))
+
+    def test_preload_ordered_by(self):
+        inc1 = self.write('inc1.arc', '.select many as from instances of A '
+                                      'ordered_by (num)\n'
+                                      '.include "inc2.arc"\n')
+        inc2 = self.write('inc2.arc', '\n')
+        path = self.write('main.arc', '.select many as from instances of A '
+                                      'ordered_by (num, color)\n'
+                                      '.include "inc1.arc"\n')
+        root = rsl.parse_file(path)
+        count = rsl.include.preload(self.runtime, root, self.includes)
+        self.assertEqual(2, count)
+        self.assertEqual(set([inc1, inc2]), set(self.runtime.include_cache))
+
+    def test_preload_parse_error(self):
+        self.write('inc.arc', '.if\n')
+        path = self.write('main.arc', '.include "inc.arc"\n')
+        root = rsl.parse_file(path)
+        count = rsl.include.preload(self.runtime, root, self.includes)
+        self.assertEqual(0, count)
+
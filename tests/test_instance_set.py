@@ -0,0 +1,60 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import unittest
+
+import xtuml
+
+from rsl.runtime import InstanceSet
+
+
+class TestInstanceSet(unittest.TestCase):
+
+    def test_union_shares_log(self):
+        s1 = InstanceSet([1, 2])
+        s2 = s1 | [2, 3]
+        self.assertIs(s1.items, s2.items)
+        self.assertEqual([1, 2], list(s1))
+        self.assertEqual([1, 2, 3], list(s2))
+        self.assertNotIn(3, s1)
+        self.assertIn(3, s2)
+
+    def test_union_with_stale_set(self):
+        s1 = InstanceSet([1])
+        s2 = s1 | [2]
+        s3 = s1 | [3]
+        self.assertIsNot(s2.items, s3.items)
+        self.assertEqual([1], list(s1))
+        self.assertEqual([1, 2], list(s2))
+        self.assertEqual([1, 3], list(s3))
+
+    def test_discard(self):
+        s1 = InstanceSet([1, 2, 3])
+        s2 = s1 | [4]
+        s1.discard(2)
+        self.assertEqual([1, 3], list(s1))
+        self.assertEqual([1, 2, 3, 4], list(s2))
+        s2.discard(5)
+        self.assertEqual(4, len(s2))
+
+    def test_pop(self):
+        s = InstanceSet([1, 2, 3])
+        self.assertEqual(3, s.pop())
+        self.assertEqual(1, s.pop(last=False))
+        self.assertEqual([2], list(s))
+        s.pop()
+        self.assertRaises(KeyError, s.pop)
+
+    def test_query_set(self):
+        s = InstanceSet([1, 2]) | [3]
+        self.assertIsInstance(s, xtuml.QuerySet)
+        self.assertEqual(1, s.first)
+        self.assertEqual(3, s.last)
+        self.assertEqual([3, 2, 1], list(reversed(s)))
+        self.assertEqual(xtuml.QuerySet([1, 2, 3]), s)
+        self.assertEqual([2], list(s & [2, 4]))
+        self.assertEqual([1, 3], list(s - [2, 4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
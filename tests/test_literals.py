@@ -2,8 +2,9 @@
 # Copyright (C) 2016 John Törnblom
 import string
 
+import rsl
+
 from utils import RSLTestCase
-from utils import evaluate_docstring
 from utils import expect_exception
 
 from rsl.parse import ParseException
@@ -60,3 +61,32 @@ class TestLiteral(RSLTestCase):
         self.assertEqual(".comment\n", rc)
 
 
+
+    def test_resolved_line(self):
+        root = rsl.parse_text('a $$b ${x} c\n')
+        node = root.statement_list.statements[0]
+        self.assertTrue(node.resolved)
+        self.assertEqual('a $b ', node.literals[0].value)
+        self.assertEqual(' c\n', node.literals[2].value)
+
+    def test_resolved_continuation(self):
+        root = rsl.parse_text('a\\\n')
+        node = root.statement_list.statements[0]
+        self.assertTrue(node.resolved)
+        self.assertEqual(['a'], [lit.value for lit in node.literals])
+
+    def test_unresolved_continuation(self):
+        text = '.assign x = "a\\\\"\n${x}\\\\\n'
+        root = rsl.parse_text(text)
+        node = root.statement_list.statements[1]
+        self.assertFalse(node.resolved)
+        self.eval_text(text)
+        self.assertEqual('a\\\\\n', self.runtime.buffer.getvalue())
+
+    def test_substituted_line(self):
+        self.eval_text('.assign x = "b"\n'
+                       'a ${x} c\n'
+                       '${x}\n'
+                       '${x} \\\n'
+                       'd')
+        self.assertEqual('a b c\nb\nb d\n', self.runtime.buffer.getvalue())
@@ -0,0 +1,99 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import unittest
+
+import xtuml
+import rsl.loader
+
+
+SCHEMA = '''
+CREATE TABLE S_SYS (Sys_ID UNIQUE_ID, Name STRING);
+CREATE TABLE O_OBJ (Obj_ID UNIQUE_ID, Sys_ID UNIQUE_ID, Name STRING);
+'''
+
+ASSOCIATIONS = '''
+CREATE ROP REF_ID R1 FROM MC O_OBJ (Sys_ID) TO 1 S_SYS (Sys_ID);
+'''
+
+SYSTEMS = '''
+INSERT INTO S_SYS VALUES (1, 'sys1');
+INSERT INTO S_SYS VALUES (2, 'sys2');
+'''
+
+CLASSES = '''
+INSERT INTO O_OBJ VALUES (10, 1, 'a');
+INSERT INTO O_OBJ VALUES (11, 2, 'b');
+INSERT INTO O_OBJ VALUES (12, 1, 'c');
+'''
+
+
+class TestIncrementalLoader(unittest.TestCase):
+
+    def populate_in_steps(self, *steps):
+        loader = rsl.loader.IncrementalLoader()
+        metamodel = xtuml.MetaModel()
+        for step in steps:
+            for data in step:
+                loader.input(data)
+            loader.populate(metamodel)
+
+        return metamodel
+
+    def assertModelEqual(self, m1, m2):
+        self.assertEqual(xtuml.serialize_database(m1),
+                         xtuml.serialize_database(m2))
+        for s1, s2 in zip(m1.select_many('S_SYS'), m2.select_many('S_SYS')):
+            names1 = [o.Name for o in xtuml.navigate_many(s1).O_OBJ[1]()]
+            names2 = [o.Name for o in xtuml.navigate_many(s2).O_OBJ[1]()]
+            self.assertEqual(names1, names2)
+
+    def test_single_step(self):
+        loader = xtuml.ModelLoader()
+        for data in [SCHEMA, ASSOCIATIONS, SYSTEMS, CLASSES]:
+            loader.input(data)
+
+        expected = loader.build_metamodel()
+        m = self.populate_in_steps([SCHEMA, ASSOCIATIONS, SYSTEMS, CLASSES])
+        self.assertModelEqual(expected, m)
+
+    def test_several_steps(self):
+        loader = xtuml.ModelLoader()
+        for data in [SCHEMA, ASSOCIATIONS, SYSTEMS, CLASSES]:
+            loader.input(data)
+
+        expected = loader.build_metamodel()
+        m = self.populate_in_steps([SCHEMA, ASSOCIATIONS], [SYSTEMS],
+                                   [CLASSES])
+        self.assertModelEqual(expected, m)
+
+    def test_targets_after_sources(self):
+        m = self.populate_in_steps([SCHEMA, ASSOCIATIONS, SYSTEMS],
+                                   [CLASSES])
+        s_sys = m.select_any('S_SYS', xtuml.where_eq(Name='sys1'))
+        self.assertEqual(['a', 'c'], [o.Name for o in
+                                      xtuml.navigate_many(s_sys).O_OBJ[1]()])
+
+    def test_association_after_instances(self):
+        loader = xtuml.ModelLoader()
+        for data in [SCHEMA, ASSOCIATIONS, SYSTEMS, CLASSES]:
+            loader.input(data)
+
+        expected = loader.build_metamodel()
+        m = self.populate_in_steps([SCHEMA, SYSTEMS, CLASSES],
+                                   [ASSOCIATIONS])
+        self.assertModelEqual(expected, m)
+        for o_obj in m.select_many('O_OBJ'):
+            self.assertNotIn('Sys_ID', o_obj.__dict__)
+
+    def test_populate_nothing(self):
+        loader = rsl.loader.IncrementalLoader()
+        metamodel = xtuml.MetaModel()
+        loader.input(SCHEMA)
+        self.assertEqual(2, loader.populate(metamodel))
+        self.assertEqual(0, loader.populate(metamodel))
+        self.assertEqual([], loader.statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
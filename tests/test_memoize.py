@@ -0,0 +1,188 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+from utils import RSLTestCase
+
+
+class TestMemoize(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.metamodel.define_class('A', [('Name', 'STRING')])
+        self.memo = self.runtime.memoize('f')
+
+    def test_hit(self):
+        text = '''
+        .function f
+          .param string s
+          .assign attr_value = "$u{s}"
+${s}
+        .end function
+        .invoke a = f("x")
+        .invoke b = f("x")
+        .invoke c = f("y")
+        .exit "${a.value}${b.value}${c.value}${b.body}"
+        '''
+        self.assertEqual('XXYx\n', self.eval_text(text))
+        self.assertEqual(1, self.memo.hits)
+        self.assertEqual(2, self.memo.misses)
+
+    def test_fragment_copied(self):
+        text = '''
+        .function f
+          .assign attr_value = 1
+        .end function
+        .invoke a = f()
+        .assign a.value = 2
+        .invoke b = f()
+        .exit b.value
+        '''
+        self.assertEqual(1, self.eval_text(text))
+
+    def test_keyed_on_identity(self):
+        self.metamodel.new('A', Name='a')
+        self.metamodel.new('A', Name='a')
+        text = '''
+        .function f
+          .param inst_ref a
+          .assign attr_value = a.Name
+        .end function
+        .select many a_set from instances of A
+        .for each a in a_set
+          .invoke r = f(a)
+        .end for
+        '''
+        self.eval_text(text)
+        self.assertEqual(0, self.memo.hits)
+        self.assertEqual(2, self.memo.misses)
+
+    def test_invalidate_on_attribute_assignment(self):
+        self.metamodel.new('A', Name='a')
+        text = '''
+        .function f
+          .param inst_ref a
+          .assign attr_value = a.Name
+        .end function
+        .select any a from instances of A
+        .invoke r1 = f(a)
+        .assign a.Name = "b"
+        .invoke r2 = f(a)
+        .exit "${r1.value}${r2.value}"
+        '''
+        self.assertEqual('ab', self.eval_text(text))
+        self.assertEqual(1, self.memo.invalidations)
+
+    def test_invalidate_on_create(self):
+        text = '''
+        .function f
+          .select many a_set from instances of A
+          .assign attr_value = cardinality a_set
+        .end function
+        .invoke r1 = f()
+        .create object instance a of A
+        .invoke r2 = f()
+        .invoke r3 = f()
+        .exit "${r1.value}${r2.value}${r3.value}"
+        '''
+        self.assertEqual('011', self.eval_text(text))
+        self.assertEqual(1, self.memo.hits)
+
+    def test_not_memoized(self):
+        text = '''
+        .function g
+          .assign attr_value = 1
+        .end function
+        .invoke a = g()
+        .invoke b = g()
+        '''
+        self.eval_text(text)
+        self.assertEqual(0, self.memo.hits + self.memo.misses)
+
+    def test_least_recently_used_evicted(self):
+        self.runtime.function_memo_size = 2
+        memo = self.runtime.memoize('g')
+        text = '''
+        .function g
+          .param string s
+          .assign attr_value = s
+        .end function
+        .invoke r = g("a")
+        .invoke r = g("b")
+        .invoke r = g("a")
+        .invoke r = g("c")
+        .invoke r = g("a")
+        '''
+        self.eval_text(text)
+        self.assertEqual(2, memo.hits)
+        self.assertEqual(3, memo.misses)
+        self.assertEqual(2, len(memo.results))
+
+    def test_emit_not_memoized(self):
+        self.runtime.emit = 'never'
+        text = '''
+        .function f
+          .emit to file "/dev/null"
+          .assign attr_value = 1
+        .end function
+        .invoke a = f()
+        .invoke b = f()
+        '''
+        self.eval_text(text)
+        self.assertTrue(self.memo.impure)
+        self.assertEqual(0, self.memo.hits)
+        self.assertEqual(2, self.runtime.side_effects)
+
+    def test_print_not_memoized(self):
+        text = '''
+        .function f
+          .print "hello"
+        .end function
+        .invoke a = f()
+        .invoke b = f()
+        '''
+        self.eval_text(text)
+        self.assertTrue(self.memo.impure)
+        self.assertEqual(0, self.memo.hits)
+        self.assertEqual(2, self.runtime.side_effects)
+
+    def test_bridge_not_memoized(self):
+        text = '''
+        .function f
+          .invoke r = STRING_TO_INTEGER("1")
+          .assign attr_value = r.result
+        .end function
+        .invoke a = f()
+        .invoke b = f()
+        .exit a.value + b.value
+        '''
+        self.assertEqual(2, self.eval_text(text))
+        self.assertTrue(self.memo.impure)
+        self.assertEqual(0, self.memo.hits)
+
+    def test_mutation_not_memoized(self):
+        text = '''
+        .function f
+          .create object instance a of A
+        .end function
+        .invoke a = f()
+        .invoke b = f()
+        .select many a_set from instances of A
+        .exit cardinality a_set
+        '''
+        self.assertEqual(2, self.eval_text(text))
+        self.assertTrue(self.memo.impure)
+
+    def test_nested_side_effect_not_memoized(self):
+        text = '''
+        .function g
+          .print "hello"
+        .end function
+        .function f
+          .invoke r = g()
+        .end function
+        .invoke a = f()
+        .invoke b = f()
+        '''
+        self.eval_text(text)
+        self.assertTrue(self.memo.impure)
+        self.assertEqual(2, self.runtime.side_effects)
@@ -0,0 +1,165 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import xtuml
+import rsl
+
+from utils import RSLTestCase
+
+
+class TestNavigationCache(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        m = self.metamodel
+        m.define_class('A', [('Id', 'unique_id'), ('Name', 'string')])
+        m.define_class('B', [('Id', 'unique_id'), ('A_Id', 'unique_id'),
+                             ('Name', 'string')])
+        m.define_class('AB', [('A_Id', 'unique_id'), ('B_Id', 'unique_id')])
+        m.define_association(rel_id='R1',
+                             source_kind='B', source_keys=['A_Id'],
+                             source_many=True, source_conditional=True,
+                             source_phrase='',
+                             target_kind='A', target_keys=['Id'],
+                             target_many=False, target_conditional=True,
+                             target_phrase='')
+        m.define_association(rel_id='R2',
+                             source_kind='AB', source_keys=['A_Id'],
+                             source_many=True, source_conditional=True,
+                             source_phrase='',
+                             target_kind='A', target_keys=['Id'],
+                             target_many=False, target_conditional=False,
+                             target_phrase='')
+        m.define_association(rel_id='R2',
+                             source_kind='AB', source_keys=['B_Id'],
+                             source_many=True, source_conditional=True,
+                             source_phrase='',
+                             target_kind='B', target_keys=['Id'],
+                             target_many=False, target_conditional=False,
+                             target_phrase='')
+
+        self.a = m.new('A', Name='a')
+        for name in ['b1', 'b2']:
+            b = m.new('B', Name=name)
+            xtuml.relate(b, self.a, 1)
+
+    def test_hits(self):
+        text = '''
+        .select any a from instances of A
+        .assign names = ""
+        .assign i = 0
+        .while (i < 10)
+          .select many bs related by a->B[R1]
+          .for each b in bs
+            .assign names = names + b.Name
+          .end for
+          .assign i = i + 1
+        .end while
+        .exit names
+        '''
+        self.assertEqual('b1b2' * 10, self.eval_text(text))
+        self.assertEqual(1, self.runtime.navigations.misses)
+        self.assertEqual(9, self.runtime.navigations.hits)
+
+    def test_relate_unrelate(self):
+        text = '''
+        .select any a from instances of A
+        .select many bs related by a->B[R1]
+        .assign n1 = cardinality bs
+        .create object instance b of B
+        .relate b to a across R1
+        .select many bs related by a->B[R1]
+        .assign n2 = cardinality bs
+        .unrelate a from b across R1
+        .select one a2 related by b->A[R1]
+        .assign e = empty a2
+        .select many bs related by a->B[R1]
+        .assign n3 = cardinality bs
+        .exit "${n1} ${n2} ${n3} ${e}"
+        '''
+        self.assertEqual('2 3 2 True', self.eval_text(text))
+
+    def test_delete(self):
+        text = '''
+        .select any a from instances of A
+        .select many bs related by a->B[R1]
+        .select any b from instances of B
+        .select one a2 related by b->A[R1]
+        .delete object instance a
+        .select one a2 related by b->A[R1]
+        .exit empty a2
+        '''
+        self.assertTrue(self.eval_text(text))
+
+    def test_associative(self):
+        text = '''
+        .select any a from instances of A
+        .select any b from instances of B
+        .create object instance ab of AB
+        .select many bs related by a->B[R2]
+        .assign n1 = cardinality bs
+        .relate ab to a across R2
+        .relate ab to b across R2
+        .select many bs related by a->B[R2]
+        .assign n2 = cardinality bs
+        .select many as related by b->A[R2]
+        .assign n3 = cardinality as
+        .delete object instance ab
+        .select many bs related by a->B[R2]
+        .assign n4 = cardinality bs
+        .select many as related by b->A[R2]
+        .assign n5 = cardinality as
+        .exit "${n1} ${n2} ${n3} ${n4} ${n5}"
+        '''
+        self.assertEqual('0 1 1 0 0', self.eval_text(text))
+
+    def test_bridge(self):
+        class BridgeRuntime(rsl.Runtime):
+            bridges = dict()
+
+        @rsl.bridge('RELATE_NEW_B', BridgeRuntime)
+        def relate_new_b():
+            b = self.metamodel.new('B', Name='b3')
+            xtuml.relate(b, self.a, 1)
+
+        self.runtime = BridgeRuntime(self.metamodel)
+        text = '''
+        .select any a from instances of A
+        .select many bs related by a->B[R1]
+        .invoke RELATE_NEW_B()
+        .select many bs related by a->B[R1]
+        .exit cardinality bs
+        '''
+        self.assertEqual(3, self.eval_text(text))
+
+    def test_modified_between_evaluations(self):
+        text = '''
+        .select any a from instances of A
+        .select many bs related by a->B[R1]
+        .exit cardinality bs
+        '''
+        self.assertEqual(2, self.eval_text(text))
+        b = self.metamodel.new('B', Name='b3')
+        xtuml.relate(b, self.a, 1)
+        self.assertEqual(3, self.eval_text(text))
+
+    def test_disabled(self):
+        self.runtime.navigation_cache = False
+        text = '''
+        .select any a from instances of A
+        .select many bs related by a->B[R1]
+        .select many bs related by a->B[R1]
+        .exit "${bs}"
+        '''
+        self.eval_text(text)
+        self.assertEqual(0, self.runtime.navigations.hits)
+        self.assertEqual(0, self.runtime.navigations.misses)
+
+    def test_navigate_set(self):
+        b1, b2 = self.metamodel.select_many('B')
+        result = self.runtime.navigate(xtuml.QuerySet([b1, b2, b1]),
+                                       [('A', 'R1', ''), ('B', 'R1', '')])
+        self.assertEqual([b1, b2], list(result))
+        self.assertIsInstance(result, xtuml.QuerySet)
+        self.assertEqual(0, len(self.runtime.navigate(None,
+                                                      [('A', 'R1', '')])))
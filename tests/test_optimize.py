@@ -0,0 +1,127 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import rsl
+import rsl.optimize
+
+from rsl import ast
+from utils import RSLTestCase
+
+
+class TestOptimize(RSLTestCase):
+
+    def optimize_text(self, text):
+        root = rsl.parse_text(text + '\n')
+        return rsl.optimize.optimize(root).statement_list.statements
+
+    def buffer_text(self, text, optimize):
+        self.runtime.optimize = optimize
+        self.runtime.clear_buffer()
+        self.eval_text(text)
+        return self.runtime.buffer.getvalue()
+
+    def assertSameOutput(self, text):
+        unoptimized = self.buffer_text(text, False)
+        self.assertEqual(unoptimized, self.buffer_text(text, True))
+        return unoptimized
+
+    def test_fold_binary_operation(self):
+        stmts = self.optimize_text('.assign x = (1 + 2) * 3')
+        self.assertIsInstance(stmts[0].expr, ast.ConstantNode)
+        self.assertEqual(9, stmts[0].expr.value)
+
+    def test_fold_unary_operation(self):
+        stmts = self.optimize_text('.assign x = not (1 == -1)')
+        self.assertIsInstance(stmts[0].expr, ast.ConstantNode)
+        self.assertEqual(True, stmts[0].expr.value)
+
+    def test_fold_string(self):
+        stmts = self.optimize_text('.assign x = "a\\tb${true}" + "c"')
+        self.assertIsInstance(stmts[0].expr, ast.ConstantNode)
+        self.assertEqual('a\tbTruec', stmts[0].expr.value)
+
+    def test_fold_short_circuit(self):
+        stmts = self.optimize_text('.assign x = true or y')
+        self.assertIsInstance(stmts[0].expr, ast.ConstantNode)
+        self.assertEqual(True, stmts[0].expr.value)
+
+    def test_keep_variables(self):
+        stmts = self.optimize_text('.assign x = y + 1')
+        self.assertIsInstance(stmts[0].expr, ast.BinaryOpNode)
+
+    def test_keep_errors(self):
+        stmts = self.optimize_text('.assign x = 1 / 0')
+        self.assertIsInstance(stmts[0].expr, ast.BinaryOpNode)
+
+    def test_keep_declared_constants(self):
+        stmts = self.optimize_text('.assign true = 0\n'
+                                   '.assign x = true')
+        self.assertIsInstance(stmts[1].expr, ast.VariableAccessNode)
+
+    def test_remove_dead_if(self):
+        stmts = self.optimize_text('.if (false)\n'
+                                   '.print "debug"\n'
+                                   '.end if')
+        self.assertEqual((), stmts)
+
+    def test_remove_dead_branches(self):
+        stmts = self.optimize_text('.if (false)\n'
+                                   '.assign x = 1\n'
+                                   '.elif (y)\n'
+                                   '.assign x = 2\n'
+                                   '.elif (true)\n'
+                                   '.assign x = 3\n'
+                                   '.else\n'
+                                   '.assign x = 4\n'
+                                   '.end if')
+        self.assertEqual(1, len(stmts))
+        self.assertIsInstance(stmts[0].cond, ast.VariableAccessNode)
+        self.assertEqual(2, stmts[0].iftrue.statements[0].expr.value)
+        self.assertEqual((), stmts[0].elif_list.elifs)
+        self.assertEqual(3, stmts[0].iffalse.statements[0].expr.value)
+
+    def test_else_branch(self):
+        stmts = self.optimize_text('.if (1 == 2)\n'
+                                   '.assign x = 1\n'
+                                   '.else\n'
+                                   '.assign x = 2\n'
+                                   '.end if')
+        self.assertTrue(stmts[0].cond.value)
+        self.assertEqual(2, stmts[0].iftrue.statements[0].expr.value)
+        self.assertEqual((), stmts[0].iffalse.statements)
+
+    def test_if_block_scope(self):
+        text = ('.if (true)\n'
+                '  .assign x = 1\n'
+                '.end if\n'
+                '.exit x')
+        self.runtime.optimize = False
+        unoptimized = self.eval_text(text)
+        self.runtime.optimize = True
+        self.assertEqual(str(unoptimized), str(self.eval_text(text)))
+
+    def test_merge_literals(self):
+        stmts = self.optimize_text('line 1\n'
+                                   'line 2\n'
+                                   '.assign x = 1\n'
+                                   'line ${x}')
+        self.assertEqual(3, len(stmts))
+        self.assertIsInstance(stmts[0], ast.LiteralListNode)
+        self.assertEqual(1, len(stmts[0].literals))
+
+    def test_literal_output(self):
+        text = ('line 1\n'
+                'continued \\\n'
+                'line 2\n'
+                'escaped \\\\\n'
+                'backslash \\\\\\\n'
+                '\n'
+                '${false} \\\n'
+                '.if (false)\n'
+                'dead\n'
+                '.end if\n'
+                'last \\')
+        output = self.assertSameOutput(text)
+        self.assertEqual('line 1\ncontinued line 2\nescaped \\\n'
+                         'backslash \\\n'
+                         'False last ', output)
@@ -0,0 +1,413 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import os
+import sys
+import unittest
+
+from utils import RSLTestCase
+
+import rsl
+import rsl.lint
+import rsl.parallel
+
+
+class TestFindMutations(RSLTestCase):
+
+    def find_mutations(self, text):
+        ast = rsl.parse_text(text + '\n', '')
+        return rsl.lint.find_mutations(ast, self.includes)
+
+    def test_read_only(self):
+        text = '''
+        .select many a_set from instances of A
+        .for each a in a_set
+          .assign x = a.Name
+          .print "${x}"
+        .end for
+        '''
+        self.assertEqual([], self.find_mutations(text))
+
+    def test_create(self):
+        text = '''
+        .function f
+          .create object instance a of A
+        .end function
+        '''
+        self.assertEqual(1, len(self.find_mutations(text)))
+
+    def test_attribute_assignment(self):
+        text = '''
+        .select any a from instances of A
+        .assign a.Name = "x"
+        '''
+        self.assertEqual(1, len(self.find_mutations(text)))
+
+    def test_unique_num(self):
+        self.assertEqual(1, len(self.find_mutations('.print "${info.unique_num}"')))
+
+    def test_dynamic_include(self):
+        text = '''
+        .assign name = "spam"
+        .include "${name}.inc"
+        '''
+        self.assertEqual(1, len(self.find_mutations(text)))
+
+    def test_static_include(self):
+        self.includes = [os.path.dirname(__file__) + os.path.sep + 'test_files']
+        self.assertEqual([], self.find_mutations('.include "spam.inc"'))
+
+    def test_missing_include(self):
+        self.assertEqual(1, len(self.find_mutations('.include "missing.inc"')))
+
+    def test_bridge(self):
+        @rsl.bridge('TEST_MUTATING_BRIDGE')
+        def mutating_bridge():
+            pass
+
+        self.addCleanup(rsl.Runtime.bridges.pop, 'TEST_MUTATING_BRIDGE')
+        text = '''
+        .invoke s = INTEGER_TO_STRING(1)
+        .invoke TEST_MUTATING_BRIDGE()
+        '''
+        mutations = self.find_mutations(text)
+        self.assertEqual(1, len(mutations))
+        self.assertEqual('TEST_MUTATING_BRIDGE', mutations[0].function_name)
+
+
+class TestFindSideEffects(RSLTestCase):
+
+    def find_side_effects(self, text):
+        ast = rsl.parse_text(text + '\n', '')
+        return rsl.lint.find_side_effects(ast, self.includes)
+
+    def test_read_only(self):
+        text = '''
+        .invoke s = INTEGER_TO_STRING(1)
+        .invoke r = FILE_READ("/tmp/RSLTestCase")
+        .print "${s.result}"
+        '''
+        self.assertEqual([], self.find_side_effects(text))
+
+    def test_emit(self):
+        self.assertEqual(1, len(self.find_side_effects('.emit to file "x"')))
+
+    def test_bridge(self):
+        text = '.invoke r = FILE_WRITE("x", "/tmp/RSLTestCase")'
+        self.assertEqual(1, len(self.find_side_effects(text)))
+
+    def test_create(self):
+        text = '.create object instance a of A'
+        self.assertEqual(1, len(self.find_side_effects(text)))
+
+
+@unittest.skipUnless(rsl.parallel.can_fork(), 'requires fork')
+class TestEvaluateArchetypes(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.metamodel.define_class('A', [('Name', 'STRING')])
+        self.metamodel.new('A', Name='x')
+        self.metamodel.new('A', Name='y')
+
+    def make_runtime(self):
+        return rsl.Runtime(self.metamodel)
+
+    def evaluate(self, *texts):
+        archetypes = [('arch%d.arc' % i, rsl.parse_text(text + '\n',
+                                                        'arch%d.arc' % i))
+                      for i, text in enumerate(texts)]
+        try:
+            rsl.parallel.evaluate_archetypes(self.make_runtime, archetypes,
+                                             self.includes, 2)
+        except SystemExit as e:
+            return e.code
+
+    def test_collated_output(self):
+        texts = ['.select many a_set from instances of A\n'
+                 '.assign n = cardinality a_set\n'
+                 '.print "%d ${n}"' % i for i in range(4)]
+        self.assertIsNone(self.evaluate(*texts))
+        output = sys.stdout.getvalue()
+        positions = [output.index('%d 2' % i) for i in range(4)]
+        self.assertEqual(sorted(positions), positions)
+
+    def test_first_exit(self):
+        rc = self.evaluate('.print "a"', '.exit 2', '.exit 3')
+        self.assertEqual(2, rc)
+        self.assertIn('a', sys.stdout.getvalue())
+
+    def test_error(self):
+        rc = self.evaluate('.print "a"', '.assign x = y')
+        self.assertIn("Unknown symbol 'y'", rc)
+
+
+class TestParallelLoop(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.runtime.jobs = 2
+        self.metamodel.define_class('A', [('Name', 'STRING')])
+        for name in 'abcd':
+            self.metamodel.new('A', Name=name)
+
+        # fork regardless of the cost of the iterations
+        self.pool_overhead = rsl.parallel.POOL_OVERHEAD
+        rsl.parallel.POOL_OVERHEAD = -1
+
+    def tearDown(self):
+        rsl.parallel.POOL_OVERHEAD = self.pool_overhead
+        RSLTestCase.tearDown(self)
+
+    def test_output_in_order(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .if (first a_set)
+first
+          .end if
+${a.Name}
+        .end for
+        '''
+        self.eval_text(text)
+        parallel = self.runtime.buffer.getvalue()
+        self.runtime.buffer.close()
+
+        self.runtime.jobs = 1
+        self.eval_text(text)
+        self.assertEqual(self.runtime.buffer.getvalue(), parallel)
+        self.assertIn('first\na\nb\nc\nd\n', parallel)
+
+    def test_small_loop(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+${a.Name}
+        .end for
+        '''
+        map_forked = rsl.parallel.map_forked
+        calls = list()
+
+        def counting_map_forked(*args):
+            calls.append(args)
+            return map_forked(*args)
+
+        rsl.parallel.map_forked = counting_map_forked
+        try:
+            rsl.parallel.POOL_OVERHEAD = 3600
+            self.eval_text(text)
+            self.assertEqual([], calls)
+
+            rsl.parallel.POOL_OVERHEAD = -1
+            self.eval_text(text)
+            self.assertEqual(1, len(calls))
+        finally:
+            rsl.parallel.map_forked = map_forked
+
+        output = self.runtime.buffer.getvalue()
+        self.assertEqual(2, output.count('a\nb\nc\nd\n'))
+
+    def test_iteration_blocks(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .if (first a_set)
+            .assign x = 1
+          .end if
+          .assign y = 0
+${a.Name}
+        .end for
+        .exit y
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.symtab.SymtabException)
+
+    def test_ordered_by(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .select many b_set from instances of A ordered_by (Name)
+${a.Name}
+        .end for
+        '''
+        for jobs in [1, 2]:
+            self.runtime.jobs = jobs
+            self.runtime.buffer.close()
+            self.assertIsNone(self.eval_text(text))
+            self.assertIn('a\nb\nc\nd\n', self.runtime.buffer.getvalue())
+
+    def test_refuse_create(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .create object instance b of A
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('.create', str(rc))
+        self.assertEqual(4, len(self.metamodel.select_many('A')))
+
+    def test_refuse_attribute_assignment(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .assign a.Name = "x"
+        .end for
+        '''
+        for compiled in [False, True]:
+            ast = rsl.parse_text(text, '')
+            with self.assertRaises(SystemExit) as cm:
+                rsl.evaluate(self.runtime, ast, self.includes, compiled)
+
+            self.assertIn('attribute assignment', str(cm.exception.code))
+
+    def test_refuse_break(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .break for
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+
+    def test_refuse_outer_assignment(self):
+        text = '''
+        .assign n = 0
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .assign n = n + 1
+        .end for
+        .exit n
+        '''
+        for jobs, compiled in [(1, False), (1, True), (2, False), (2, True)]:
+            self.runtime.jobs = jobs
+            ast = rsl.parse_text(text, '')
+            with self.assertRaises(SystemExit) as cm:
+                rsl.evaluate(self.runtime, ast, self.includes, compiled)
+
+            self.assertIn('may not assign n', str(cm.exception.code))
+
+    def test_refuse_outer_assignment_in_function(self):
+        text = '''
+        .function f
+          .param inst_ref_set a_set
+          .assign n = 0
+          .parallel for each a in a_set
+            .assign n = n + 1
+          .end for
+          .assign attr_n = n
+        .end function
+        .select many a_set from instances of A
+        .invoke r = f(a_set)
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('may not assign n', str(rc))
+
+    def test_refuse_outer_assignment_in_include(self):
+        self.includes = [os.path.dirname(__file__) + os.path.sep + 'test_files']
+        text = '''
+        .assign spam = 0
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .include "assign_spam.inc"
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('may not assign spam', str(rc))
+
+    @unittest.skipUnless(rsl.parallel.can_fork(), 'requires fork')
+    def test_mutation_in_function(self):
+        text = '''
+        .function f
+          .create object instance b of A
+        .end function
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .invoke f()
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('modified the model', str(rc))
+
+    def test_sequential_mutation_in_function(self):
+        text = '''
+        .function f
+          .create object instance b of A
+        .end function
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .invoke f()
+        .end for
+        '''
+        self.runtime.jobs = 1
+        for compiled in [False, True]:
+            ast = rsl.parse_text(text, '')
+            with self.assertRaises(SystemExit) as cm:
+                rsl.evaluate(self.runtime, ast, self.includes, compiled)
+
+            self.assertIn('iteration 0 of a parallel loop modified the model',
+                          str(cm.exception.code))
+
+        self.assertEqual(6, len(self.metamodel.select_many('A')))
+
+    def test_refuse_bridge(self):
+        @rsl.bridge('TEST_MUTATING_BRIDGE')
+        def mutating_bridge():
+            pass
+
+        self.addCleanup(rsl.Runtime.bridges.pop, 'TEST_MUTATING_BRIDGE')
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .invoke TEST_MUTATING_BRIDGE()
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('bridge invocation', str(rc))
+
+    def test_bridge_in_function(self):
+        class BridgeRuntime(rsl.Runtime):
+            bridges = dict()
+
+        @rsl.bridge('CREATE_A', BridgeRuntime)
+        def create_a():
+            self.metamodel.new('A', Name='e')
+
+        self.runtime = BridgeRuntime(self.metamodel)
+        self.runtime.jobs = 1
+        text = '''
+        .function f
+          .invoke CREATE_A()
+        .end function
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .invoke f()
+        .end for
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.runtime.RuntimeException)
+        self.assertIn('iteration 0 of a parallel loop modified the model',
+                      str(rc))
+
+    @unittest.skipUnless(rsl.parallel.can_fork(), 'requires fork')
+    def test_exit(self):
+        text = '''
+        .select many a_set from instances of A
+        .parallel for each a in a_set
+          .print "${a.Name}"
+          .if (a.Name == "b")
+            .exit 2
+          .end if
+        .end for
+        '''
+        self.assertEqual(2, self.eval_text(text))
+        output = sys.stdout.getvalue()
+        self.assertIn('INFO:  a', output)
+        self.assertIn('INFO:  b', output)
+        self.assertNotIn('INFO:  c', output)
@@ -0,0 +1,141 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import unittest
+import tempfile
+import shutil
+import os
+import pickle
+
+import rsl
+import rsl.parse
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.source_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.source_dir, 'test.arc')
+        self.write('.exit 1\n')
+        
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.source_dir)
+
+    def write(self, text):
+        with open(self.filename, 'w') as f:
+            f.write(text)
+
+    def cached_files(self):
+        return [name for name in os.listdir(self.cache_dir)
+                if name.endswith('.ast')]
+    
+    def test_store(self):
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        self.assertIsInstance(root, rsl.ast.BodyNode)
+        self.assertEqual(1, len(self.cached_files()))
+        
+    def test_load(self):
+        rsl.parse_file(self.filename, self.cache_dir)
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        
+        stmt = root.statement_list.statements[0]
+        self.assertIsInstance(stmt, rsl.ast.ExitNode)
+        self.assertEqual(os.path.abspath(self.filename), stmt.filename)
+        self.assertEqual(1, len(self.cached_files()))
+        
+    def test_invalidate_on_change(self):
+        rsl.parse_file(self.filename, self.cache_dir)
+        self.write('.exit 2\n')
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        
+        stmt = root.statement_list.statements[0]
+        self.assertEqual('2', stmt.return_code.value)
+        self.assertEqual(2, len(self.cached_files()))
+        
+    def test_corrupt_entry(self):
+        with open(self.filename, 'r') as f:
+            key = rsl.parse.cache_key(f.read(), os.path.abspath(self.filename))
+            
+        with open(os.path.join(self.cache_dir, key + '.ast'), 'w') as f:
+            f.write('garbage')
+            
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        self.assertIsInstance(root, rsl.ast.BodyNode)
+
+    def test_roundtrip(self):
+        self.write('.function f\n'
+                   '  .param string s\n'
+                   '  .select many insts from instances of A '
+                   'where (selected.x == 1) ordered_by (x, y)\n'
+                   'Hello ${s:u} ${insts.x}\n'
+                   '.end function\n')
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        copy = rsl.parse_file(self.filename, self.cache_dir)
+        self.assertEqual(rsl.parse.serialize(root), rsl.parse.serialize(copy))
+        
+        func = copy.statement_list.statements[0]
+        self.assertIsInstance(func, rsl.ast.FunctionNode)
+        self.assertIsInstance(func.statement_list.statements, tuple)
+        self.assertIs(func.parameter_list, func.children[0])
+
+    def test_pickle_entry(self):
+        with open(self.filename, 'r') as f:
+            key = rsl.parse.cache_key(f.read(), os.path.abspath(self.filename))
+        
+        class Exploit(object):
+            def __reduce__(self):
+                return (open, (self.path, 'w'))
+            
+        Exploit.path = os.path.join(self.source_dir, 'exploited')
+        with open(os.path.join(self.cache_dir, key + '.ast'), 'wb') as f:
+            pickle.dump(Exploit(), f)
+            
+        root = rsl.parse_file(self.filename, self.cache_dir)
+        self.assertIsInstance(root, rsl.ast.BodyNode)
+        self.assertFalse(os.path.exists(Exploit.path))
+        
+    def test_unknown_node(self):
+        records = (('Exception', None, 0, ()),)
+        self.assertRaises(ValueError, rsl.parse.deserialize, records)
+        
+    def test_prune(self):
+        paths = list()
+        for index in range(3):
+            self.write('.exit %d\n' % index)
+            rsl.parse_file(self.filename, self.cache_dir)
+            path = os.path.join(self.cache_dir, (set(self.cached_files()) -
+                                                 set(map(os.path.basename,
+                                                         paths))).pop())
+            os.utime(path, (index, index))
+            paths.append(path)
+            
+        size = os.path.getsize(paths[0])
+        rsl.parse.prune_cache(self.cache_dir, 2 * size)
+        self.assertEqual(sorted(map(os.path.basename, paths[1:])),
+                         sorted(self.cached_files()))
+        
+    def test_prune_temporary_files(self):
+        stale = os.path.join(self.cache_dir, 'stale.tmp')
+        fresh = os.path.join(self.cache_dir, 'fresh.tmp')
+        for path in [stale, fresh]:
+            with open(path, 'w') as f:
+                f.write('partial')
+                
+        os.utime(stale, (0, 0))
+        rsl.parse.prune_cache(self.cache_dir)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        
+    def test_prune_missing_cache(self):
+        rsl.parse.prune_cache(os.path.join(self.cache_dir, 'missing'))
+        
+    def test_key_depends_on_filename(self):
+        key1 = rsl.parse.cache_key('.exit 1\n', '/a.arc')
+        key2 = rsl.parse.cache_key('.exit 1\n', '/b.arc')
+        self.assertNotEqual(key1, key2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import unittest
+import threading
+
+import rsl
+import rsl.parse
+
+
+class TestParserPool(unittest.TestCase):
+
+    def test_reuse_in_thread(self):
+        self.assertIs(rsl.parse.get_parser(), rsl.parse.get_parser())
+
+    def test_one_per_thread(self):
+        parsers = list()
+        t = threading.Thread(target=lambda: parsers.append(rsl.parse.get_parser()))
+        t.start()
+        t.join()
+        self.assertIsNot(rsl.parse.get_parser(), parsers[0])
+        
+    def test_reset_lineno(self):
+        rsl.parse_text('.assign x = 1\n.assign y = 2\n', 'first')
+        root = rsl.parse_text('.exit 1\n', 'second')
+        stmt = root.statement_list.statements[0]
+        self.assertEqual(1, stmt.lineno)
+        self.assertEqual('second', stmt.filename)
+
+    def test_reset_after_error(self):
+        with self.assertRaises(rsl.parse.ParseException):
+            rsl.parse_text('.assign x = "unterminated ${y\n', 'broken')
+
+        root = rsl.parse_text('Hello\n.exit 1\n', 'ok')
+        stmts = root.statement_list.statements
+        self.assertIsInstance(stmts[0], rsl.ast.LiteralListNode)
+        self.assertIsInstance(stmts[1], rsl.ast.ExitNode)
+        self.assertEqual(2, stmts[1].lineno)
+
+
+if __name__ == "__main__":
+    unittest.main()
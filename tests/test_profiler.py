@@ -0,0 +1,89 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import os
+import pstats
+import tempfile
+
+from utils import RSLTestCase
+
+import rsl
+import rsl.profiler
+
+
+class TestProfiler(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.profiler = rsl.profiler.Profiler()
+        self.runtime.profiler = self.profiler
+
+    def test_line_hits(self):
+        text = '''
+        .assign i = 0
+        .while (i < 10)
+          .assign i = i + 1
+        .end while
+        '''
+        self.eval_text(text, 'test.arc')
+        self.assertEqual(1, self.profiler.lines[('test.arc', 3)].hits)
+        self.assertEqual(10, self.profiler.lines[('test.arc', 4)].hits)
+
+    def test_exclusive_time(self):
+        text = '''
+        .assign i = 0
+        .while (i < 10)
+          .assign i = i + 1
+        .end while
+        '''
+        self.eval_text(text, 'test.arc')
+        loop = self.profiler.lines[('test.arc', 3)]
+        body = self.profiler.lines[('test.arc', 4)]
+        self.assertLessEqual(loop.exclusive + body.inclusive,
+                             loop.inclusive + 1e-6)
+
+    def test_recursive_function(self):
+        text = '''
+        .function f
+          .param integer n
+          .if (n > 0)
+            .invoke f(n - 1)
+          .end if
+        .end function
+        .invoke f(4)
+        '''
+        self.eval_text(text, 'test.arc')
+        entry = self.profiler.units[('test.arc', 2, 'f')]
+        self.assertEqual(5, entry.hits)
+        self.assertEqual(1, entry.primitive)
+        self.assertEqual('function', self.profiler.kinds[('test.arc', 2, 'f')])
+
+        root = self.profiler.units[('test.arc', 1, 'test.arc')]
+        self.assertEqual(1, root.hits)
+        self.assertLessEqual(entry.inclusive, root.inclusive)
+
+    def test_unprofiled_runtime(self):
+        self.runtime.profiler = None
+        rc = self.eval_text('.exit 1', 'test.arc')
+        self.assertEqual(1, rc)
+        self.assertEqual(0, len(self.profiler.lines))
+
+    def test_pstats(self):
+        text = '''
+        .function f
+        .end function
+        .invoke f()
+        .invoke f()
+        '''
+        self.eval_text(text, 'test.arc')
+        fd, filename = tempfile.mkstemp(suffix='.prof')
+        os.close(fd)
+        try:
+            self.profiler.save(filename)
+            stats = pstats.Stats(filename).stats
+        finally:
+            os.remove(filename)
+
+        cc, nc, _, _, callers = stats[('test.arc', 2, 'f')]
+        self.assertEqual(2, nc)
+        self.assertEqual(2, callers[('test.arc', 1, 'test.arc')][0])
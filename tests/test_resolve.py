@@ -0,0 +1,54 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import unittest
+
+import rsl
+import rsl.resolve
+
+
+class TestResolve(unittest.TestCase):
+
+    def function(self, text):
+        root = rsl.parse_text(text.lstrip(), '')
+        return root.statement_list.statements[0]
+        
+    def test_declared_names(self):
+        fn = self.function('''
+.function f
+  .param integer x
+  .assign y = x
+  .invoke z = f(y)
+  .select many a_set from instances of A where (selected.Id == x)
+  .for each a in a_set
+    .create object instance b of B
+    .assign Y = 1
+  .end for
+.end function
+''')
+        names = rsl.resolve.resolve_slots(fn)
+        self.assertEqual(['x', 'y', 'z', 'a_set', 'a', 'b'], names)
+
+    def test_nested_function(self):
+        fn = self.function('''
+.function f
+  .assign x = 1
+  .function g
+    .assign y = 1
+  .end function
+.end function
+''')
+        self.assertEqual(['x'], rsl.resolve.resolve_slots(fn))
+
+    def test_include_is_dynamic(self):
+        fn = self.function('''
+.function f
+  .assign x = 1
+  .include "other.inc"
+.end function
+''')
+        self.assertIsNone(rsl.resolve.resolve_slots(fn))
+
+
+if __name__ == "__main__":
+    unittest.main()
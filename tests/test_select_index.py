@@ -0,0 +1,120 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+from utils import RSLTestCase
+
+import rsl
+
+
+class TestSelectIndex(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        self.metamodel.define_class('A', [('Id', 'unique_id'),
+                                          ('Num', 'integer'),
+                                          ('Name', 'string')])
+        for i in range(10):
+            self.metamodel.new('A', Num=i % 3, Name='a%d' % i)
+
+    def test_select_many_eq(self):
+        text = '''
+        .assign n = 1
+        .select many a_set from instances of A where (selected.Num == n)
+        .exit cardinality a_set
+        '''
+        self.assertEqual(3, self.eval_text(text))
+        self.assertEqual(1, len(self.runtime.index.indexes))
+
+    def test_select_any_eq_mirrored(self):
+        text = '''
+        .select any a from instances of A where ("a7" == selected.name)
+        .exit a.Num
+        '''
+        self.assertEqual(1, self.eval_text(text))
+
+    def test_select_conjunction(self):
+        text = '''
+        .select many a_set from instances of A where ((selected.Num == 0) and (selected.Name != "a0")) ordered_by (Name)
+        .assign s = ""
+        .for each a in a_set
+          .assign s = s + a.Name
+        .end for
+        .exit s
+        '''
+        self.assertEqual('a3a6a9', self.eval_text(text))
+
+    def test_select_order(self):
+        text = '''
+        .select many a_set from instances of A where (selected.Num == 2)
+        .assign s = ""
+        .for each a in a_set
+          .assign s = s + a.Name
+        .end for
+        .exit s
+        '''
+        self.assertEqual('a2a5a8', self.eval_text(text))
+
+    def test_invalidate_on_create(self):
+        text = '''
+        .select many a_set from instances of A where (selected.Num == 5)
+        .assign x = cardinality a_set
+        .create object instance a of A
+        .assign a.Num = 5
+        .select many a_set from instances of A where (selected.Num == 5)
+        .assign r = (x * 10) + (cardinality a_set)
+        .exit r
+        '''
+        self.assertEqual(1, self.eval_text(text))
+
+    def test_invalidate_on_delete(self):
+        text = '''
+        .select any a from instances of A where (selected.Name == "a1")
+        .delete object instance a
+        .select any a from instances of A where (selected.Name == "a1")
+        .exit empty a
+        '''
+        self.assertEqual(True, self.eval_text(text))
+
+    def test_invalidate_between_evaluations(self):
+        text = '''
+        .select many a_set from instances of A where (selected.Num == 7)
+        .exit cardinality a_set
+        '''
+        self.assertEqual(0, self.eval_text(text))
+        self.metamodel.new('A', Num=7)
+        self.assertEqual(1, self.eval_text(text))
+
+    def test_invalidate_referential(self):
+        self.metamodel.define_class('B', [('Id', 'unique_id'),
+                                          ('A_Id', 'unique_id')])
+        ass = self.metamodel.define_association(rel_id='R1',
+                                                source_kind='B',
+                                                target_kind='A',
+                                                source_keys=['A_Id'],
+                                                target_keys=['Id'],
+                                                source_many=True,
+                                                target_many=False,
+                                                source_conditional=True,
+                                                target_conditional=True,
+                                                source_phrase='',
+                                                target_phrase='')
+        ass.formalize()
+        text = '''
+        .select any a from instances of A where (selected.Name == "a4")
+        .create object instance b of B
+        .select many b_set from instances of B where (selected.A_Id == a.Id)
+        .assign x = cardinality b_set
+        .relate a to b across R1
+        .select many b_set from instances of B where (selected.A_Id == a.Id)
+        .assign r = (x * 10) + (cardinality b_set)
+        .exit r
+        '''
+        self.assertEqual(1, self.eval_text(text))
+
+    def test_unknown_symbol(self):
+        text = '''
+        .select many a_set from instances of A where (selected.Num == x)
+        '''
+        rc = self.eval_text(text)
+        self.assertIsInstance(rc, rsl.symtab.SymtabException)
+
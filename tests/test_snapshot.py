@@ -0,0 +1,203 @@
+# encoding: utf-8
+# Copyright (C) 2018 John Törnblom
+
+import os
+import struct
+import tempfile
+import unittest
+
+from utils import RSLTestCase
+
+import xtuml
+import rsl
+import rsl.snapshot
+
+
+SCHEMA = '''
+CREATE TABLE S_SYS (Sys_ID UNIQUE_ID, Name STRING);
+CREATE TABLE O_OBJ (Obj_ID UNIQUE_ID, Sys_ID UNIQUE_ID, Name STRING,
+                    Active BOOLEAN, Size REAL, Count INTEGER,
+                    Next_ID UNIQUE_ID);
+CREATE ROP REF_ID R1 FROM MC O_OBJ (Sys_ID) TO 1 S_SYS (Sys_ID);
+CREATE ROP REF_ID R2 FROM 1C O_OBJ (Next_ID) PHRASE 'succeeds'
+                     TO 1C O_OBJ (Obj_ID) PHRASE 'precedes';
+CREATE UNIQUE INDEX I1 ON O_OBJ (Obj_ID);
+'''
+
+POPULATION = '''
+INSERT INTO S_SYS VALUES (1, 'sys');
+INSERT INTO O_OBJ VALUES (10, 1, 'first', 1, 1.5, 3, 11);
+INSERT INTO O_OBJ VALUES (11, 1, 'it''s second', 0, -2.0, -1, 0);
+INSERT INTO O_OBJ VALUES (12, 2, 'orphan', 0, 0.0, 0, 0);
+'''
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        loader = xtuml.ModelLoader()
+        loader.input(SCHEMA)
+        loader.input(POPULATION)
+        self.metamodel = loader.build_metamodel()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def reload(self):
+        rsl.snapshot.save(self.metamodel, self.filename)
+        self.assertTrue(rsl.snapshot.is_snapshot(self.filename))
+        metamodel = xtuml.MetaModel()
+        rsl.snapshot.load(metamodel, self.filename)
+        return metamodel
+
+    def test_schema(self):
+        m = self.reload()
+        self.assertEqual(xtuml.serialize_schema(self.metamodel),
+                         xtuml.serialize_schema(m))
+        self.assertEqual(xtuml.serialize_unique_identifiers(self.metamodel),
+                         xtuml.serialize_unique_identifiers(m))
+
+    def test_instances(self):
+        m = self.reload()
+        self.assertEqual(xtuml.serialize_instances(self.metamodel),
+                         xtuml.serialize_instances(m))
+
+    def test_navigation(self):
+        m = self.reload()
+        s_sys = m.select_any('S_SYS')
+        o_objs = xtuml.navigate_many(s_sys).O_OBJ[1]()
+        self.assertEqual(['first', "it's second"],
+                         [o_obj.Name for o_obj in o_objs])
+
+        first = o_objs.first
+        second = xtuml.navigate_one(first).O_OBJ[2, 'succeeds']()
+        self.assertEqual("it's second", second.Name)
+        self.assertEqual(second.Obj_ID, first.Next_ID)
+        self.assertIs(first, xtuml.navigate_one(second).O_OBJ[2, 'precedes']())
+
+        orphan = m.select_any('O_OBJ', xtuml.where_eq(Name='orphan'))
+        self.assertIsNone(xtuml.navigate_one(orphan).S_SYS[1]())
+        self.assertIsNone(orphan.Sys_ID)
+
+    def test_modified_model(self):
+        o_obj = self.metamodel.new('O_OBJ', Name='new')
+        s_sys = self.metamodel.select_any('S_SYS')
+        xtuml.relate(o_obj, s_sys, 1)
+        xtuml.delete(self.metamodel.select_any('O_OBJ',
+                                               xtuml.where_eq(Name='first')))
+        m = self.reload()
+        self.assertEqual(xtuml.serialize_instances(self.metamodel),
+                         xtuml.serialize_instances(m))
+
+        s_sys = m.select_any('S_SYS')
+        names = [o_obj.Name for o_obj in xtuml.navigate_many(s_sys).O_OBJ[1]()]
+        self.assertEqual(["it's second", 'new'], names)
+
+    def test_sql_is_not_snapshot(self):
+        xtuml.persist_database(self.metamodel, self.filename)
+        self.assertFalse(rsl.snapshot.is_snapshot(self.filename))
+        self.assertRaises(rsl.snapshot.SnapshotException, rsl.snapshot.load,
+                          xtuml.MetaModel(), self.filename)
+
+    def test_empty_file(self):
+        self.assertFalse(rsl.snapshot.is_snapshot(self.filename))
+        self.assertRaises(rsl.snapshot.SnapshotException, rsl.snapshot.load,
+                          xtuml.MetaModel(), self.filename)
+
+    def test_unsupported_version(self):
+        rsl.snapshot.save(self.metamodel, self.filename)
+        with open(self.filename, 'r+b') as f:
+            f.seek(len(rsl.snapshot.MAGIC))
+            f.write(struct.pack('<H', rsl.snapshot.VERSION + 1))
+
+        with self.assertRaises(rsl.snapshot.SnapshotException) as cm:
+            rsl.snapshot.load(xtuml.MetaModel(), self.filename)
+
+        self.assertIn('unsupported snapshot version', str(cm.exception))
+
+    def test_truncated(self):
+        rsl.snapshot.save(self.metamodel, self.filename)
+        with open(self.filename, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filename) - 1)
+
+        self.assertRaises(rsl.snapshot.SnapshotException, rsl.snapshot.load,
+                          xtuml.MetaModel(), self.filename)
+
+
+class TestSegments(RSLTestCase):
+
+    def setUp(self):
+        RSLTestCase.setUp(self)
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        loader = xtuml.ModelLoader()
+        loader.input(SCHEMA)
+        loader.input(POPULATION)
+        rsl.snapshot.save(loader.build_metamodel(), self.filename)
+        self.segments = rsl.snapshot.load(self.metamodel, self.filename)
+
+    def tearDown(self):
+        RSLTestCase.tearDown(self)
+        os.remove(self.filename)
+
+    def save_and_reload(self):
+        rsl.snapshot.save(self.metamodel, self.filename, self.segments,
+                          self.runtime.modified)
+        m = xtuml.MetaModel()
+        rsl.snapshot.load(m, self.filename)
+        return m
+
+    def test_track_modifications(self):
+        text = '''
+        .select any s_sys from instances of S_SYS
+        .select many o_objs from instances of O_OBJ
+        .assign n = cardinality o_objs
+        .exit n
+        '''
+        self.assertEqual(3, self.eval_text(text))
+        self.assertEqual(set(), self.runtime.modified)
+
+        text = '''
+        .select any s_sys from instances of S_SYS
+        .assign s_sys.Name = "renamed"
+        '''
+        self.eval_text(text)
+        self.assertEqual(set([self.metamodel.find_metaclass('S_SYS')]),
+                         self.runtime.modified)
+
+    def test_reuse_unmodified(self):
+        text = '''
+        .select any s_sys from instances of S_SYS
+        .assign s_sys.Name = "renamed"
+        '''
+        self.eval_text(text)
+
+        # modifications made behind the back of the runtime are not noticed
+        o_obj = self.metamodel.select_any('O_OBJ')
+        o_obj.Name = 'unnoticed'
+
+        m = self.save_and_reload()
+        self.assertEqual('renamed', m.select_any('S_SYS').Name)
+        self.assertEqual('first', m.select_any('O_OBJ').Name)
+
+    def test_modified_links(self):
+        text = '''
+        .select any s_sys from instances of S_SYS
+        .select any o_obj from instances of O_OBJ where (selected.Name == "orphan")
+        .relate o_obj to s_sys across R1
+        .create object instance o_new of O_OBJ
+        .assign o_new.Name = "new"
+        '''
+        self.eval_text(text)
+        m = self.save_and_reload()
+        self.assertEqual(xtuml.serialize_instances(self.metamodel),
+                         xtuml.serialize_instances(m))
+
+        s_sys = m.select_any('S_SYS')
+        self.assertEqual(3, len(xtuml.navigate_many(s_sys).O_OBJ[1]()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -88,3 +88,38 @@ class TestSymbolTable(unittest.TestCase):
         symtab.enter_scope()
         self.assertEqual(len(symtab.scope_head.symbols), 0)
         
+
+    def test_case_insensitive(self):
+        symtab = rsl.symtab.SymbolTable()
+        symtab.enter_scope()
+        
+        symtab.install_symbol('Test', 'TEST1')
+        symtab.install_symbol('TEST', 'TEST2')
+        self.assertEqual(symtab.find_symbol('test'), 'TEST2')
+        
+        symtab.install_global('Global', 'G')
+        self.assertEqual(symtab.find_symbol('GLOBAL'), 'G')
+
+        self.assertEqual(symtab.leave_scope(), {'Test': 'TEST2'})
+
+    def test_block_shadowing(self):
+        symtab = rsl.symtab.SymbolTable()
+        symtab.enter_scope()
+        symtab.install_symbol('outer', 1)
+        
+        symtab.enter_block()
+        symtab.install_symbol('OUTER', 2)
+        symtab.install_symbol('inner', 3)
+        self.assertEqual(symtab.find_symbol('Inner'), 3)
+        symtab.leave_block()
+        
+        self.assertEqual(symtab.find_symbol('outer'), 2)
+        self.assertRaises(rsl.symtab.SymtabException, symtab.find_symbol,
+                          'inner')
+        
+        symtab.enter_block()
+        symtab.install_symbol('inner', None)
+        self.assertIsNone(symtab.find_symbol('inner'))
+        symtab.leave_block()
+        
+        self.assertEqual(symtab.leave_scope(), {'outer': 2})